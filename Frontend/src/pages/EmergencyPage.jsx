@@ -17,6 +17,8 @@ export default function EmergencyPage() {
 
     setIsSending(true);
     setMessage('');
+    // The server answers a repeat of this key (or any press within its debounce window) without re-sending
+    const idempotencyKey = crypto.randomUUID();
 
     try {
       await axios.post(
@@ -25,6 +27,7 @@ export default function EmergencyPage() {
         {
           headers: {
             'X-CSRFToken': getCSRFToken(),
+            'Idempotency-Key': idempotencyKey,
           },
         }
       );
@@ -1,3 +1,31 @@
 from django.contrib import admin
 
-# Register your models here.
+from billing.models import StripeEvent, UsageRecord, UsageReport
+
+
+@admin.register(UsageReport)
+class UsageReportAdmin(admin.ModelAdmin):
+    list_display = ("subscription_item_id", "quantity", "status", "attempts", "timestamp", "reported_at")
+    list_filter = ("status",)
+    search_fields = ("subscription_item_id", "idempotency_key", "stripe_usage_record_id")
+    readonly_fields = ("idempotency_key", "created_at", "reported_at")
+
+
+@admin.register(UsageRecord)
+class UsageRecordAdmin(admin.ModelAdmin):
+    list_display = ("user", "subscription_item_id", "quantity", "created_at", "report")
+    list_select_related = ("user", "report")
+    raw_id_fields = ("user", "report")
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = ("id", "type", "created", "status", "attempts", "processed_at")
+    list_filter = ("status", "type")
+    search_fields = ("id",)
+    readonly_fields = ("id", "type", "created", "payload", "received_at", "processed_at")
+    actions = ["retry_events"]
+
+    @admin.action(description="Retry selected events")
+    def retry_events(self, request, queryset):
+        queryset.update(status="pending", attempts=0)
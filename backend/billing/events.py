@@ -0,0 +1,203 @@
+"""
+Stripe webhook event store.
+
+The webhook view only verifies the signature and calls `store_event()`;
+`process_pending_events()` (on a background thread once the webhook has
+committed in inline mode, or from `process_stripe_events`) applies the
+stored events in `event.created` order.
+
+Events for one customer are applied strictly in order: while one of them is
+pending (being handled by another worker, or waiting for a retry) the later
+ones wait behind it. Stripe lookups that a handler needs are made before any
+row is locked, so a slow API never holds the claim transaction open.
+"""
+import logging
+import threading
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from billing.models import StripeEvent
+from billing.webhook_handlers import (
+    fetch_checkout_subscription,
+    handle_checkout_session_completed,
+    handle_subscription_created,
+    handle_subscription_updated,
+    handle_subscription_deleted,
+)
+
+logger = logging.getLogger(__name__)
+
+EVENT_HANDLERS = {
+    "checkout.session.completed": handle_checkout_session_completed,
+    "customer.subscription.created": handle_subscription_created,
+    "customer.subscription.updated": handle_subscription_updated,
+    "customer.subscription.deleted": handle_subscription_deleted,
+}
+
+# Remote data a handler needs, fetched outside the claim transaction and passed as its second argument
+EVENT_FETCHERS = {
+    "checkout.session.completed": fetch_checkout_subscription,
+}
+
+_NOT_FETCHED = object()
+
+
+def _event_object(payload):
+    obj = payload.get("data", {}).get("object", {})
+    return obj if isinstance(obj, dict) else {}
+
+
+def ordering_key(payload):
+    """Events sharing this key (the Stripe customer) are applied one at a time, in order."""
+    obj = _event_object(payload)
+    return obj.get("customer") or obj.get("subscription") or obj.get("id") or ""
+
+
+def store_event(event):
+    """
+    Persist a verified event (the decoded JSON body). One INSERT; a
+    redelivered event id is ignored.
+    """
+    StripeEvent.objects.bulk_create(
+        [
+            StripeEvent(
+                id=event["id"],
+                type=event.get("type", ""),
+                created=datetime.fromtimestamp(event.get("created", 0), tz=dt_timezone.utc),
+                payload=event,
+                ordering_key=ordering_key(event),
+            )
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def claim_events(batch_size=None):
+    """Lock the oldest pending events. Must be called inside transaction.atomic()."""
+    batch_size = batch_size or settings.STRIPE_EVENT_BATCH_SIZE
+    return list(
+        StripeEvent.objects
+        .select_for_update(skip_locked=True)
+        .filter(status="pending")
+        .order_by("created", "received_at")[:batch_size]
+    )
+
+
+def fetch_remote_data(batch_size=None):
+    """
+    Make the Stripe calls the next batch will need, before anything is
+    locked. Returns {event id: data, or the exception raised fetching it}.
+    """
+    batch_size = batch_size or settings.STRIPE_EVENT_BATCH_SIZE
+    events = (
+        StripeEvent.objects
+        .filter(status="pending", type__in=list(EVENT_FETCHERS))
+        .order_by("created", "received_at")[:batch_size]
+    )
+    fetched = {}
+    for event in events:
+        try:
+            fetched[event.id] = EVENT_FETCHERS[event.type](_event_object(event.payload))
+        except Exception as e:
+            logger.warning("⚠️ Stripe lookup for event %s (%s) failed: %s", event.id, event.type, e)
+            fetched[event.id] = e
+    return fetched
+
+
+def _blocked_keys(events):
+    """Ordering keys with an older pending event outside `events` (claimed by another worker)."""
+    first = {}
+    for event in events:
+        if event.ordering_key:
+            first.setdefault(event.ordering_key, (event.created, event.received_at))
+    if not first:
+        return set()
+    older = (
+        StripeEvent.objects
+        .filter(status="pending", ordering_key__in=list(first), created__lte=max(c for c, _ in first.values()))
+        .exclude(id__in=[event.id for event in events])
+        .values_list("ordering_key", "created", "received_at")
+    )
+    return {key for key, created, received_at in older if (created, received_at) < first[key]}
+
+
+def process_event(event, remote=_NOT_FETCHED):
+    handler = EVENT_HANDLERS.get(event.type)
+    args = (_event_object(event.payload),)
+    if event.type in EVENT_FETCHERS:
+        if remote is _NOT_FETCHED:
+            # Arrived after this round's lookups: handled next round, without using an attempt
+            return event
+        args += (remote,)
+
+    event.attempts += 1
+    event.processed_at = timezone.now()
+
+    if handler is None:
+        logger.info("⚠️ Evento não tratado: %s", event.type)
+        event.status = "ignored"
+        return event
+
+    try:
+        if isinstance(remote, Exception):
+            raise remote
+        # A savepoint per event: one bad event doesn't undo the rest of the batch
+        with transaction.atomic():
+            handler(*args)
+    except Exception as e:
+        logger.exception("❌ Stripe event %s (%s) failed", event.id, event.type)
+        event.last_error = str(e)
+        if event.attempts >= settings.STRIPE_EVENT_MAX_ATTEMPTS:
+            event.status = "failed"
+        return event
+
+    event.status = "processed"
+    event.last_error = ""
+    return event
+
+
+def process_pending_events(batch_size=None):
+    """Claim and apply one batch of events. Returns the number handled."""
+    remote = fetch_remote_data(batch_size)
+    with transaction.atomic():
+        events = claim_events(batch_size)
+        blocked = _blocked_keys(events)
+        handled = []
+        for event in events:
+            if event.ordering_key and event.ordering_key in blocked:
+                continue
+            attempts = event.attempts
+            process_event(event, remote.get(event.id, _NOT_FETCHED))
+            if event.attempts != attempts:
+                handled.append(event)
+            if event.status == "pending" and event.ordering_key:
+                # Later events for this customer wait until this one succeeds or gives up
+                blocked.add(event.ordering_key)
+        StripeEvent.objects.bulk_update(handled, ["status", "attempts", "last_error", "processed_at"])
+    return len(handled)
+
+
+def _process_in_background():
+    try:
+        process_pending_events()
+    except Exception:
+        # Whatever is still pending is picked up by the next webhook's run
+        logger.exception("❌ Background Stripe event processing failed")
+    finally:
+        connections.close_all()
+
+
+def _start_background_processing():
+    threading.Thread(target=_process_in_background, name="stripe-events", daemon=True).start()
+
+
+def process_pending_events_after_commit():
+    """
+    Inline mode: apply pending events on a daemon thread once the current
+    transaction commits, so the webhook reply never waits on Stripe lookups
+    or the claim transaction.
+    """
+    transaction.on_commit(_start_background_processing)
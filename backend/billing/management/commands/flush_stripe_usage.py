@@ -0,0 +1,43 @@
+import logging
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from billing.utils import flush_usage
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Aggregate recorded SMS usage per subscription item and report it to Stripe."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=settings.STRIPE_USAGE_FLUSH_INTERVAL)
+        parser.add_argument("--once", action="store_true", help="Flush once then exit (e.g. from cron).")
+
+    def handle(self, *args, **options):
+        self._running = True
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        while self._running:
+            close_old_connections()
+            try:
+                reports, reported, failed = flush_usage()
+                self.stdout.write(
+                    f"💳 Usage flush: {len(reports)} new reports, {reported} reported, {failed} failed"
+                )
+            except Exception:
+                logger.exception("Usage flush failed")
+
+            if options["once"]:
+                break
+            deadline = time.monotonic() + options["interval"]
+            while self._running and time.monotonic() < deadline:
+                time.sleep(1)
+
+    def _stop(self, signum, frame):
+        self._running = False
@@ -0,0 +1,46 @@
+import logging
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from billing.events import process_pending_events
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Apply stored Stripe webhook events in event.created order."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.STRIPE_EVENT_BATCH_SIZE)
+        parser.add_argument("--poll-interval", type=float, default=settings.STRIPE_EVENT_POLL_INTERVAL)
+        parser.add_argument("--once", action="store_true", help="Process pending events then exit.")
+
+    def handle(self, *args, **options):
+        self._running = True
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        batch_size = options["batch_size"]
+        self.stdout.write(f"💳 Stripe event processor started (batch={batch_size})")
+
+        while self._running:
+            close_old_connections()
+            try:
+                handled = process_pending_events(batch_size)
+            except Exception:
+                logger.exception("Stripe event batch failed")
+                handled = 0
+
+            if handled < batch_size:
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+
+        self.stdout.write("🛑 Stripe event processor stopped")
+
+    def _stop(self, signum, frame):
+        self._running = False
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.10 on 2026-10-18 15:03
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('billing', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsageReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subscription_item_id', models.CharField(max_length=100)),
+                ('quantity', models.PositiveIntegerField()),
+                ('timestamp', models.DateTimeField()),
+                ('idempotency_key', models.CharField(max_length=64, unique=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('reported', 'Reported')], db_index=True, default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('stripe_usage_record_id', models.CharField(blank=True, max_length=100)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('reported_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='subscription',
+            name='sms_subscription_item_id',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.CreateModel(
+            name='UsageRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subscription_item_id', models.CharField(max_length=100)),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('report', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='records', to='billing.usagereport')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='usage_records', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['report', 'created_at'], name='billing_usage_unreported_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.10 on 2026-10-18 15:58
+
+from django.db import migrations, models
+
+
+def backfill_ordering_key(apps, schema_editor):
+    from billing.events import ordering_key
+
+    StripeEvent = apps.get_model('billing', 'StripeEvent')
+    batch = []
+    for event in StripeEvent.objects.filter(status='pending').only('id', 'payload').iterator(chunk_size=500):
+        event.ordering_key = ordering_key(event.payload)
+        batch.append(event)
+    StripeEvent.objects.bulk_update(batch, ['ordering_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0003_stripeevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stripeevent',
+            name='ordering_key',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='stripeevent',
+            index=models.Index(fields=['ordering_key', 'status'], name='billing_event_order_idx'),
+        ),
+        migrations.RunPython(backfill_ordering_key, migrations.RunPython.noop),
+    ]
@@ -18,6 +18,91 @@ class Subscription(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     subscription_item_id = models.CharField(max_length=100, blank=True, null=True)
+    sms_subscription_item_id = models.CharField(max_length=100, blank=True, null=True)
+
+    @property
+    def usage_item_id(self):
+        # Metered SMS item when the price has one, else the plan item
+        return self.sms_subscription_item_id or self.subscription_item_id
 
     def __str__(self):
         return f"{self.email} - {self.plan} ({self.status})"
+
+
+class UsageReport(models.Model):
+    """
+    One aggregated Stripe usage call for a subscription item. The row (and
+    its idempotency key) is committed before Stripe is called, so a crashed
+    or failed flush is replayed with the same key and never double-counts.
+    """
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("reported", "Reported"),
+    ]
+
+    subscription_item_id = models.CharField(max_length=100)
+    quantity = models.PositiveIntegerField()
+    timestamp = models.DateTimeField()
+    idempotency_key = models.CharField(max_length=64, unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending", db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    stripe_usage_record_id = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    reported_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.subscription_item_id}: {self.quantity} ({self.status})"
+
+
+class UsageRecord(models.Model):
+    """A locally recorded billable SMS batch, waiting to be rolled into a UsageReport."""
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="usage_records")
+    subscription_item_id = models.CharField(max_length=100)
+    quantity = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+    report = models.ForeignKey(
+        UsageReport, on_delete=models.SET_NULL, null=True, blank=True, related_name="records"
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["report", "created_at"], name="billing_usage_unreported_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} x{self.quantity} -> {self.subscription_item_id}"
+
+
+class StripeEvent(models.Model):
+    """
+    Verified Stripe webhook, stored before it is handled. The event id is the
+    primary key, so redeliveries are dropped by the INSERT itself.
+    """
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("processed", "Processed"),
+        ("ignored", "Ignored"),
+        ("failed", "Failed"),
+    ]
+
+    id = models.CharField(max_length=255, primary_key=True)
+    type = models.CharField(max_length=100)
+    created = models.DateTimeField()
+    payload = models.JSONField()
+    # Stripe customer the event is about; see billing.events.ordering_key
+    ordering_key = models.CharField(max_length=255, blank=True, default="")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created"], name="billing_event_queue_idx"),
+            models.Index(fields=["ordering_key", "status"], name="billing_event_order_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.id} ({self.type}, {self.status})"
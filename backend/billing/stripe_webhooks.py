@@ -1,5 +1,6 @@
+import json
+import logging
 import os
-import stripe
 from django.views.decorators.csrf import csrf_exempt
 from django.http import HttpResponse
 from django.conf import settings
@@ -9,14 +10,11 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 
 from users.models import Profile
-from .webhook_handlers import (
-    handle_checkout_session_completed,
-    handle_subscription_created,
-    handle_subscription_updated,
-)
+from .events import store_event, process_pending_events_after_commit
+from services.metrics import time_external
+from services.providers import get_stripe
 
-# Configura a chave da API da Stripe
-stripe.api_key = getattr(settings, "STRIPE_SECRET_KEY", os.getenv("STRIPE_SECRET_KEY"))
+logger = logging.getLogger(__name__)
 
 
 @api_view(['POST'])
@@ -38,31 +36,34 @@ def create_checkout_session(request):
     # --- SMS metered add-on (same for both plans) ---
     sms_price = os.getenv("SMS_METERED_PRICE_ID")
 
+    stripe = get_stripe()
     try:
         if profile.stripe_customer_id:
             customer_id = profile.stripe_customer_id
         else:
-            customer = stripe.Customer.create(email=email)
+            with time_external("stripe", "customer.create"):
+                customer = stripe.Customer.create(email=email)
             customer_id = customer.id
             profile.stripe_customer_id = customer_id
             profile.save()
 
-        session = stripe.checkout.Session.create(
-            customer=customer_id,
-            payment_method_types=['card'],
-            mode='subscription',
-            line_items=[
-                {"price": access_price, "quantity": 1},  # €3 or €5 licensed
-                {"price": sms_price,    "quantity": 1},  # €0.10 per SMS metered
-            ],
-            subscription_data={'trial_period_days': 3},
-            success_url='https://resqsignal.com/',
-            cancel_url='https://resqsignal.com/cancel/',
-        )
+        with time_external("stripe", "checkout_session.create"):
+            session = stripe.checkout.Session.create(
+                customer=customer_id,
+                payment_method_types=['card'],
+                mode='subscription',
+                line_items=[
+                    {"price": access_price, "quantity": 1},  # €3 or €5 licensed
+                    {"price": sms_price,    "quantity": 1},  # €0.10 per SMS metered
+                ],
+                subscription_data={'trial_period_days': 3},
+                success_url='https://resqsignal.com/',
+                cancel_url='https://resqsignal.com/cancel/',
+            )
         return Response({'url': session.url})
 
     except Exception as e:
-        logger.error("❌ Erro no checkout:", e, exc_info=True)
+        logger.error("❌ Erro no checkout: %s", e, exc_info=True)
         return Response({'error': str(e)}, status=500)
 
 
@@ -75,11 +76,13 @@ def create_billing_portal_session(request):
     if not customer_id:
         return Response({"error": "Nenhum cliente Stripe encontrado."}, status=400)
 
+    stripe = get_stripe()
     try:
-        session = stripe.billing_portal.Session.create(
-            customer=customer_id,
-            return_url=os.getenv("BILLING_PORTAL_RETURN_URL", "https://resqsignal.com/setup")
-        )
+        with time_external("stripe", "billing_portal_session.create"):
+            session = stripe.billing_portal.Session.create(
+                customer=customer_id,
+                return_url=os.getenv("BILLING_PORTAL_RETURN_URL", "https://resqsignal.com/setup")
+            )
         return Response({"url": session.url})
     except Exception as e:
         return Response({"error": str(e)}, status=500)
@@ -89,32 +92,29 @@ def create_billing_portal_session(request):
 def stripe_webhook(request):
     payload = request.body
     sig_header = request.META.get('HTTP_STRIPE_SIGNATURE')
-    secret = os.getenv("STRIPE_WEBHOOK_SECRET")
+    secret = settings.STRIPE_WEBHOOK_SECRET
 
     if not secret:
         return HttpResponse("Missing Stripe webhook secret", status=500)
 
+    stripe = get_stripe()
     try:
-        event = stripe.Webhook.construct_event(payload, sig_header, secret)
+        stripe.WebhookSignature.verify_header(
+            payload.decode("utf-8"), sig_header, secret, stripe.Webhook.DEFAULT_TOLERANCE
+        )
+        event = json.loads(payload)
     except Exception as e:
-        print("❌ Erro ao verificar assinatura Stripe:", e)
+        logger.warning("❌ Erro ao verificar assinatura Stripe: %s", e)
         return HttpResponse(f"Webhook error: {e}", status=400)
 
-    event_type = event.get("type", "")
-    data_object = event.get("data", {}).get("object", {})
-
-    print(f"📬 Evento recebido da Stripe: {event_type}")
+    logger.info("📬 Evento recebido da Stripe: %s (%s)", event.get("type", ""), event.get("id"))
 
-    if event_type == "checkout.session.completed":
-        handle_checkout_session_completed(data_object)
+    # Stored first, so redeliveries are dropped on insert. Handling happens on a background
+    # thread after the reply in inline mode, else in `manage.py process_stripe_events`
+    # (see billing/events.py).
+    store_event(event)
 
-    elif event_type == "customer.subscription.created":
-        handle_subscription_created(data_object)
-
-    elif event_type == "customer.subscription.updated":
-        handle_subscription_updated(data_object)
-
-    else:
-        print(f"⚠️ Evento não tratado: {event_type}")
+    if settings.STRIPE_WEBHOOK_MODE == "inline":
+        process_pending_events_after_commit()
 
     return HttpResponse(status=200)
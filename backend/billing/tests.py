@@ -1,3 +1,217 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection, transaction
+from django.test import override_settings
+
+from billing import urls
+from billing.events import process_pending_events, store_event
+from billing.models import StripeEvent, Subscription, UsageRecord, UsageReport
+from billing.utils import aggregate_usage, record_usage, report_pending_usage
+from services import testing
+from services.testing import Budget, fake_stripe_object
+from users.models import User
+
+
+class BillingQueryBudgetTests(testing.QueryBudgetTestCase):
+    urlpatterns = urls.urlpatterns
+    budgets = {
+        "create-checkout": Budget(queries=2, seconds=0.3),
+        "create-checkout:new-customer": Budget(queries=5, seconds=0.3),
+        "billing-portal": Budget(queries=2, seconds=0.3),
+        "request-trial": Budget(queries=6, seconds=0.3),
+        "stripe-webhook": Budget(queries=1, seconds=0.1),
+        "stripe-webhook:duplicate": Budget(queries=1, seconds=0.1),
+        "stripe-webhook:inline": Budget(queries=1, seconds=0.1),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="erin", email="erin@example.com", password="pw")
+        profile = cls.user.profile
+        profile.stripe_customer_id = "cus_test"
+        profile.payment_method_added = True
+        profile.save()
+
+    def post_webhook(self, budget_name, event):
+        body = json.dumps(event)
+        timestamp = int(time.time())
+        signature = hmac.new(b"whsec_test", f"{timestamp}.{body}".encode(), hashlib.sha256).hexdigest()
+        return self.assertWithinBudget(
+            budget_name, "post", "/api/billing/webhook/",
+            data=body, content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=f"t={timestamp},v1={signature}",
+        )
+
+    def test_create_checkout(self):
+        self.authenticate(self.user)
+        response = self.assertWithinBudget("create-checkout", "post", "/api/billing/checkout/", data={"plan": "basic"})
+        self.assertEqual(response.json()["url"], "https://checkout.stripe.test/cs_test")
+        self.stripe_calls["Customer.create"].assert_not_called()
+
+    def test_create_checkout_new_customer(self):
+        customer = User.objects.create_user(username="frank", email="frank@example.com", password="pw")
+        self.stripe_calls["Customer.create"].return_value = fake_stripe_object(id="cus_new")
+        self.authenticate(customer)
+        self.assertWithinBudget("create-checkout:new-customer", "post", "/api/billing/checkout/", data={"plan": "premium"})
+        self.stripe_calls["Customer.create"].assert_called_once()
+
+    def test_billing_portal(self):
+        self.authenticate(self.user)
+        self.assertWithinBudget("billing-portal", "post", "/api/billing/portal/")
+
+    def test_request_trial(self):
+        self.authenticate(self.user)
+        self.assertWithinBudget("request-trial", "post", "/api/billing/trial/request/")
+
+    def test_stripe_webhook(self):
+        event = {
+            "id": "evt_test_1",
+            "type": "customer.subscription.created",
+            "created": int(time.time()),
+            "data": {"object": {
+                "id": "sub_test",
+                "customer": "cus_test",
+                "status": "active",
+                "items": {"data": []},
+            }},
+        }
+        self.post_webhook("stripe-webhook", event)
+        self.post_webhook("stripe-webhook:duplicate", event)
+        self.assertEqual(StripeEvent.objects.count(), 1)
+
+        # Handling happens after the acknowledgement, without calling Stripe
+        self.assertEqual(process_pending_events(), 1)
+        self.assertEqual(StripeEvent.objects.get().status, "processed")
+        self.stripe_calls["Subscription.retrieve"].assert_not_called()
+        self.assertFalse(Subscription.objects.exists())  # no known price ids in the payload
+
+    def event(self, event_id, event_type, customer="cus_test", created=None, **fields):
+        return {
+            "id": event_id,
+            "type": event_type,
+            "created": created or int(time.time()),
+            "data": {"object": {"customer": customer, **fields}},
+        }
+
+    def checkout_event(self, event_id="evt_checkout", created=None):
+        return self.event(event_id, "checkout.session.completed", created=created, id="cs_1", subscription="sub_test")
+
+    def premium_subscription(self):
+        return {
+            "id": "sub_test", "customer": "cus_test", "status": "active",
+            "items": {"data": [{"id": "si_plan", "price": {"id": "price_premium"}}]},
+        }
+
+    @override_settings(STRIPE_WEBHOOK_MODE="inline", STRIPE_PREMIUM_PRICE_ID="price_premium")
+    def test_stripe_webhook_inline(self):
+        self.stripe_calls["Subscription.retrieve"].return_value = self.premium_subscription()
+        with mock.patch("billing.events.threading.Thread") as thread:
+            self.post_webhook("stripe-webhook:inline", self.checkout_event())
+        # Acknowledged before any Stripe lookup: processing is handed to a thread after commit
+        self.assertEqual(StripeEvent.objects.get().status, "pending")
+        self.stripe_calls["Subscription.retrieve"].assert_not_called()
+        thread.return_value.start.assert_called_once()
+
+        # The thread closes its own connections; the test's must stay open
+        with mock.patch("billing.events.connections"):
+            thread.call_args.kwargs["target"]()
+        self.assertEqual(StripeEvent.objects.get().status, "processed")
+        self.assertEqual(Subscription.objects.get().plan, "premium")
+
+    @override_settings(STRIPE_PREMIUM_PRICE_ID="price_premium")
+    def test_stripe_lookup_outside_claim_transaction(self):
+        depths = []
+
+        def retrieve(*args, **kwargs):
+            depths.append(len(connection.atomic_blocks))
+            return self.premium_subscription()
+
+        self.stripe_calls["Subscription.retrieve"].side_effect = retrieve
+        store_event(self.checkout_event())
+        self.assertEqual(process_pending_events(), 1)
+        self.assertEqual(depths, [len(connection.atomic_blocks)])
+        self.assertEqual(Subscription.objects.get().subscription_item_id, "si_plan")
+
+    def test_stripe_events_wait_for_earlier_event_of_same_customer(self):
+        now = int(time.time())
+        store_event(self.event("evt_1", "customer.subscription.updated", created=now, id="sub_test", status="past_due"))
+        store_event(self.event("evt_2", "customer.subscription.deleted", created=now + 1, id="sub_test"))
+        store_event(self.event("evt_other", "customer.subscription.deleted", customer="cus_other", created=now + 2, id="sub_x"))
+
+        failing = mock.Mock(side_effect=RuntimeError("db hiccup"))
+        with mock.patch.dict("billing.events.EVENT_HANDLERS", {"customer.subscription.updated": failing}):
+            self.assertEqual(process_pending_events(), 2)
+        statuses = dict(StripeEvent.objects.values_list("id", "status"))
+        self.assertEqual(statuses, {"evt_1": "pending", "evt_2": "pending", "evt_other": "processed"})
+        self.assertEqual(StripeEvent.objects.get(id="evt_2").attempts, 0)
+
+        self.assertEqual(process_pending_events(), 2)
+        self.assertEqual(
+            list(StripeEvent.objects.order_by("created").values_list("status", flat=True)),
+            ["processed", "processed", "processed"],
+        )
+
+    def test_stripe_event_waits_for_event_claimed_elsewhere(self):
+        now = int(time.time())
+        store_event(self.event("evt_1", "customer.subscription.updated", created=now, id="sub_test"))
+        store_event(self.event("evt_2", "customer.subscription.deleted", created=now + 1, id="sub_test"))
+
+        # Another worker holds evt_1's row lock, so this one only gets evt_2
+        later = StripeEvent.objects.filter(id="evt_2")
+        with mock.patch("billing.events.claim_events", return_value=list(later)):
+            self.assertEqual(process_pending_events(), 0)
+        self.assertEqual(later.get().status, "pending")
+
+    def subscribe(self):
+        Subscription.objects.create(
+            user=self.user, email=self.user.email, stripe_customer_id="cus_test", stripe_subscription_id="sub_test",
+            plan="premium", status="active", subscription_item_id="si_plan", sms_subscription_item_id="si_sms",
+        )
+
+    @override_settings(STRIPE_USAGE_MODE="batch")
+    def test_usage_aggregated_per_item(self):
+        self.subscribe()
+        record_usage({self.user.id: 3})
+        record_usage({self.user.id: 2})
+        self.stripe_calls["UsageRecord.create"].assert_not_called()
+
+        reports = aggregate_usage()
+        self.assertEqual([(r.subscription_item_id, r.quantity) for r in reports], [("si_sms", 5)])
+        self.assertFalse(UsageRecord.objects.filter(report__isnull=True).exists())
+        self.assertEqual(aggregate_usage(), [])  # nothing left to roll up
+
+        self.assertEqual(report_pending_usage(), (1, 0))
+        self.stripe_calls["UsageRecord.create"].assert_called_once()
+        self.assertEqual(self.stripe_calls["UsageRecord.create"].call_args.kwargs["quantity"], 5)
+        self.assertEqual(UsageReport.objects.get().status, "reported")
+
+    @override_settings(STRIPE_USAGE_MODE="batch")
+    def test_usage_report_retried_with_same_key(self):
+        self.subscribe()
+        record_usage({self.user.id: 1})
+        aggregate_usage()
+        usage_create = self.stripe_calls["UsageRecord.create"]
+        usage_create.side_effect = [ConnectionError("stripe down"), {"id": "mbur_retry"}]
+
+        self.assertEqual(report_pending_usage(), (0, 1))
+        report = UsageReport.objects.get()
+        self.assertEqual((report.status, report.attempts, report.last_error), ("pending", 1, "stripe down"))
+
+        self.assertEqual(report_pending_usage(), (1, 0))
+        report.refresh_from_db()
+        self.assertEqual((report.status, report.attempts, report.stripe_usage_record_id), ("reported", 2, "mbur_retry"))
+        keys = [call.kwargs["idempotency_key"] for call in usage_create.call_args_list]
+        self.assertEqual(keys, [report.idempotency_key] * 2)
+
+    def test_usage_reported_inline_after_commit(self):
+        self.subscribe()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                record_usage({self.user.id: 2})
+                self.stripe_calls["UsageRecord.create"].assert_not_called()
+        self.stripe_calls["UsageRecord.create"].assert_called_once()
+        self.assertEqual(UsageReport.objects.get().status, "reported")
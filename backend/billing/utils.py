@@ -1,20 +1,127 @@
-import stripe
-import time
-from billing.models import Subscription
+import logging
+import uuid
+from collections import defaultdict
 
-def add_stripe_usage(user, quantity=1):
-    try:
-        sub = Subscription.objects.get(user=user, status="active")
-        if not sub.subscription_item_id:
-            print("❌ Missing subscription_item_id")
-            return
-
-        stripe.UsageRecord.create(
-            subscription_item=sub.subscription_item_id,
-            quantity=quantity,
-            timestamp=int(time.time()),
-            action="increment",
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from billing.models import Subscription, UsageRecord, UsageReport
+from services.metrics import time_external
+from services.providers import get_stripe
+
+logger = logging.getLogger(__name__)
+
+
+def record_usage(usage):
+    """
+    Record billable SMS sends locally; `usage` maps user_id -> quantity.
+
+    Costs one SELECT and one INSERT and never talks to Stripe, so it is safe
+    inside the delivery transaction. With STRIPE_USAGE_MODE="inline" the
+    totals are reported once that transaction commits; with "batch",
+    `flush_stripe_usage` reports them.
+    """
+    usage = {user_id: quantity for user_id, quantity in usage.items() if quantity}
+    if not usage:
+        return []
+
+    items = {}
+    for sub in Subscription.objects.filter(user_id__in=list(usage), status="active"):
+        if sub.usage_item_id:
+            items[sub.user_id] = sub.usage_item_id
+
+    records = []
+    for user_id, quantity in usage.items():
+        if user_id not in items:
+            logger.warning("❌ No active subscription item for user %s; %s SMS not billed", user_id, quantity)
+            continue
+        records.append(UsageRecord(user_id=user_id, subscription_item_id=items[user_id], quantity=quantity))
+    records = UsageRecord.objects.bulk_create(records)
+    if records and settings.STRIPE_USAGE_MODE == "inline":
+        transaction.on_commit(_flush_inline)
+    return records
+
+
+def aggregate_usage(now=None):
+    """
+    Roll every unreported UsageRecord into one pending UsageReport per
+    subscription item. Rows being aggregated by another flusher are skipped.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        records = list(
+            UsageRecord.objects
+            .select_for_update(skip_locked=True)
+            .filter(report__isnull=True)
+            .only("id", "subscription_item_id", "quantity")
         )
-        print(f"✅ Reported {quantity} usage for {user.email}")
-    except Exception as e:
-        print(f"❌ Failed to report usage: {e}")
+        totals = defaultdict(int)
+        ids = defaultdict(list)
+        for record in records:
+            totals[record.subscription_item_id] += record.quantity
+            ids[record.subscription_item_id].append(record.id)
+
+        reports = []
+        for item_id, quantity in totals.items():
+            report = UsageReport.objects.create(
+                subscription_item_id=item_id,
+                quantity=quantity,
+                timestamp=now,
+                idempotency_key=f"usage-{uuid.uuid4().hex}",
+            )
+            UsageRecord.objects.filter(id__in=ids[item_id]).update(report=report)
+            reports.append(report)
+    return reports
+
+
+def report_pending_usage():
+    """
+    Send every pending UsageReport to Stripe. Failures stay pending and are
+    retried with the same idempotency key on the next flush (Stripe keeps
+    keys for 24h, so replays older than that should be checked by hand).
+    Returns (reported, failed).
+    """
+    stripe = get_stripe()
+    reported = failed = 0
+    for report in UsageReport.objects.filter(status="pending").order_by("id"):
+        report.attempts += 1
+        try:
+            with time_external("stripe", "usage_record.create"):
+                usage_record = stripe.UsageRecord.create(
+                    subscription_item=report.subscription_item_id,
+                    quantity=report.quantity,
+                    timestamp=int(report.timestamp.timestamp()),
+                    action="increment",
+                    idempotency_key=report.idempotency_key,
+                )
+        except Exception as e:
+            report.last_error = str(e)
+            report.save(update_fields=["attempts", "last_error"])
+            logger.error("❌ Failed to report usage for %s: %s", report.subscription_item_id, e)
+            failed += 1
+            continue
+
+        report.status = "reported"
+        report.stripe_usage_record_id = usage_record.get("id", "")
+        report.last_error = ""
+        report.reported_at = timezone.now()
+        report.save(update_fields=["status", "attempts", "stripe_usage_record_id", "last_error", "reported_at"])
+        logger.info("✅ Reported %s usage for %s", report.quantity, report.subscription_item_id)
+        reported += 1
+    return reported, failed
+
+
+def flush_usage():
+    """Aggregate, then report everything pending. Returns (new reports, reported, failed)."""
+    reports = aggregate_usage()
+    reported, failed = report_pending_usage()
+    return reports, reported, failed
+
+
+def _flush_inline():
+    # Also retries earlier failures. The send it bills has already gone out, so never raise.
+    try:
+        flush_usage()
+    except Exception:
+        logger.exception("❌ Inline usage flush failed")
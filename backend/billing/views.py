@@ -1,6 +1,4 @@
 import os
-import stripe
-from django.conf import settings
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -8,8 +6,8 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import api_view, permission_classes
 
 from users.models import Profile
-
-stripe.api_key = getattr(settings, "STRIPE_SECRET_KEY", os.getenv("STRIPE_SECRET_KEY"))
+from services.metrics import time_external
+from services.providers import get_stripe
 
 
 class BillingPortalView(APIView):
@@ -20,10 +18,11 @@ class BillingPortalView(APIView):
         if not customer_id:
             return Response({"error": "Stripe customer not found."}, status=400)
 
-        session = stripe.billing_portal.Session.create(
-            customer=customer_id,
-            return_url=os.getenv("BILLING_PORTAL_RETURN_URL", "https://resqsignal.com/setup")
-        )
+        with time_external("stripe", "billing_portal_session.create"):
+            session = get_stripe().billing_portal.Session.create(
+                customer=customer_id,
+                return_url=os.getenv("BILLING_PORTAL_RETURN_URL", "https://resqsignal.com/setup")
+            )
         return Response({"url": session.url})
 
 
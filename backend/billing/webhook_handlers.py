@@ -1,36 +1,19 @@
+import logging
 import os
-import stripe
 from django.conf import settings
 from billing.models import Subscription
 from users.models import Profile
+from services.metrics import time_external
+from services.providers import get_stripe
 
-stripe.api_key = getattr(settings, "STRIPE_SECRET_KEY", os.getenv("STRIPE_SECRET_KEY"))
+logger = logging.getLogger(__name__)
 
-def handle_checkout_session_completed(session):
-    """
-    Stripe webhook handler for checkout.session.completed
-    Creates / updates Subscription record with:
-      - licensed plan (basic or premium)
-      - metered SMS add-on item id
-    """
-    customer_id = session.get('customer')
-    subscription_id = session.get('subscription')
+# Stripe's trial is our "active" (access and metering follow the local trial)
+LOCAL_STATUS = {"trialing": "active"}
 
-    if not customer_id or not subscription_id:
-        print("❌ Missing customer_id or subscription_id")
-        return
 
-    try:
-        # Fetch full subscription with line_items expanded
-        subscription_data = stripe.Subscription.retrieve(
-            subscription_id,
-            expand=['items.data.price']
-        )
-    except Exception as e:
-        print(f"❌ Error retrieving subscription: {e}")
-        return
-
-    # Map price IDs to plans
+def _plan_items(items):
+    """Map subscription items to (plan, licensed item id, metered SMS item id)."""
     basic_price_id = getattr(settings, "STRIPE_BASIC_PRICE_ID", os.getenv("STRIPE_BASIC_PRICE_ID"))
     premium_price_id = getattr(settings, "STRIPE_PREMIUM_PRICE_ID", os.getenv("STRIPE_PREMIUM_PRICE_ID"))
     sms_price_id = getattr(settings, "STRIPE_SMS_METERED_PRICE_ID", os.getenv("STRIPE_SMS_METERED_PRICE_ID"))
@@ -39,7 +22,7 @@ def handle_checkout_session_completed(session):
     access_item_id = None
     sms_item_id = None
 
-    for item in subscription_data['items']['data']:
+    for item in items:
         price_id = item['price']['id']
         if price_id == basic_price_id:
             plan = "basic"
@@ -50,51 +33,140 @@ def handle_checkout_session_completed(session):
         elif price_id == sms_price_id:
             sms_item_id = item['id']
 
+    return plan, access_item_id, sms_item_id
+
+
+def save_subscription(subscription, email=None):
+    """
+    Create / update the local Subscription from a Stripe subscription object
+    (as delivered in customer.subscription.* payloads). No API calls.
+    """
+    customer_id = subscription.get('customer')
+    subscription_id = subscription.get('id')
+
+    plan, access_item_id, sms_item_id = _plan_items(subscription.get('items', {}).get('data', []))
     if plan == "unknown":
-        print(f"⚠️ Unknown price IDs in subscription {subscription_id}")
-        return
+        logger.warning("⚠️ Unknown price IDs in subscription %s", subscription_id)
+        return None
 
-    try:
-        customer = stripe.Customer.retrieve(customer_id)
-        customer_email = customer.email
-    except Exception as e:
-        print(f"⚠️ Could not fetch customer email: {e}")
-        customer_email = None
+    profile = Profile.objects.select_related("user").filter(stripe_customer_id=customer_id).first()
+    if profile is None:
+        logger.error("❌ Profile not found for customer %s", customer_id)
+        return None
+
+    status = subscription.get('status') or "active"
+    sub, _ = Subscription.objects.update_or_create(
+        stripe_customer_id=customer_id,
+        defaults={
+            "user": profile.user,
+            "email": email or profile.user.email,
+            "stripe_subscription_id": subscription_id,
+            "plan": plan,
+            "status": LOCAL_STATUS.get(status, status),
+            "subscription_item_id": access_item_id,   # licensed plan item
+            "sms_subscription_item_id": sms_item_id,  # metered SMS item (nullable)
+        }
+    )
+    logger.info("✅ Subscription %s saved for user %s (%s)", subscription_id, profile.user_id, plan)
+    return sub
+
+
+def fetch_checkout_subscription(session):
+    """
+    Stripe lookup for checkout.session.completed, made before the event is
+    claimed (see billing.events). The subscription's items normally arrive
+    first in customer.subscription.created; Stripe is only queried when that
+    event has not been processed yet. Returns None when nothing is needed.
+    """
+    subscription_id = session.get('subscription')
+    if not subscription_id:
+        return None
+    existing = Subscription.objects.filter(stripe_subscription_id=subscription_id).first()
+    if existing is not None and existing.subscription_item_id:
+        return None
+
+    with time_external("stripe", "subscription.retrieve"):
+        return get_stripe().Subscription.retrieve(
+            subscription_id,
+            expand=['items.data.price']
+        )
+
+
+def handle_checkout_session_completed(session, subscription_data=None):
+    """
+    Stripe webhook handler for checkout.session.completed
+    Marks the payment method, starts the trial and makes sure the
+    Subscription record exists, from `subscription_data` as fetched by
+    fetch_checkout_subscription(). Makes no API calls.
+    """
+    customer_id = session.get('customer')
+    subscription_id = session.get('subscription')
+
+    if not customer_id or not subscription_id:
+        logger.error("❌ Checkout session %s without customer or subscription", session.get("id"))
+        return
 
     try:
-        profile = Profile.objects.get(stripe_customer_id=customer_id)
+        profile = Profile.objects.select_related("user").get(stripe_customer_id=customer_id)
         user = profile.user
     except Profile.DoesNotExist:
-        print(f"❌ Profile not found for customer {customer_id}")
+        logger.error("❌ Profile not found for customer %s", customer_id)
         return
 
     profile.payment_method_added = True
     if not profile.has_used_trial and not profile.trial_start:
         profile.start_trial()
-        print(f"🚀 Trial activated for {user.username}")
+        logger.info("🚀 Trial activated for user %s", user.pk)
     profile.save()
 
-    Subscription.objects.update_or_create(
-        stripe_customer_id=customer_id,
-        defaults={
-            "user": user,
-            "email": customer_email,
-            "stripe_subscription_id": subscription_id,
-            "plan": plan,
-            "status": "active",
-            "subscription_item_id": access_item_id,   # licensed plan item
-            "sms_subscription_item_id": sms_item_id,  # metered SMS item (nullable)
-        }
-    )
+    customer_email = (session.get('customer_details') or {}).get('email') or session.get('customer_email')
+
+    existing = Subscription.objects.filter(stripe_subscription_id=subscription_id).first()
+    if existing is not None and existing.subscription_item_id:
+        if customer_email and existing.email != customer_email:
+            existing.email = customer_email
+            existing.save(update_fields=["email", "updated_at"])
+        return
 
-    print(f"✅ Subscription saved for {customer_email or 'no email'} ({plan})")
+    if subscription_data is None:
+        logger.error("❌ Subscription %s was not fetched before handling checkout", subscription_id)
+        raise ValueError(f"Subscription {subscription_id} not fetched")
+
+    save_subscription(subscription_data, email=customer_email)
 
 
 def handle_subscription_created(subscription):
     sub_id = subscription.get('id', 'desconhecido')
-    print(f"📦 Subscrição criada: {sub_id}")
+    logger.info("📦 Subscrição criada: %s", sub_id)
+    save_subscription(subscription)
 
 
 def handle_subscription_updated(subscription):
     sub_id = subscription.get('id', 'desconhecido')
-    print(f"🔄 Subscrição atualizada: {sub_id}")
+    status = subscription.get('status')
+    logger.info("🔄 Subscrição atualizada: %s (%s)", sub_id, status)
+
+    # Plan changes (upgrade / downgrade) come with the new items
+    if not Subscription.objects.filter(stripe_subscription_id=sub_id).exists():
+        save_subscription(subscription)
+        return
+
+    plan, access_item_id, sms_item_id = _plan_items(subscription.get('items', {}).get('data', []))
+    # save() (not update()) so the entitlement signals see the new state
+    for sub in Subscription.objects.filter(stripe_subscription_id=sub_id):
+        if status:
+            sub.status = LOCAL_STATUS.get(status, status)
+        if plan != "unknown":
+            sub.plan = plan
+            sub.subscription_item_id = access_item_id
+            sub.sms_subscription_item_id = sms_item_id
+        sub.save()
+
+
+def handle_subscription_deleted(subscription):
+    sub_id = subscription.get('id', 'desconhecido')
+    logger.info("🗑️ Subscrição cancelada: %s", sub_id)
+
+    for sub in Subscription.objects.filter(stripe_subscription_id=sub_id):
+        sub.status = "canceled"
+        sub.save(update_fields=["status", "updated_at"])
@@ -1,14 +1,133 @@
-from django.contrib import admin
-from .models import Contact, EmergencyAlert
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from .contact_import import (
+    MAX_FILE_BYTES, ContactImportError, ContactLimitExceeded, decode, detect_format, import_contacts, parse_contacts,
+)
+from .models import Contact, EmergencyAlert, LocationFix, AlertDelivery, AlertDeliveryJob
+
+User = get_user_model()
+
+
+class ContactImportForm(forms.Form):
+    file = forms.FileField(help_text="CSV (with a header row), vCard (.vcf) or JSON list of contacts.")
+    user = forms.CharField(
+        required=False,
+        help_text="Username or email to import everything into. Leave empty to use the file's user/email column.",
+    )
+    region = forms.CharField(
+        max_length=2, initial=settings.CONTACT_IMPORT_DEFAULT_REGION,
+        help_text="Country for numbers written without +country code.",
+    )
+    enforce_limit = forms.BooleanField(required=False, initial=True, label="Enforce each user's plan contact limit")
+
+    def clean_file(self):
+        upload = self.cleaned_data["file"]
+        if upload.size > MAX_FILE_BYTES:
+            raise forms.ValidationError(f"Files are limited to {MAX_FILE_BYTES // 1024} KB.")
+        try:
+            return parse_contacts(decode(upload.read()), detect_format(upload.name, upload.content_type))
+        except ContactImportError as e:
+            raise forms.ValidationError(str(e))
+
+    def clean_user(self):
+        value = self.cleaned_data["user"].strip()
+        if not value:
+            return None
+        user = User.objects.filter(Q(username=value) | Q(email__iexact=value)).first()
+        if user is None:
+            raise forms.ValidationError("No such user.")
+        return user
+
 
 @admin.register(Contact)
 class ContactAdmin(admin.ModelAdmin):
     list_display = ("name", "phone_number", "user", "relationship")
     list_filter = ("user",)
     search_fields = ("name", "phone_number", "user__username")
+    change_list_template = "admin/emergency/contact/change_list.html"
+
+    def get_urls(self):
+        return [
+            path("import/", self.admin_site.admin_view(self.import_view), name="emergency_contact_import"),
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        """Bulk-load contacts for one user, or for many (onboarding an organization) via a user column."""
+        if not self.has_add_permission(request):
+            return redirect("admin:emergency_contact_changelist")
+
+        form = ContactImportForm(request.POST or None, request.FILES or None)
+        if request.method == "POST" and form.is_valid():
+            self.import_records(request, form.cleaned_data)
+            return redirect("admin:emergency_contact_changelist")
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Import contacts",
+            "form": form,
+        }
+        return TemplateResponse(request, "admin/emergency/contact/import.html", context)
+
+    def import_records(self, request, data):
+        records = data["file"]
+        if data["user"] is not None:
+            by_user = {data["user"]: records}
+        else:
+            keys = {record["user"] for record in records if record.get("user")}
+            users = User.objects.filter(Q(username__in=keys) | Q(email__in=keys))
+            lookup = {key: user for user in users for key in (user.username, user.email) if key}
+            by_user = {}
+            for record in records:
+                user = lookup.get(record.get("user"))
+                if user is None:
+                    messages.error(request, f"Row {record['row']}: unknown or missing user {record.get('user', '')!r}.")
+                    continue
+                by_user.setdefault(user, []).append(record)
+
+        for user, user_records in by_user.items():
+            try:
+                result = import_contacts(
+                    user, user_records, region=data["region"], enforce_limit=data["enforce_limit"],
+                )
+            except (ContactImportError, ContactLimitExceeded) as e:
+                messages.error(request, f"{user}: {e}")
+                continue
+            level = messages.WARNING if result.errors or result.duplicates else messages.SUCCESS
+            summary = f"{user}: {len(result.created)} imported, {len(result.duplicates)} duplicates skipped"
+            if result.errors:
+                rows = sorted({error["row"] for error in result.errors})
+                summary += f", invalid rows {', '.join(map(str, rows))}"
+            messages.add_message(request, level, summary)
 
 @admin.register(EmergencyAlert)
 class EmergencyAlertAdmin(admin.ModelAdmin):
     list_display = ("user", "created_at", "message")
     list_filter = ("user",)
     search_fields = ("user__username", "message")
+
+
+@admin.register(LocationFix)
+class LocationFixAdmin(admin.ModelAdmin):
+    list_display = ("alert", "latitude", "longitude", "accuracy", "recorded_at")
+    raw_id_fields = ("alert",)
+
+@admin.register(AlertDelivery)
+class AlertDeliveryAdmin(admin.ModelAdmin):
+    list_display = ("alert", "contact", "to_number", "status", "error_code", "updated_at")
+    list_filter = ("status",)
+    search_fields = ("to_number", "provider_sid")
+    raw_id_fields = ("alert", "contact")
+
+@admin.register(AlertDeliveryJob)
+class AlertDeliveryJobAdmin(admin.ModelAdmin):
+    list_display = ("alert", "to_number", "status", "attempts", "available_at", "processed_at")
+    list_filter = ("status",)
+    search_fields = ("to_number", "provider_sid")
+    raw_id_fields = ("alert", "contact")
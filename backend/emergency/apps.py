@@ -3,3 +3,6 @@ from django.apps import AppConfig
 class EmergencyConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "emergency"
+
+    def ready(self):
+        import emergency.checks
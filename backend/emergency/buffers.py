@@ -0,0 +1,243 @@
+import atexit
+import itertools
+import logging
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from billing.utils import record_usage
+from emergency.models import AlertDelivery, AlertDeliveryJob, LocationFix
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBuffer:
+    """
+    Per-process write-behind buffer.
+
+    Items are merged by key and handed to `write()` in one batch once
+    `max_items` are pending or the oldest item is `max_age` seconds old,
+    whichever comes first. The size trigger flushes on the caller's thread;
+    the age trigger flushes from a short-lived timer thread.
+    """
+
+    def __init__(self, max_items, max_age):
+        self.max_items = max_items
+        self.max_age = max_age
+        self._items = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+        atexit.register(self.flush)
+
+    def merge(self, current, new):
+        return new
+
+    def write(self, items):
+        raise NotImplementedError
+
+    def _put(self, key, item):
+        """Store `item`; returns True when the buffer is full and must be flushed."""
+        with self._lock:
+            self._items[key] = self.merge(self._items.get(key), item)
+            full = len(self._items) >= self.max_items
+            if not full:
+                self._schedule()
+        return full
+
+    def add(self, key, item):
+        if self._put(key, item):
+            self.flush()
+
+    async def aadd(self, key, item):
+        # A size-triggered flush writes to the DB; keep it off the event loop.
+        if self._put(key, item):
+            await sync_to_async(self.flush)()
+
+    def requeue(self, key, item):
+        """Put back an item `write()` could not handle yet, without overriding newer data."""
+        with self._lock:
+            self._items.setdefault(key, item)
+            self._schedule()
+
+    def _schedule(self):
+        # Caller holds self._lock.
+        if self._timer is None:
+            self._timer = threading.Timer(self.max_age, self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def __len__(self):
+        return len(self._items)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                items, self._items = self._items, {}
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not items:
+                return 0
+            try:
+                self.write(items)
+            except Exception:
+                logger.exception("%s flush of %d items failed", type(self).__name__, len(items))
+            return len(items)
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        finally:
+            close_old_connections()
+
+
+class DeliveryStatusBuffer(WriteBuffer):
+    """
+    Coalesces Twilio status callbacks by MessageSid so a burst of
+    queued -> sent -> delivered updates costs one SELECT and one bulk_update
+    per flush instead of one UPDATE per callback.
+
+    Callbacks are matched by sid only. A send that outlived its dispatch
+    deadline gets its sid from late_send_buffer, so its callbacks are kept
+    (see MAX_UNMATCHED_FLUSHES) until then.
+    """
+
+    # Callbacks can beat the worker's commit of provider_sid; keep unmatched
+    # sids for a few flushes before giving up on them.
+    MAX_UNMATCHED_FLUSHES = 3
+
+    def merge(self, current, new):
+        if current is None:
+            return new
+        if AlertDelivery.STATUS_RANK[new["status"]] >= AlertDelivery.STATUS_RANK[current["status"]]:
+            new["misses"] = current["misses"]
+            return new
+        return current
+
+    def add_status(self, sid, status, error_code=""):
+        self.add(sid, {"status": status, "error_code": error_code or "", "misses": 0})
+
+    def write(self, items):
+        now = timezone.now()
+        deliveries = list(AlertDelivery.objects.filter(provider_sid__in=list(items)))
+        changed = []
+        for delivery in deliveries:
+            update = items.pop(delivery.provider_sid)
+            if AlertDelivery.STATUS_RANK[update["status"]] < AlertDelivery.STATUS_RANK[delivery.status]:
+                continue
+            delivery.status = update["status"]
+            delivery.error_code = update["error_code"]
+            delivery.updated_at = now
+            changed.append(delivery)
+
+        AlertDelivery.objects.bulk_update(changed, ["status", "error_code", "updated_at"], batch_size=500)
+
+        for sid, update in items.items():
+            update["misses"] += 1
+            if update["misses"] < self.MAX_UNMATCHED_FLUSHES:
+                self.requeue(sid, update)
+            else:
+                logger.warning("Dropping status callback for unknown message %s", sid)
+
+
+class LateSendBuffer(WriteBuffer):
+    """
+    Outcomes of sends that finished after their dispatch deadline (see
+    emergency.dispatch), keyed by outbox job id. Writes the provider sid
+    the job and its delivery were missing, so their status callbacks match
+    by sid, and settles "unknown" jobs as sent (billed) or failed.
+    """
+
+    # The send can finish before record_results() commits the job as unknown
+    MAX_EARLY_FLUSHES = 3
+
+    def add_result(self, job_id, result):
+        self.add(job_id, {"sid": result.sid or "", "ok": result.ok, "error": result.error or "", "misses": 0})
+
+    def write(self, items):
+        now = timezone.now()
+        jobs, deliveries = [], []
+        usage = defaultdict(int)
+        for job in AlertDeliveryJob.objects.filter(pk__in=list(items)).select_related("delivery", "alert"):
+            update = items[job.pk]
+            if job.status == "sending":
+                update["misses"] += 1
+                if update["misses"] < self.MAX_EARLY_FLUSHES:
+                    self.requeue(job.pk, update)
+                continue
+
+            job.provider_sid = update["sid"]
+            if job.status == "unknown":
+                job.status = "sent" if update["ok"] else "failed"
+                job.last_error = update["error"]
+                job.processed_at = now
+                if job.status == "sent" and job.billable:
+                    usage[job.alert.user_id] += 1
+                logger.info("❔ Delivery job %s settled after its deadline: %s", job.pk, job.status,
+                            extra={"alert_id": job.alert_id})
+            jobs.append(job)
+
+            delivery = job.delivery
+            if delivery is not None:
+                delivery.provider_sid = job.provider_sid
+                if delivery.status == "unknown":
+                    delivery.status = job.status
+                delivery.updated_at = now
+                deliveries.append(delivery)
+
+        with transaction.atomic():
+            AlertDeliveryJob.objects.bulk_update(jobs, ["provider_sid", "status", "last_error", "processed_at"])
+            AlertDelivery.objects.bulk_update(deliveries, ["provider_sid", "status", "updated_at"])
+            record_usage(usage)
+
+
+class LocationFixBuffer(WriteBuffer):
+    """
+    Collects GPS fixes from continuous tracking and stores them with one
+    bulk_create per flush instead of one INSERT per watchPosition tick.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._keys = itertools.count()
+
+    def _fix(self, alert_id, latitude, longitude, accuracy, recorded_at):
+        return LocationFix(
+            alert_id=alert_id,
+            latitude=latitude,
+            longitude=longitude,
+            accuracy=accuracy,
+            recorded_at=recorded_at or timezone.now(),
+        )
+
+    def add_fix(self, alert_id, latitude, longitude, accuracy=None, recorded_at=None):
+        self.add(next(self._keys), self._fix(alert_id, latitude, longitude, accuracy, recorded_at))
+
+    async def aadd_fix(self, alert_id, latitude, longitude, accuracy=None, recorded_at=None):
+        await self.aadd(next(self._keys), self._fix(alert_id, latitude, longitude, accuracy, recorded_at))
+
+    def write(self, items):
+        LocationFix.objects.bulk_create(items.values(), batch_size=500)
+
+
+delivery_status_buffer = DeliveryStatusBuffer(
+    max_items=settings.SMS_STATUS_FLUSH_SIZE,
+    max_age=settings.SMS_STATUS_FLUSH_INTERVAL,
+)
+
+late_send_buffer = LateSendBuffer(
+    max_items=settings.SMS_STATUS_FLUSH_SIZE,
+    max_age=settings.SMS_STATUS_FLUSH_INTERVAL,
+)
+
+location_fix_buffer = LocationFixBuffer(
+    max_items=settings.LOCATION_FLUSH_SIZE,
+    max_age=settings.LOCATION_FLUSH_INTERVAL,
+)
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+from services.caching import is_process_local
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Public throttling (services/throttle.py) and repeat-alert claims
+    (emergency/idempotency.py) are only enforced across workers through a
+    shared cache. With a per-process one each worker counts on its own, so
+    limits multiply and duplicate alerts get through.
+    """
+    if settings.DEBUG or not is_process_local():
+        return []
+    return [
+        Error(
+            "The default cache is private to each process.",
+            hint="Set REDIS_URL: public throttling and alert deduplication need a cache shared by every worker.",
+            id="emergency.E001",
+        )
+    ]
+
+
+@register(Tags.security, deploy=True)
+def check_metrics_token(app_configs, **kwargs):
+    """
+    /metrics (services/metrics.py) exposes alert volumes and provider
+    latencies; without METRICS_AUTH_TOKEN it refuses every scrape outside
+    DEBUG, so a deploy without one has no metrics at all.
+    """
+    if settings.DEBUG or settings.METRICS_AUTH_TOKEN:
+        return []
+    return [
+        Error(
+            "METRICS_AUTH_TOKEN is not set.",
+            hint="Set METRICS_AUTH_TOKEN and scrape /metrics with \"Authorization: Bearer <token>\".",
+            id="emergency.E002",
+        )
+    ]
@@ -0,0 +1,233 @@
+"""
+Bulk contact import from CSV, vCard or JSON.
+
+Every number is parsed and normalized to E.164 in one pass. One query then
+loads the user's existing numbers, which serves both as the duplicate check
+and as the count for the plan limit. New rows go in with a single
+bulk_create. Used by the `contacts/import/` endpoint and by the Contact
+admin's import page.
+
+bulk_create sends no post_save. That means the Contact signals in
+users/signals.py never fire, so the user's public token snapshot (with
+its contact_count) is dropped here once the import commits.
+"""
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from emergency.models import Contact
+from services.phones import parse_phone
+from users.entitlements import get_entitlement
+from users.resolver import invalidate_user
+
+FORMATS = ("csv", "vcard", "json")
+MAX_FILE_BYTES = 1024 * 1024
+
+# Accepted header / key spellings for each field
+_ALIASES = {
+    "name": ("name", "full name", "fn", "nome"),
+    "phone_number": ("phone_number", "phone", "number", "mobile", "tel", "telefone", "telemóvel"),
+    "relationship": ("relationship", "relation", "relação"),
+    "user": ("user", "username", "email"),
+}
+_KEYS = {alias: key for key, aliases in _ALIASES.items() for alias in aliases}
+
+_NAME_MAX = Contact._meta.get_field("name").max_length
+_RELATIONSHIP_MAX = Contact._meta.get_field("relationship").max_length
+
+
+class ContactImportError(Exception):
+    """The file can't be imported at all (unknown format, unreadable, too many rows)."""
+
+
+class ContactLimitExceeded(Exception):
+    def __init__(self, limit, plan):
+        # Same code the single-contact endpoint uses, so the frontend shows the same upsell
+        super().__init__(f"CONTACT_LIMIT_REACHED::{limit}::{plan}")
+
+
+@dataclass
+class ImportResult:
+    created: list = field(default_factory=list)
+    duplicates: list = field(default_factory=list)  # row numbers already in the contacts or repeated in the file
+    errors: list = field(default_factory=list)  # {"row", "field", "message"}
+
+    def as_dict(self):
+        return {"created": len(self.created), "duplicates": self.duplicates, "errors": self.errors}
+
+
+def detect_format(filename="", content_type=""):
+    name = filename.lower()
+    if name.endswith((".vcf", ".vcard")) or "vcard" in content_type:
+        return "vcard"
+    if name.endswith(".json") or content_type.endswith("json"):
+        return "json"
+    if name.endswith((".csv", ".txt")) or content_type in ("text/csv", "text/plain"):
+        return "csv"
+    raise ContactImportError("Unknown file type. Upload a .csv, .vcf or .json file.")
+
+
+def decode(raw):
+    """Uploaded bytes to text; spreadsheet exports are often not UTF-8."""
+    try:
+        return raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return raw.decode("cp1252", errors="replace")
+
+
+def _record(mapping):
+    record = {}
+    for key, value in mapping.items():
+        field_name = _KEYS.get(str(key).strip().lower())
+        if field_name and value not in (None, "") and field_name not in record:
+            record[field_name] = str(value).strip()
+    return record
+
+
+def parse_csv(text):
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(io.StringIO(text), dialect=dialect)
+    if not reader.fieldnames or not any(_KEYS.get(name.strip().lower()) == "phone_number" for name in reader.fieldnames):
+        raise ContactImportError("The CSV needs a header row with a phone column.")
+    return [_record(row) for row in reader]
+
+
+def _vcard_unescape(value):
+    return value.replace("\\n", " ").replace("\\,", ",").replace("\\;", ";").replace("\\\\", "\\").strip()
+
+
+def parse_vcard(text):
+    # Folded lines continue with a leading space or tab (RFC 6350 §3.2)
+    lines = []
+    for line in text.splitlines():
+        if line[:1] in (" ", "\t") and lines:
+            lines[-1] += line[1:]
+        elif line.strip():
+            lines.append(line.strip())
+
+    records = []
+    card = None
+    for line in lines:
+        prop, _, value = line.partition(":")
+        name, *params = prop.split(";")
+        name = name.split(".")[-1].upper()  # drop "item1." grouping prefixes
+        if name == "BEGIN" and value.upper() == "VCARD":
+            card = {"tels": []}
+        elif card is None:
+            continue
+        elif name == "END":
+            tels = sorted(card.pop("tels"), key=lambda tel: not tel[0])  # mobile numbers first
+            if tels:
+                card["phone_number"] = tels[0][1]
+            records.append(card)
+            card = None
+        elif name == "FN":
+            card["name"] = _vcard_unescape(value)
+        elif name == "N" and "name" not in card:
+            last, first = (value.split(";") + [""])[:2]  # N:Last;First;Middle;Prefix;Suffix
+            card["name"] = _vcard_unescape(f"{first} {last}")
+        elif name == "TEL":
+            is_mobile = any("CELL" in param.upper() for param in params)
+            card["tels"].append((is_mobile, _vcard_unescape(value.removeprefix("tel:"))))
+    if not records:
+        raise ContactImportError("No vCards found in the file.")
+    return records
+
+
+def parse_json(data):
+    if isinstance(data, (str, bytes)):
+        try:
+            data = json.loads(data)
+        except ValueError:
+            raise ContactImportError("The file is not valid JSON.")
+    if isinstance(data, dict):
+        data = data.get("contacts")
+    if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+        raise ContactImportError('Send a list of contacts, e.g. [{"name": "...", "phone_number": "+351..."}].')
+    return [_record(item) for item in data]
+
+
+def parse_contacts(data, fmt):
+    """Records ({"row", "name", "phone_number", "relationship", "user"}, all but row optional) in file order."""
+    parser = {"csv": parse_csv, "vcard": parse_vcard, "json": parse_json}.get(fmt)
+    if parser is None:
+        raise ContactImportError(f"Unknown format. Use one of: {', '.join(FORMATS)}.")
+    records = parser(data)
+    if len(records) > settings.CONTACT_IMPORT_MAX_ROWS:
+        raise ContactImportError(f"Import at most {settings.CONTACT_IMPORT_MAX_ROWS} contacts at a time.")
+    for row, record in enumerate(records, start=1):
+        record["row"] = row  # kept for error reports when records are split up by user
+    return records
+
+
+def normalize_number(raw, region=None):
+    """(E.164, region), or None when the number isn't valid. Numbers without +country use `region`."""
+    return parse_phone(raw, region or settings.CONTACT_IMPORT_DEFAULT_REGION)
+
+
+def import_contacts(user, records, region=None, enforce_limit=True):
+    """
+    Create `user`'s contacts from parsed records.
+
+    Invalid rows and numbers the user already has are reported and skipped.
+    If the remaining rows would take the user past their plan's contact
+    limit, nothing is imported and ContactLimitExceeded is raised.
+    """
+    result = ImportResult()
+    existing = set(Contact.objects.filter(user=user).values_list("phone_e164", flat=True))
+    seen = set(existing)
+
+    new = []
+    for index, record in enumerate(records, start=1):
+        row = record.get("row", index)
+        parsed = normalize_number(record.get("phone_number"), region)
+        name = record.get("name", "")
+        relationship = record.get("relationship", "")
+
+        errors = []
+        if parsed is None:
+            errors.append(("phone_number", "Not a valid phone number."))
+        if not name:
+            errors.append(("name", "A name is required."))
+        elif len(name) > _NAME_MAX:
+            errors.append(("name", f"At most {_NAME_MAX} characters."))
+        if len(relationship) > _RELATIONSHIP_MAX:
+            errors.append(("relationship", f"At most {_RELATIONSHIP_MAX} characters."))
+        if errors:
+            result.errors += [{"row": row, "field": field_name, "message": message} for field_name, message in errors]
+            continue
+
+        number, number_region = parsed
+        if number in seen:
+            result.duplicates.append(row)
+            continue
+        seen.add(number)
+        # bulk_create skips save(), so the canonical columns are set here
+        new.append(Contact(
+            user=user, name=name, relationship=relationship,
+            phone_number=number, phone_e164=number, phone_region=number_region,
+        ))
+
+    if enforce_limit and new:
+        entitlement = get_entitlement(user)
+        limit = entitlement.contact_limit if entitlement.has_access() else 0
+        if len(existing) + len(new) > limit:
+            raise ContactLimitExceeded(limit, entitlement.effective_plan())
+
+    if new:
+        user_id = user.pk
+        try:
+            with transaction.atomic():
+                result.created = Contact.objects.bulk_create(new)
+                transaction.on_commit(lambda: invalidate_user(user_id))
+        except IntegrityError:
+            # A number was added by another request since we read the existing ones
+            raise ContactImportError("Your contacts changed during the import. Please try again.")
+    return result
@@ -0,0 +1,171 @@
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from emergency.utils import asend_sms, send_sms, default_alert_message
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+@dataclass
+class DeliveryResult:
+    to: str
+    # "sent" | "failed" | "unknown": still in flight at the deadline, so it may yet be delivered
+    status: str
+    sid: Optional[str] = None
+    error: Optional[str] = None
+    contact_id: Optional[int] = None
+
+    @property
+    def ok(self):
+        return self.status == "sent"
+
+    def as_dict(self):
+        return {
+            "contact_id": self.contact_id,
+            "status": self.status,
+            "sid": self.sid,
+            "error": self.error,
+        }
+
+
+def _get_executor():
+    """
+    One bounded pool per process. Rebuilt after a fork so gunicorn workers
+    never share (dead) threads inherited from the master.
+    """
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _executor_lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.ALERT_DISPATCH_MAX_WORKERS,
+                    thread_name_prefix="alert-dispatch",
+                )
+                _executor_pid = pid
+    return _executor
+
+
+def dispatch_messages(messages, deadline=None, on_late=None):
+    """
+    Send every `(to, body)` pair exactly once, concurrently.
+
+    No DB access happens in the pool threads. Returns one DeliveryResult per
+    message, in input order. A send still running when `deadline` seconds
+    elapse can't be stopped (the request may already be with the provider),
+    so it is reported as "unknown" rather than failed: callers must not
+    resend it blindly. When it does finish, `on_late(index, result)` is
+    called with its final DeliveryResult (and sid), from the pool thread.
+    """
+    messages = list(messages)
+    if not messages:
+        return []
+
+    if deadline is None:
+        deadline = settings.ALERT_DISPATCH_DEADLINE
+
+    executor = _get_executor()
+    # Retries inside the gateway stop backing off once this absolute deadline nears.
+    deadline_at = time.monotonic() + deadline
+    # Each send runs in a copy of this context so its log records keep the request / alert id.
+    futures = [
+        executor.submit(contextvars.copy_context().run, send_sms, to, body, deadline_at)
+        for to, body in messages
+    ]
+    wait(futures, timeout=deadline)
+    return _collect_results(messages, futures, deadline, on_late)
+
+
+async def adispatch_messages(messages, deadline=None, on_late=None):
+    """
+    dispatch_messages for the async views: every send is a task on the
+    running event loop instead of a pool thread, with the same deadline and
+    result semantics. Late sends are left running, and `on_late` is called
+    from a worker thread once they finish.
+    """
+    messages = list(messages)
+    if not messages:
+        return []
+
+    if deadline is None:
+        deadline = settings.ALERT_DISPATCH_DEADLINE
+
+    deadline_at = time.monotonic() + deadline
+    tasks = [asyncio.ensure_future(asend_sms(to, body, deadline_at)) for to, body in messages]
+    await asyncio.wait(tasks, timeout=deadline)
+    if on_late is not None:
+        # Done callbacks run on the event loop; whatever on_late does (DB writes) runs off it
+        on_late = _off_loop(on_late)
+    return _collect_results(messages, tasks, deadline, on_late)
+
+
+def _off_loop(fn):
+    def call(*args):
+        asyncio.ensure_future(sync_to_async(fn, thread_sensitive=False)(*args))
+    return call
+
+
+def _result(to, future):
+    """DeliveryResult of a finished future."""
+    if future.exception() is not None:
+        return DeliveryResult(to=to, status="failed", error=str(future.exception()))
+    return DeliveryResult(to=to, status="sent", sid=future.result())
+
+
+def _late_send_done(index, to, future, on_late):
+    if future.cancelled():
+        return
+    result = _result(to, future)
+    if result.ok:
+        logger.warning("SMS to %s went out after its deadline (sid %s)", to, result.sid)
+    else:
+        logger.warning("SMS to %s failed after its deadline: %s", to, result.error)
+    if on_late is not None:
+        try:
+            on_late(index, result)
+        except Exception:
+            logger.exception("Could not record late SMS to %s", to)
+
+
+def _collect_results(messages, futures, deadline, on_late=None):
+    """Turn finished / pending futures (concurrent or asyncio) into DeliveryResults."""
+    results = []
+    for index, ((to, _), future) in enumerate(zip(messages, futures)):
+        if not future.done():
+            # Not cancelled: the request may already be with the provider, and its sid is what settles it
+            future.add_done_callback(
+                lambda f, index=index, to=to: _late_send_done(index, to, f, on_late)
+            )
+            logger.warning("SMS to %s still in flight after %ss deadline; outcome unknown", to, deadline)
+            result = DeliveryResult(to=to, status="unknown")
+        else:
+            result = _result(to, future)
+            if not result.ok:
+                logger.error("Failed to send SMS to %s: %s", to, result.error)
+        results.append(result)
+
+    return results
+
+
+def dispatch_alert(user, contacts, message, deadline=None):
+    """Fan `message` out to already-evaluated `contacts`; see dispatch_messages."""
+    contacts = list(contacts)
+    body = message or default_alert_message(user)
+    results = dispatch_messages([(c.phone_e164, body) for c in contacts], deadline)
+    for contact, result in zip(contacts, results):
+        result.contact_id = contact.id
+    return results
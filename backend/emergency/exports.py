@@ -0,0 +1,121 @@
+"""
+Streaming exports of alert history and location tracks as NDJSON or CSV.
+
+Rows come off a server-side cursor (`.values_list().iterator(chunk_size=...)`)
+and are encoded as they arrive, so memory stays flat however long the history
+is and the first bytes go out before the last row has been read. Used by the
+export endpoints and `manage.py export_alerts`.
+"""
+import csv
+import json
+import re
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+ALERT_COLUMNS = ("id", "created_at", "message", "location", "is_test")
+TRACK_COLUMNS = ("alert_id", "recorded_at", "latitude", "longitude", "accuracy")
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+# Numbers and "lat,lon" pairs: the only text allowed to start with "-" unescaped
+_PLAIN_NUMBER = re.compile(r"-?\d+(\.\d+)?(,-?\d+(\.\d+)?)?")
+
+# Rows are grouped into writes of about this many characters; one write per row
+# is mostly syscall overhead.
+FLUSH_CHARS = 32 * 1024
+
+
+def alert_rows(queryset, columns=ALERT_COLUMNS):
+    return (
+        queryset.order_by("created_at", "id")
+        .values_list(*columns)
+        .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    )
+
+
+def track_rows(queryset, columns=TRACK_COLUMNS):
+    return (
+        queryset.order_by("alert_id", "recorded_at", "id")
+        .values_list(*columns)
+        .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    )
+
+
+class _Echo:
+    """File-like object whose write() hands the line back, so csv.writer can encode one row at a time."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_cell(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    # Spreadsheets run cells starting with these as formulas; alert messages are user input.
+    # A leading "-" is left alone only on plain numbers and coordinates like "-23.5,-46.6".
+    if isinstance(value, str) and (
+        value[:1] in ("=", "+", "@", "\t", "\r") or (value[:1] == "-" and not _PLAIN_NUMBER.fullmatch(value))
+    ):
+        return "'" + value
+    return value
+
+
+def render_csv(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([_csv_cell(value) for value in row])
+
+
+def render_ndjson(columns, rows):
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    for row in rows:
+        yield encode({
+            column: value.isoformat() if isinstance(value, datetime) else value
+            for column, value in zip(columns, row)
+        }) + "\n"
+
+
+RENDERERS = {"ndjson": render_ndjson, "csv": render_csv}
+
+
+def stream(fmt, columns, rows):
+    """Yield the export as text chunks of roughly FLUSH_CHARS."""
+    pending = []
+    size = 0
+    for line in RENDERERS[fmt](columns, rows):
+        pending.append(line)
+        size += len(line)
+        if size >= FLUSH_CHARS:
+            yield "".join(pending)
+            pending = []
+            size = 0
+    if pending:
+        yield "".join(pending)
+
+
+async def _aiterate(chunks):
+    # Django buffers a sync iterator whole under ASGI; pull it a chunk at a
+    # time instead, on the thread that owns the DB connection and its cursor.
+    pull = sync_to_async(next, thread_sensitive=True)
+    while (chunk := await pull(chunks, None)) is not None:
+        yield chunk
+
+
+def streaming_response(fmt, name, columns, rows):
+    chunks = (chunk.encode() for chunk in stream(fmt, columns, rows))
+    if settings.SERVER_MODE == "asgi":
+        chunks = _aiterate(chunks)
+    response = StreamingHttpResponse(chunks, content_type=FORMATS[fmt])
+    filename = f"resqsignal-{name}-{timezone.now():%Y%m%d}.{fmt}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    # Keep reverse proxies from buffering the whole body before forwarding it
+    response["X-Accel-Buffering"] = "no"
+    return response
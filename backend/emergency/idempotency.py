@@ -0,0 +1,112 @@
+"""
+Repeat alert triggers.
+
+Double taps, retries over a flaky connection and the service worker's
+offline replay can all POST the same alert more than once. Both trigger
+views pass each request through a TriggerGuard before they create
+anything. Two kinds of repeat get the original response back:
+
+- a request whose Idempotency-Key this user already sent to the same
+  endpoint within ALERT_IDEMPOTENCY_TTL;
+- any trigger within ALERT_DEBOUNCE_SECONDS of the user's previous one on
+  the same endpoint (real and test alerts are counted apart), with or
+  without a key.
+
+A repeat creates, sends and bills nothing, and its response carries
+`Idempotent-Replayed: true`. A repeat that arrives while the original is
+still being sent gets a 409 with Retry-After instead.
+
+Claims are cache.add() calls, which are atomic in the shared cache, so
+concurrent duplicates on different workers still produce one alert. A claim
+only lives for ALERT_CLAIM_TTL until its response is stored, so a worker that
+dies mid-request doesn't leave its key answering 409 for a day. If the cache
+can't be reached the guard steps aside: a duplicate alert is better than a
+lost one.
+"""
+import hashlib
+import logging
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Stored under a claim until the first request has its response
+_PENDING = "pending"
+
+Replay = namedtuple("Replay", ["status", "data", "headers"])
+
+
+def _replay(stored):
+    if stored is None or stored == _PENDING:
+        return Replay(409, {"detail": "This alert is already being sent."}, {"Retry-After": "1"})
+    status, data = stored
+    return Replay(status, data, {"Idempotent-Replayed": "true"})
+
+
+class TriggerGuard:
+    """
+    One trigger request. `claim()` before creating the alert: None means go
+    ahead, a Replay is the response to answer with instead. Then either
+    `remember(status, data)` the response sent, or `release()` if it failed,
+    so a retry can try again.
+    """
+
+    def __init__(self, scope, user_id, idempotency_key=None, is_test=False):
+        self._keys = []
+        if idempotency_key:
+            # Client-chosen, so hashed: any length or character set makes a valid cache key
+            digest = hashlib.sha256(idempotency_key.encode()).hexdigest()
+            self._keys.append((f"emergency:idempotency:{scope}:{user_id}:{digest}", settings.ALERT_IDEMPOTENCY_TTL))
+        if settings.ALERT_DEBOUNCE_SECONDS:
+            self._keys.append(
+                (f"emergency:debounce:{scope}:{user_id}:{int(bool(is_test))}", settings.ALERT_DEBOUNCE_SECONDS)
+            )
+        self._claimed = []
+
+    def claim(self):
+        try:
+            for key, timeout in self._keys:
+                if cache.add(key, _PENDING, timeout=min(timeout, settings.ALERT_CLAIM_TTL)):
+                    self._claimed.append((key, timeout))
+                    continue
+
+                replay = _replay(cache.get(key))
+                if replay.status == 409:
+                    self.release()
+                else:
+                    # A new key inside the debounce window: its retries should get this same answer
+                    self.remember(replay.status, replay.data)
+                    self._claimed = []
+                logger.info("🔁 Repeat alert trigger answered from %s", key.split(":")[1])
+                return replay
+        except Exception as e:
+            logger.warning("⚠️ Alert dedup cache unavailable, sending anyway: %s", e)
+            self._claimed = []
+        return None
+
+    def remember(self, status, data):
+        # Stored for the key's full lifetime, from now
+        try:
+            for key, timeout in self._claimed:
+                cache.set(key, (status, data), timeout=timeout)
+        except Exception as e:
+            logger.warning("⚠️ Could not store alert response for repeats: %s", e)
+
+    def release(self):
+        try:
+            cache.delete_many([key for key, _ in self._claimed])
+        except Exception as e:
+            logger.warning("⚠️ Could not release alert claim: %s", e)
+        self._claimed = []
+
+    async def aclaim(self):
+        return await sync_to_async(self.claim)()
+
+    async def aremember(self, status, data):
+        await sync_to_async(self.remember)(status, data)
+
+    async def arelease(self):
+        await sync_to_async(self.release)()
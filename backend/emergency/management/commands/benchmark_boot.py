@@ -0,0 +1,78 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What a fresh gunicorn worker pays before its first response: django.setup()
+# (apps, models, admin) via config.wsgi, then the URLconf and every view module.
+BOOT_SCRIPT = """
+import json, resource, time
+started = time.perf_counter()
+import config.wsgi
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(json.dumps({
+    "seconds": time.perf_counter() - started,
+    "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure cold-start time and peak RSS of a worker (import config.wsgi + load URLs) "
+        "in fresh interpreters, and list the slowest imports from python -X importtime."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5)
+        parser.add_argument("--top", type=int, default=15, help="How many of the slowest imports to list")
+        parser.add_argument("--max-seconds", type=float, help="Fail if the median boot is slower than this")
+        parser.add_argument("--max-rss-mb", type=float, help="Fail if peak RSS is above this")
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(settings.BASE_DIR), os.getenv("PYTHONPATH")])))
+
+        samples = []
+        importtime = ""
+        for run in range(options["runs"]):
+            flags = ["-X", "importtime"] if run == options["runs"] - 1 else []
+            proc = subprocess.run(
+                [sys.executable, *flags, "-c", BOOT_SCRIPT],
+                cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+            )
+            if proc.returncode != 0:
+                raise CommandError(f"Worker boot failed:\n{proc.stderr[-2000:]}")
+            samples.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+            importtime = proc.stderr
+
+        # The importtime run is slowed down by its own bookkeeping; keep it out of the timing.
+        timed = samples[:-1] or samples
+        boot = statistics.median(sample["seconds"] for sample in timed)
+        rss_mb = max(sample["rss_kb"] for sample in samples) / 1024
+
+        self.stdout.write(f"boot median={boot * 1000:.0f}ms over {len(timed)} runs, peak RSS={rss_mb:.1f}MB")
+        self.stdout.write("slowest imports (cumulative, top-level packages):")
+        for micros, name in self.slowest_imports(importtime, options["top"]):
+            self.stdout.write(f"  {micros / 1000:8.1f}ms  {name}")
+
+        if options["max_seconds"] is not None and boot > options["max_seconds"]:
+            raise CommandError(f"Boot took {boot:.3f}s, limit is {options['max_seconds']}s")
+        if options["max_rss_mb"] is not None and rss_mb > options["max_rss_mb"]:
+            raise CommandError(f"Peak RSS {rss_mb:.1f}MB, limit is {options['max_rss_mb']}MB")
+
+    @staticmethod
+    def slowest_imports(importtime, top):
+        """Parse `-X importtime` output into the slowest top-level packages (cumulative microseconds)."""
+        totals = {}
+        for line in importtime.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            package = name.strip().split(".")[0]
+            totals[package] = max(totals.get(package, 0), int(cumulative))
+        return sorted(((micros, name) for name, micros in totals.items()), reverse=True)[:top]
@@ -0,0 +1,65 @@
+import asyncio
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test a running server's public alert endpoint with concurrent requests, "
+        "to compare SERVER_MODE=wsgi and SERVER_MODE=asgi deployments."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("url", help="e.g. http://localhost:8000/api/emergency/public/<token>/")
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--continuous", action="store_true", help="Send continuous GPS fixes instead of alerts")
+        parser.add_argument("--timeout", type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        timings, statuses, elapsed = asyncio.run(self.run(options))
+
+        errors = sum(count for status, count in statuses.items() if status != 200)
+        timings.sort()
+        p50 = timings[len(timings) // 2] if timings else 0
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))] if timings else 0
+        self.stdout.write(
+            f"requests={options['requests']} concurrency={options['concurrency']} errors={errors} "
+            f"statuses={dict(sorted(statuses.items(), key=str))}\n"
+            f"throughput={options['requests'] / elapsed:.1f} req/s "
+            f"latency p50={p50 * 1000:.1f}ms p95={p95 * 1000:.1f}ms"
+        )
+
+    async def run(self, options):
+        import aiohttp
+
+        body = {"location": "38.7,-9.1"}
+        if options["continuous"]:
+            body["continuous"] = True
+        payload = json.dumps(body)
+
+        remaining = iter(range(options["requests"]))
+        timings = []
+        statuses = {}
+
+        async def worker(session):
+            for _ in remaining:
+                started = time.perf_counter()
+                try:
+                    async with session.post(options["url"], data=payload, headers={"Content-Type": "application/json"}) as response:
+                        await response.read()
+                        status = response.status
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    status = type(e).__name__
+                timings.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        timeout = aiohttp.ClientTimeout(total=options["timeout"])
+        connector = aiohttp.TCPConnector(limit=options["concurrency"])
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(session) for _ in range(options["concurrency"])))
+            elapsed = time.perf_counter() - started
+        return timings, statuses, elapsed
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from emergency.dispatch import dispatch_messages
+from services.sms_gateway import FakeGateway, set_gateway
+
+
+class Command(BaseCommand):
+    help = "Benchmark alert fan-out against the in-process fake SMS gateway (no network)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--alerts", type=int, default=20)
+        parser.add_argument("--contacts", type=int, default=7)
+        parser.add_argument("--latency", type=float, default=0.2)
+        parser.add_argument("--jitter", type=float, default=0.05)
+        parser.add_argument("--failure-rate", type=float, default=0.0)
+
+    def handle(self, *args, **options):
+        gateway = FakeGateway(
+            latency=options["latency"],
+            jitter=options["jitter"],
+            failure_rate=options["failure_rate"],
+            seed=1,
+        )
+        set_gateway(gateway)
+
+        timings = []
+        sent = failed = unknown = 0
+        try:
+            for i in range(options["alerts"]):
+                messages = [(f"+3519100000{n:02d}", f"benchmark alert {i}") for n in range(options["contacts"])]
+                start = time.perf_counter()
+                results = dispatch_messages(messages)
+                timings.append(time.perf_counter() - start)
+                sent += sum(1 for r in results if r.ok)
+                failed += sum(1 for r in results if r.status == "failed")
+                unknown += sum(1 for r in results if r.status == "unknown")
+        finally:
+            set_gateway(None)
+
+        timings.sort()
+        p50 = timings[len(timings) // 2]
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(
+            f"alerts={len(timings)} contacts={options['contacts']} sent={sent} failed={failed} unknown={unknown}\n"
+            f"time-to-alert p50={p50 * 1000:.1f}ms p95={p95 * 1000:.1f}ms "
+            f"(serial baseline ≈ {options['contacts'] * options['latency'] * 1000:.0f}ms)"
+        )
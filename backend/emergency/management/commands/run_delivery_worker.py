@@ -0,0 +1,47 @@
+import logging
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from emergency.outbox import process_batch
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Drain the alert delivery outbox. Run as many copies as needed; jobs are claimed with SKIP LOCKED."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.ALERT_DELIVERY_BATCH_SIZE)
+        parser.add_argument("--poll-interval", type=float, default=settings.ALERT_DELIVERY_POLL_INTERVAL)
+        parser.add_argument("--once", action="store_true", help="Process due jobs then exit.")
+
+    def handle(self, *args, **options):
+        self._running = True
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        batch_size = options["batch_size"]
+        poll_interval = options["poll_interval"]
+        self.stdout.write(f"📨 Delivery worker started (batch={batch_size})")
+
+        while self._running:
+            close_old_connections()
+            try:
+                handled = process_batch(batch_size)
+            except Exception:
+                logger.exception("Delivery batch failed")
+                handled = 0
+
+            if handled < batch_size:
+                if options["once"]:
+                    break
+                time.sleep(poll_interval)
+
+        self.stdout.write("🛑 Delivery worker stopped")
+
+    def _stop(self, signum, frame):
+        self._running = False
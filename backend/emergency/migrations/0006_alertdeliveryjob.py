@@ -0,0 +1,36 @@
+# Generated by Django 4.2.10 on 2026-10-18 14:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0005_remove_contact_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertDeliveryJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('to_number', models.CharField(max_length=32)),
+                ('body', models.TextField()),
+                ('billable', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('provider_sid', models.CharField(blank=True, max_length=64)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('alert', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='delivery_jobs', to='emergency.emergencyalert')),
+                ('contact', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='emergency.contact')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'available_at'], name='emergency_job_queue_idx')],
+            },
+        ),
+    ]
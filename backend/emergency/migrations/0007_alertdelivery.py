@@ -0,0 +1,33 @@
+# Generated by Django 4.2.10 on 2026-10-18 14:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0006_alertdeliveryjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('to_number', models.CharField(max_length=32)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('sent', 'Sent'), ('delivered', 'Delivered'), ('undelivered', 'Undelivered'), ('failed', 'Failed')], default='queued', max_length=12)),
+                ('provider_sid', models.CharField(blank=True, db_index=True, max_length=64)),
+                ('error_code', models.CharField(blank=True, max_length=16)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('alert', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='emergency.emergencyalert')),
+                ('contact', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deliveries', to='emergency.contact')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='alertdeliveryjob',
+            name='delivery',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='job', to='emergency.alertdelivery'),
+        ),
+    ]
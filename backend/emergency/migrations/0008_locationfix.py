@@ -0,0 +1,30 @@
+# Generated by Django 4.2.10 on 2026-10-18 14:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0007_alertdelivery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationFix',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('accuracy', models.FloatField(blank=True, null=True)),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('alert', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='track', to='emergency.emergencyalert')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['alert', 'recorded_at'], name='emergency_track_idx')],
+            },
+        ),
+    ]
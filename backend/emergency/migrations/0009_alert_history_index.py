@@ -0,0 +1,17 @@
+# Generated by Django 4.2.10 on 2026-10-18 15:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0008_locationfix'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emergencyalert',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='emergency_alert_history_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.10 on 2026-10-18 15:29
+
+from django.db import migrations, models
+
+
+def backfill_e164(apps, schema_editor):
+    from services.phones import parse_phone
+
+    Contact = apps.get_model('emergency', 'Contact')
+    batch = []
+    for contact in Contact.objects.only('id', 'phone_number').iterator(chunk_size=500):
+        raw = str(contact.phone_number)
+        contact.phone_e164, contact.phone_region = parse_phone(raw) or (raw, '')
+        batch.append(contact)
+        if len(batch) >= 500:
+            Contact.objects.bulk_update(batch, ['phone_e164', 'phone_region'])
+            batch = []
+    Contact.objects.bulk_update(batch, ['phone_e164', 'phone_region'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0009_alert_history_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contact',
+            name='phone_e164',
+            field=models.CharField(default='', editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='phone_region',
+            field=models.CharField(blank=True, default='', editable=False, max_length=3),
+        ),
+        migrations.RunPython(backfill_e164, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='contact',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='contact',
+            constraint=models.UniqueConstraint(fields=('user', 'phone_e164'), name='emergency_contact_user_e164_uniq'),
+        ),
+    ]
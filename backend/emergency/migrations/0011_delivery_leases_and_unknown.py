@@ -0,0 +1,23 @@
+# Generated by Django 4.2.10 on 2026-10-18 15:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0010_contact_e164'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='alertdelivery',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('unknown', 'Unknown'), ('sent', 'Sent'), ('delivered', 'Delivered'), ('undelivered', 'Undelivered'), ('failed', 'Failed')], default='queued', max_length=12),
+        ),
+        migrations.AlterField(
+            model_name='alertdeliveryjob',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('unknown', 'Unknown'), ('failed', 'Failed')], default='pending', max_length=10),
+        ),
+    ]
@@ -1,8 +1,11 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.validators import RegexValidator
+from django.utils import timezone
 from phonenumber_field.modelfields import PhoneNumberField
 
+from services.phones import parse_phone
+
 User = get_user_model()
 
 class EmergencyAlert(models.Model):
@@ -12,19 +15,141 @@ class EmergencyAlert(models.Model):
     location = models.CharField(max_length=100, blank=True, null=True)
     is_test = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Alert history is paged newest-first by (created_at, id) per user (emergency/pagination.py)
+            models.Index(fields=["user", "-created_at", "-id"], name="emergency_alert_history_idx"),
+        ]
+
     def __str__(self):
         prefix = "[TEST] " if self.is_test else ""
         return f"EmergencyAlert from {self.user.username} at {self.created_at}"
 
+class ContactQuerySet(models.QuerySet):
+    def sendable(self):
+        """Contacts to message. Leaves out phone_number, whose field re-parses the number on every load."""
+        return self.exclude(phone_e164="").only("id", "user_id", "name", "phone_e164")
+
+
 class Contact(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="contacts")
     name = models.CharField(max_length=100)
     phone_number = PhoneNumberField()
+    # Canonical form of phone_number, filled in by save() (see services/phones.py)
+    phone_e164 = models.CharField(max_length=32, editable=False, default="")
+    phone_region = models.CharField(max_length=3, editable=False, blank=True, default="")
     #email = models.EmailField(blank=True) #decided to remove email for this bracker, useless
     relationship = models.CharField(max_length=50, blank=True)
 
+    objects = ContactQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # ✅ Enforces per-user uniqueness; also the index duplicate checks read
+            models.UniqueConstraint(fields=["user", "phone_e164"], name="emergency_contact_user_e164_uniq"),
+        ]
+
+    def normalize_phone(self):
+        parsed = parse_phone(str(self.phone_number))
+        # Numbers saved before validation was strict are kept verbatim
+        self.phone_e164, self.phone_region = parsed or (str(self.phone_number), "")
+
+    def save(self, *args, **kwargs):
+        self.normalize_phone()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "phone_number" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "phone_e164", "phone_region"}
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.name} ({self.phone_e164})"
+
+class LocationFix(models.Model):
+    """One GPS point of an active alert's track (written in batches, see emergency/buffers.py)."""
+    alert = models.ForeignKey(EmergencyAlert, on_delete=models.CASCADE, related_name="track")
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    accuracy = models.FloatField(null=True, blank=True)
+    recorded_at = models.DateTimeField(default=timezone.now)
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["alert", "recorded_at"], name="emergency_track_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.latitude},{self.longitude} for alert {self.alert_id}"
+
+
+class AlertDelivery(models.Model):
+    """
+    Ledger row: what happened to the alert SMS for one recipient.
+    Written in one bulk_create per alert; updated by the delivery worker and
+    by Twilio status callbacks (matched on provider_sid).
+    """
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("unknown", "Unknown"),
+        ("sent", "Sent"),
+        ("delivered", "Delivered"),
+        ("undelivered", "Undelivered"),
+        ("failed", "Failed"),
+    ]
+    # Callbacks can arrive out of order; never move a row to a lower rank.
+    # "unknown": the send outlived its deadline; it settles once the send returns its sid.
+    STATUS_RANK = {"queued": 0, "unknown": 0, "sent": 1, "delivered": 2, "undelivered": 2, "failed": 2}
+
+    alert = models.ForeignKey(EmergencyAlert, on_delete=models.CASCADE, related_name="deliveries")
+    contact = models.ForeignKey(Contact, on_delete=models.SET_NULL, null=True, blank=True, related_name="deliveries")
+    to_number = models.CharField(max_length=32)
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default="queued")
+    provider_sid = models.CharField(max_length=64, blank=True, db_index=True)
+    error_code = models.CharField(max_length=16, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.to_number} for alert {self.alert_id}: {self.status}"
+
+
+class AlertDeliveryJob(models.Model):
+    """
+    Outbox row: one pending SMS for one recipient of an alert.
+    Created in the same transaction as the EmergencyAlert and sent either
+    inline by the trigger or by `manage.py run_delivery_worker`.
+
+    "sending" is a lease: the job is claimed until `available_at`, and a
+    job whose sender died is claimed again after it. "unknown" jobs outlived
+    their send deadline; they are never resent, and settle as sent or
+    failed when the send returns (see emergency.buffers.LateSendBuffer).
+    """
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("sending", "Sending"),
+        ("sent", "Sent"),
+        ("unknown", "Unknown"),
+        ("failed", "Failed"),
+    ]
+
+    alert = models.ForeignKey(EmergencyAlert, on_delete=models.CASCADE, related_name="delivery_jobs")
+    contact = models.ForeignKey(Contact, on_delete=models.SET_NULL, null=True, blank=True)
+    delivery = models.OneToOneField(AlertDelivery, on_delete=models.CASCADE, null=True, blank=True, related_name="job")
+    to_number = models.CharField(max_length=32)
+    body = models.TextField()
+    billable = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    provider_sid = models.CharField(max_length=64, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
     class Meta:
-        unique_together = ['user', 'phone_number']  # ✅ Enforces per-user uniqueness
+        indexes = [
+            models.Index(fields=["status", "available_at"], name="emergency_job_queue_idx"),
+        ]
 
     def __str__(self):
-        return f"{self.name} ({self.phone_number})"
\ No newline at end of file
+        return f"Delivery to {self.to_number} for alert {self.alert_id} ({self.status})"
@@ -0,0 +1,189 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from emergency.buffers import late_send_buffer
+from emergency.models import AlertDelivery, AlertDeliveryJob
+from emergency.dispatch import adispatch_messages, dispatch_messages
+from billing.utils import record_usage
+
+logger = logging.getLogger(__name__)
+
+JOB_UPDATE_FIELDS = ["status", "attempts", "provider_sid", "last_error", "processed_at", "available_at"]
+
+
+def _lease_until(now=None):
+    return (now or timezone.now()) + timedelta(seconds=settings.ALERT_DELIVERY_LEASE)
+
+
+def enqueue_alert(alert, contacts, body, billable=False, claimed=False):
+    """
+    Write the per-recipient ledger rows and their outbox jobs, one INSERT each.
+    Call inside the transaction that creates `alert` so all of it commits together.
+
+    `claimed` jobs are written already leased to the caller, which sends
+    them itself after the commit (inline delivery); a worker only picks
+    them up if that lease runs out.
+    """
+    contacts = [contact for contact in contacts if contact.phone_e164]
+    lease = {"status": "sending", "available_at": _lease_until()} if claimed else {}
+    deliveries = AlertDelivery.objects.bulk_create([
+        AlertDelivery(alert=alert, contact=contact, to_number=contact.phone_e164)
+        for contact in contacts
+    ])
+    jobs = [
+        AlertDeliveryJob(
+            alert=alert,
+            contact=contact,
+            delivery=delivery,
+            to_number=delivery.to_number,
+            body=body,
+            billable=billable,
+            **lease,
+        )
+        for contact, delivery in zip(contacts, deliveries)
+    ]
+    return AlertDeliveryJob.objects.bulk_create(jobs)
+
+
+def claim_jobs(batch_size=None):
+    """
+    Lease up to `batch_size` due jobs to this worker and commit, so no row
+    lock or transaction is held while they are sent. Rows locked by another
+    worker are skipped, so any number of workers can drain the queue side
+    by side.
+
+    Due jobs are pending ones and "sending" ones whose lease ran out: their
+    sender died mid-batch, so they are sent again. A possible duplicate beats
+    an alert that is never delivered.
+    """
+    batch_size = batch_size or settings.ALERT_DELIVERY_BATCH_SIZE
+    now = timezone.now()
+    lease = _lease_until(now)
+    with transaction.atomic():
+        jobs = list(
+            AlertDeliveryJob.objects
+            .select_for_update(skip_locked=True, of=("self",))
+            .select_related("alert__user", "delivery")
+            .filter(status__in=("pending", "sending"), available_at__lte=now)
+            .order_by("available_at", "id")[:batch_size]
+        )
+        for job in jobs:
+            if job.status == "sending":
+                logger.warning("♻️ Delivery job %s lease expired; sending again", job.pk, extra={"alert_id": job.alert_id})
+            job.status = "sending"
+            job.available_at = lease
+        AlertDeliveryJob.objects.filter(pk__in=[job.pk for job in jobs]).update(status="sending", available_at=lease)
+    return jobs
+
+
+def _late_send_recorder(jobs):
+    """on_late for dispatch: a send that outlived the deadline reports its sid through late_send_buffer."""
+    def record(index, result):
+        late_send_buffer.add_result(jobs[index].pk, result)
+    return record
+
+
+def deliver_jobs(jobs):
+    """Send `jobs` concurrently, record each outcome and record billable usage."""
+    if not jobs:
+        return jobs
+
+    results = dispatch_messages([(job.to_number, job.body) for job in jobs], on_late=_late_send_recorder(jobs))
+    return record_results(jobs, results)
+
+
+async def adeliver_jobs(jobs):
+    """deliver_jobs for the async views: sends on the event loop, records in one sync block."""
+    if not jobs:
+        return jobs
+
+    results = await adispatch_messages([(job.to_number, job.body) for job in jobs], on_late=_late_send_recorder(jobs))
+    return await sync_to_async(record_results)(jobs, results)
+
+
+def record_results(jobs, results):
+    """
+    Store each job's DeliveryResult: sent, retry later, failed for good, or
+    unknown. An unknown send may still be delivered, so it is never retried;
+    late_send_buffer settles it once the send returns.
+    """
+    now = timezone.now()
+    usage = defaultdict(int)
+    deliveries = []
+
+    for job, result in zip(jobs, results):
+        job.attempts += 1
+        job.processed_at = now
+        if result.ok:
+            job.status = "sent"
+            job.provider_sid = result.sid or ""
+            job.last_error = ""
+            if job.billable:
+                usage[job.alert.user_id] += 1
+        elif result.status == "unknown":
+            job.status = "unknown"
+            job.last_error = "Still in flight at the send deadline"
+            logger.warning(
+                "❔ Delivery job %s outcome unknown; waiting for the send to return", job.pk,
+                extra={"alert_id": job.alert_id},
+            )
+        elif job.attempts >= settings.ALERT_DELIVERY_MAX_ATTEMPTS:
+            job.status = "failed"
+            job.last_error = result.error or result.status
+            logger.error(
+                "❌ Delivery job %s failed after %s attempts: %s", job.pk, job.attempts, job.last_error,
+                extra={"alert_id": job.alert_id},
+            )
+        else:
+            delay = settings.ALERT_DELIVERY_RETRY_DELAY * 2 ** (job.attempts - 1)
+            job.status = "pending"
+            job.last_error = result.error or result.status
+            job.available_at = now + timedelta(seconds=delay)
+            logger.warning(
+                "🔁 Delivery job %s retrying in %ss: %s", job.pk, delay, job.last_error,
+                extra={"alert_id": job.alert_id},
+            )
+
+        delivery = job.delivery
+        if delivery is not None and job.status != "pending":
+            if AlertDelivery.STATUS_RANK[job.status] >= AlertDelivery.STATUS_RANK[delivery.status]:
+                delivery.status = job.status
+            delivery.provider_sid = job.provider_sid
+            delivery.updated_at = now
+            deliveries.append(delivery)
+
+    with transaction.atomic():
+        AlertDeliveryJob.objects.bulk_update(jobs, JOB_UPDATE_FIELDS)
+        AlertDelivery.objects.bulk_update(deliveries, ["status", "provider_sid", "updated_at"])
+        record_usage(usage)
+
+    return jobs
+
+
+def process_batch(batch_size=None):
+    """Claim (and commit), send, then record one batch. Returns the number of jobs handled."""
+    jobs = claim_jobs(batch_size)
+    deliver_jobs(jobs)
+    return len(jobs)
+
+
+def summarize_jobs(jobs):
+    counts = defaultdict(int)
+    for job in jobs:
+        counts[job.status] += 1
+    return {
+        "successful_sends": counts["sent"],
+        "failed_sends": counts["failed"],
+        "queued_sends": counts["pending"],
+        "unknown_sends": counts["unknown"],
+        "deliveries": [
+            {"contact_id": job.contact_id, "status": job.status, "sid": job.provider_sid or None}
+            for job in jobs
+        ],
+    }
@@ -0,0 +1,59 @@
+"""
+Rendered public pages, cached by what they are rendered from.
+
+The alert button (/public/<token>/) and the test page only vary by token
+and, for the button, by the owner's display name and entitlement. Their
+HTML is rendered once, then served from this process's LRU and the shared
+cache. The key is a digest of the template name, its source and every
+context value. A name or plan change rebuilds the token snapshot (see
+users/resolver.py), so it lands on a new key, and so does an edited
+template after a deploy. Nothing needs deleting; old entries age out.
+
+Pages render without the request, so nothing per-visitor can end up in the
+cached HTML. The CSRF cookie is still set on every response by
+ensure_csrf_cookie, and the page's JS reads it from the cookie.
+"""
+import hashlib
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import get_template, render_to_string
+
+from services.caching import LocalLRU
+
+# Keys are content-addressed, so the local copy can live as long as the shared one
+_local = LocalLRU(settings.PUBLIC_PAGE_LRU_SIZE, settings.PUBLIC_PAGE_CACHE_TTL)
+
+
+@lru_cache(maxsize=None)
+def _template_version(template_name):
+    return hashlib.md5(get_template(template_name).template.source.encode()).hexdigest()[:12]
+
+
+def page_key(template_name, context):
+    parts = [template_name, _template_version(template_name)]
+    parts += [f"{name}={context[name]}" for name in sorted(context)]
+    return "emergency:page:v1:" + hashlib.md5("\0".join(parts).encode()).hexdigest()
+
+
+def render_page(template_name, context, headers=None):
+    """HttpResponse of `template_name` rendered with `context`, from cache when possible."""
+    if settings.DEBUG:
+        # Templates are being edited; always render
+        html = render_to_string(template_name, context)
+    else:
+        key = page_key(template_name, context)
+        html = _local.get(key)
+        if html is None:
+            html = cache.get(key)
+            if html is None:
+                html = render_to_string(template_name, context)
+                cache.set(key, html, timeout=settings.PUBLIC_PAGE_CACHE_TTL)
+            _local.set(key, html)
+
+    response = HttpResponse(html)
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
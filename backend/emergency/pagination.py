@@ -0,0 +1,77 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Newest-first keyset pagination on (created_at, id).
+
+    The cursor is the last row's (created_at, id); the next page is the rows
+    strictly before it, read straight off the (user, -created_at, -id) index.
+    Unlike LIMIT/OFFSET, page N costs the same as page 1 and rows inserted
+    meanwhile never shift or repeat a page.
+    """
+    cursor_query_param = "cursor"
+    page_size_query_param = "limit"
+    page_size = 20
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        limit = self.get_page_size(request)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            created_at, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+        # One extra row tells us whether there is a next page
+        rows = list(queryset.order_by("-created_at", "-id")[:limit + 1])
+        self.has_next = len(rows) > limit
+        rows = rows[:limit]
+        self.last = rows[-1] if rows else None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            raise ValidationError({self.page_size_query_param: "Must be an integer."})
+        return max(1, min(size, self.max_page_size))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.last))
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    @staticmethod
+    def encode_cursor(row):
+        raw = f"{row.created_at.isoformat()}|{row.pk}"
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+            created_at, pk = raw.rsplit("|", 1)
+            return datetime.fromisoformat(created_at), int(pk)
+        except (ValueError, UnicodeDecodeError):
+            raise ValidationError({self.cursor_query_param: "Invalid cursor."})
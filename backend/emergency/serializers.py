@@ -2,7 +2,7 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from .models import Contact, EmergencyAlert
 from django.utils.translation import gettext_lazy as _
-from phonenumbers import parse, format_number, PhoneNumberFormat
+from services.phones import to_e164
 
 User = get_user_model()
 
@@ -18,25 +18,23 @@ class ContactSerializer(serializers.ModelSerializer):
         }
 
     def validate_phone_number(self, value):
-        """Validate phone number is in E.164 format, has at least 9 digits, and is not duplicated"""
-        if not value.startswith("+") or not value[1:].isdigit():
+        """Validate the number is a real international number, not already in the user's contacts; return it as E.164"""
+        e164 = to_e164(value.strip())
+        if e164 is None:
             raise serializers.ValidationError(
                 _("Phone number must be in international format (e.g., +351913016860)")
             )
 
-        digits_only = value[1:]
-        if len(digits_only) < 9:
-            raise serializers.ValidationError(
-                _("⚠️ Enter a valid phone number with at least 9 digits.")
-            )
-
         user = self.context['request'].user
-        if Contact.objects.filter(user=user, phone_number=value).exists():
+        duplicates = Contact.objects.filter(user=user, phone_e164=e164)
+        if self.instance is not None:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
             raise serializers.ValidationError(
                 _("⚠️ This phone number is already in your contacts.")
             )
 
-        return value
+        return e164
 
 
     def create(self, validated_data):
@@ -46,9 +44,16 @@ class ContactSerializer(serializers.ModelSerializer):
 class EmergencyAlertSerializer(serializers.ModelSerializer):
     class Meta:
         model = EmergencyAlert
-        fields = ['id', 'message', 'created_at', 'is_test']
+        fields = ['id', 'message', 'created_at', 'is_test', 'location']
         read_only_fields = ['created_at', 'is_test']
 
+    def __init__(self, *args, fields=None, **kwargs):
+        """`fields` limits the output to a subset of Meta.fields (sparse field sets)."""
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, style={'input_type': 'password'})
     
@@ -0,0 +1,866 @@
+import csv
+import json
+import time
+import unittest
+import uuid
+from datetime import timedelta
+from unittest import mock
+from urllib.parse import urlencode
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from django.urls import include, path
+from django.utils import timezone
+from twilio.request_validator import RequestValidator
+
+from emergency import urls
+from emergency.buffers import delivery_status_buffer, late_send_buffer, location_fix_buffer
+from emergency.checks import check_metrics_token, check_shared_cache
+from emergency.dispatch import DeliveryResult, dispatch_messages
+from emergency.exports import _csv_cell
+from emergency.idempotency import TriggerGuard
+from emergency.models import AlertDelivery, AlertDeliveryJob, Contact, EmergencyAlert, LocationFix
+from emergency.outbox import process_batch
+from emergency.views.async_views import AsyncPublicAlertStatusCheck, AsyncTriggerPublicAlertView
+from services import testing
+from services.resilience import CircuitBreaker, CircuitOpenError
+from services.sms_gateway import ResilientGateway, SMSGateway, SMSGatewayError
+from services.testing import Budget
+from users.models import User
+from users.resolver import resolve_token
+
+# What emergency/urls.py routes when ASYNC_ALERT_VIEWS is on; used as ROOT_URLCONF by the async suite
+async_urlpatterns = [
+    path("public/<uuid:token>/", AsyncTriggerPublicAlertView.as_view(), name="public-alert"),
+    path("public/<uuid:token>/test-connection/", AsyncPublicAlertStatusCheck.as_view(), name="public-alert-status"),
+]
+urlpatterns = [path("api/emergency/", include(async_urlpatterns))]
+
+
+class AlertFixtures:
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="alice", email="alice@example.com", password="pw")
+        cls.profile = cls.user.profile
+        cls.profile.is_free_user = True
+        cls.profile.save()
+        cls.contacts = [
+            Contact.objects.create(user=cls.user, name=f"Contact {i}", phone_number=f"+35191301686{i}")
+            for i in range(3)
+        ]
+        cls.token = cls.profile.token
+
+    def check_status_revalidation(self, path):
+        response = self.client.get(path)
+        etag = response["ETag"]
+        self.assertIn("max-age=", response["Cache-Control"])
+
+        # A poll holding the current version gets a 304 off the cached snapshot
+        response = self.assertWithinBudget(
+            "public-alert-status:not-modified", "get", path, expected_status=304, HTTP_IF_NONE_MATCH=etag,
+        )
+        self.assertEqual(response["ETag"], etag)
+
+        # Adding a contact changes the version
+        with self.captureOnCommitCallbacks(execute=True):
+            Contact.objects.create(user=self.user, name="New", phone_number="+351913016869")
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def check_throttling(self):
+        rates = {**settings.PUBLIC_THROTTLE_RATES, "status": ("2/min", None), "location": ("2/min", None)}
+        status_path = f"/api/emergency/public/{self.token}/test-connection/"
+        with self.settings(PUBLIC_THROTTLE_RATES=rates):
+            for _ in range(2):
+                self.client.get(status_path)
+            # Refused off the shared cache alone
+            response = self.assertWithinBudget("public-alert-status:throttled", "get", status_path, expected_status=429)
+            self.assertTrue(1 <= int(response["Retry-After"]) <= 30)
+
+            alert_path = f"/api/emergency/public/{self.token}/"
+            tick = {"location": "38.7,-9.1", "continuous": True}
+            for _ in range(2):
+                self.assertEqual(self.client.post(alert_path, data=tick, format="json").status_code, 200)
+            self.assertWithinBudget("public-alert:throttled", "post", alert_path, expected_status=429, data=tick, format="json")
+            # Spent GPS and status budgets leave the alert button alone
+            self.trigger_public_alert()
+
+    def check_test_trigger_throttling(self):
+        # Every token behind one IP has used up its test triggers
+        rates = {**settings.PUBLIC_THROTTLE_RATES, "test": (None, "1/hour")}
+        alert_path = f"/api/emergency/public/{self.token}/"
+        with self.settings(PUBLIC_THROTTLE_RATES=rates, ALERT_DEBOUNCE_SECONDS=0):
+            self.assertEqual(self.client.post(alert_path, data={"is_test": True}, format="json").status_code, 200)
+            self.assertWithinBudget(
+                "public-alert:throttled", "post", alert_path, expected_status=429, data={"is_test": True}, format="json"
+            )
+            # Real alerts are never refused per IP
+            self.assertIsNone(settings.PUBLIC_THROTTLE_RATES["alert"][1])
+            self.trigger_public_alert()
+
+    def check_malformed_body(self):
+        response = self.assertWithinBudget(
+            "public-alert:invalid", "post", f"/api/emergency/public/{self.token}/", expected_status=400,
+            data=json.dumps([{"continuous": True}]), content_type="application/json",
+        )
+        self.assertIn("detail", response.json())
+
+    def check_repeat_triggers(self):
+        first = self.trigger_public_alert(HTTP_IDEMPOTENCY_KEY="tap-1")
+        alert_id = first.json()["alert_id"]
+
+        # A retry of the same request, and a double tap with a fresh key, are answered from the cache
+        for key in ("tap-1", "tap-2"):
+            response = self.trigger_public_alert("public-alert:repeat", HTTP_IDEMPOTENCY_KEY=key)
+            self.assertEqual(response.json(), first.json())
+            self.assertEqual(response["Idempotent-Replayed"], "true")
+
+        # Past the debounce window a known key still replays; a new one is a new alert
+        with self.settings(ALERT_DEBOUNCE_SECONDS=0):
+            self.assertEqual(self.trigger_public_alert(HTTP_IDEMPOTENCY_KEY="tap-1").json()["alert_id"], alert_id)
+            self.assertNotEqual(self.trigger_public_alert(HTTP_IDEMPOTENCY_KEY="tap-3").json()["alert_id"], alert_id)
+        # Test alerts are debounced apart from real ones
+        self.assertTrue(self.trigger_public_alert(is_test=True).json()["alert_id"] > alert_id)
+
+        self.assertEqual(EmergencyAlert.objects.count(), 3)
+        # Only the two real alerts queued sends
+        self.assertEqual(AlertDelivery.objects.count(), 6)
+
+    def trigger_public_alert(self, budget_name="public-alert", expected_status=200, **data):
+        headers = {name: data.pop(name) for name in list(data) if name.startswith("HTTP_")}
+        return self.assertWithinBudget(
+            budget_name, "post", f"/api/emergency/public/{self.token}/", expected_status,
+            data={"location": "38.7,-9.1", **data}, format="json", **headers,
+        )
+
+
+class EmergencyQueryBudgetTests(AlertFixtures, testing.QueryBudgetTestCase):
+    urlpatterns = urls.urlpatterns
+    budgets = {
+        "trigger-alert": Budget(queries=9, seconds=0.5),
+        "trigger-alert:inline": Budget(queries=14, seconds=0.5),
+        "trigger-alert:repeat": Budget(queries=3, seconds=0.1),
+        "alert-list": Budget(queries=2, seconds=0.3),
+        "alert-list:deep": Budget(queries=2, seconds=0.3),
+        "alert-export": Budget(queries=1, seconds=0.3),
+        "track-export": Budget(queries=1, seconds=0.3),
+        "public-alert": Budget(queries=9, seconds=0.5),
+        "public-alert:warm": Budget(queries=7, seconds=0.5),
+        "public-alert:repeat": Budget(queries=0, seconds=0.1),
+        "public-alert:inline": Budget(queries=13, seconds=0.5),
+        "public-alert:continuous": Budget(queries=0, seconds=0.1),
+        "public-alert-track": Budget(queries=0, seconds=0.1),
+        "public-alert-track:invalid": Budget(queries=0, seconds=0.1),
+        "public-alert-page": Budget(queries=2, seconds=0.5),
+        "public-alert-page:warm": Budget(queries=0, seconds=0.05),
+        "test-alert": Budget(queries=0, seconds=0.5),
+        "dynamic-manifest": Budget(queries=0, seconds=0.1),
+        "dynamic-manifest:not-modified": Budget(queries=0, seconds=0.1),
+        "sms-status-callback": Budget(queries=0, seconds=0.1),
+        "sms-status-callback:forbidden": Budget(queries=0, seconds=0.1),
+        "contact-list": Budget(queries=2, seconds=0.3),
+        "contact-list:create": Budget(queries=6, seconds=0.3),
+        "contact-import": Budget(queries=7, seconds=0.3),
+        "contact-detail": Budget(queries=2, seconds=0.3),
+        "contact-detail:update": Budget(queries=4, seconds=0.3),
+        "contact-detail:delete": Budget(queries=6, seconds=0.3),
+        "alert_page": Budget(queries=0, seconds=0.5),
+        "get_csrf": Budget(queries=0, seconds=0.1),
+        "public-alert-status": Budget(queries=2, seconds=0.3),
+        "public-alert-status:warm": Budget(queries=0, seconds=0.1),
+        "public-alert-status:not-modified": Budget(queries=0, seconds=0.1),
+        "public-alert-status:throttled": Budget(queries=0, seconds=0.1),
+        "public-alert:throttled": Budget(queries=0, seconds=0.1),
+        "public-alert:invalid": Budget(queries=0, seconds=0.1),
+    }
+
+    def test_trigger_alert(self):
+        self.authenticate(self.user)
+        response = self.assertWithinBudget("trigger-alert", "post", "/api/emergency/trigger/", data={"message": "help"})
+        self.assertEqual(response.json()["queued_sends"], 3)
+
+    def test_trigger_alert_repeats(self):
+        self.authenticate(self.user)
+        first = self.client.post("/api/emergency/trigger/", data={"message": "help"}, HTTP_IDEMPOTENCY_KEY="press-1")
+        response = self.assertWithinBudget(
+            "trigger-alert:repeat", "post", "/api/emergency/trigger/", data={"message": "help"},
+            HTTP_IDEMPOTENCY_KEY="press-2",
+        )
+        self.assertEqual(response.json()["id"], first.json()["id"])
+        self.assertEqual(EmergencyAlert.objects.count(), 1)
+        self.assertEqual(AlertDelivery.objects.count(), 3)
+
+    @override_settings(ALERT_DELIVERY_MODE="inline")
+    def test_trigger_alert_inline(self):
+        self.authenticate(self.user)
+        # Numbers were normalized when the contacts were saved; sending parses none
+        with mock.patch("phonenumbers.parse", side_effect=AssertionError("phone parsed on the send path")):
+            response = self.assertWithinBudget(
+                "trigger-alert:inline", "post", "/api/emergency/trigger/", data={"message": "help"}
+            )
+        self.assertEqual(response.json()["successful_sends"], 3)
+        self.assertEqual(len(self.gateway.sent), 3)
+
+    def test_alert_list(self):
+        EmergencyAlert.objects.bulk_create([
+            EmergencyAlert(user=self.user, message=f"alert {i}", is_test=i % 5 == 0) for i in range(25)
+        ])
+        self.authenticate(self.user)
+
+        seen = []
+        response = self.assertWithinBudget("alert-list", "get", "/api/emergency/alerts/?limit=10")
+        while True:
+            page = response.json()
+            seen += [alert["id"] for alert in page["results"]]
+            if not page["next"]:
+                break
+            # Later pages cost the same as the first
+            response = self.assertWithinBudget("alert-list:deep", "get", page["next"])
+
+        expected = list(EmergencyAlert.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_alert_list_filters_and_fields(self):
+        EmergencyAlert.objects.bulk_create([
+            EmergencyAlert(user=self.user, message=f"alert {i}", is_test=i % 2 == 0) for i in range(6)
+        ])
+        self.authenticate(self.user)
+
+        response = self.assertWithinBudget(
+            "alert-list", "get", "/api/emergency/alerts/?is_test=false&since=2000-01-01&fields=id,is_test"
+        )
+        results = response.json()["results"]
+        self.assertEqual(len(results), 3)
+        self.assertEqual({tuple(alert) for alert in results}, {("id", "is_test")})
+
+        self.assertEqual(self.client.get("/api/emergency/alerts/?fields=password").status_code, 400)
+        self.assertEqual(self.client.get("/api/emergency/alerts/?cursor=nonsense").status_code, 400)
+
+    def test_alert_export(self):
+        EmergencyAlert.objects.bulk_create([
+            EmergencyAlert(user=self.user, message=f"alert {i}", is_test=i % 2 == 0) for i in range(5)
+        ] + [EmergencyAlert(user=self.user, message="=HYPERLINK(\"x\")", location="-23.5,-46.6")])
+        bob = User.objects.create_user(username="bob", email="bob@example.com", password="pw")
+        EmergencyAlert.objects.create(user=bob, message="not mine")
+        self.authenticate(self.user)
+
+        # Rows are read while the body streams, in one server-side cursor query
+        response = self.assertWithinBudget("alert-export", "get", "/api/emergency/alerts/export.ndjson")
+        self.assertTrue(response.streaming)
+        with self.assertNumQueries(1):
+            lines = b"".join(response.streaming_content).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row["id"] for row in rows], list(
+            EmergencyAlert.objects.filter(user=self.user).order_by("created_at", "id").values_list("id", flat=True)
+        ))
+
+        response = self.assertWithinBudget(
+            "alert-export", "get", "/api/emergency/alerts/export.csv?is_test=false", HTTP_ACCEPT="text/csv"
+        )
+        self.assertIn("attachment;", response["Content-Disposition"])
+        rows = list(csv.reader(b"".join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], ["id", "created_at", "message", "location", "is_test"])
+        self.assertEqual(len(rows), 1 + 3)
+        # Formula-looking text is defused, negative coordinates are not
+        self.assertEqual(rows[-1][2:4], ["'=HYPERLINK(\"x\")", "-23.5,-46.6"])
+        self.assertEqual(_csv_cell("-1+cmd|' /C calc'!A0"), "'-1+cmd|' /C calc'!A0")
+        self.assertEqual(_csv_cell("-2.5"), "-2.5")
+
+        self.assertEqual(self.client.get("/api/emergency/alerts/export.xml").status_code, 404)
+        self.assertEqual(self.client.get("/api/emergency/alerts/export.csv?since=soon").status_code, 400)
+
+    def test_track_export(self):
+        alerts = [EmergencyAlert.objects.create(user=self.user) for _ in range(2)]
+        LocationFix.objects.bulk_create([
+            LocationFix(alert=alert, latitude=38.7 + i / 1000, longitude=-9.1) for alert in alerts for i in range(3)
+        ])
+        bob = User.objects.create_user(username="bob", email="bob@example.com", password="pw")
+        LocationFix.objects.create(alert=EmergencyAlert.objects.create(user=bob), latitude=0, longitude=0)
+        self.authenticate(self.user)
+
+        response = self.assertWithinBudget("track-export", "get", "/api/emergency/alerts/tracks/export.csv")
+        with self.assertNumQueries(1):
+            rows = list(csv.reader(b"".join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], ["alert_id", "recorded_at", "latitude", "longitude", "accuracy"])
+        self.assertEqual(len(rows), 1 + 6)
+
+        response = self.assertWithinBudget(
+            "track-export", "get", f"/api/emergency/alerts/tracks/export.ndjson?alert={alerts[1].id}"
+        )
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual({row["alert_id"] for row in rows}, {alerts[1].id})
+        self.assertEqual([row["latitude"] for row in rows], [38.7 + i / 1000 for i in range(3)])
+
+    def test_public_alert(self):
+        response = self.trigger_public_alert()
+        self.assertEqual(response.json()["queued_sends"], 3)
+        self.assertEqual(AlertDelivery.objects.filter(alert_id=response.json()["alert_id"]).count(), 3)
+
+        # Second alert (past the debounce window): the token snapshot is cached
+        with self.settings(ALERT_DEBOUNCE_SECONDS=0):
+            warm = self.trigger_public_alert("public-alert:warm")
+        self.assertNotEqual(warm.json()["alert_id"], response.json()["alert_id"])
+
+    def test_public_alert_repeats(self):
+        self.check_repeat_triggers()
+
+    def test_public_alert_retry_after_failure(self):
+        # A failed alert releases its claim, so the retry is sent rather than replayed
+        with mock.patch("emergency.views.public_views.enqueue_alert", side_effect=RuntimeError("db down")):
+            self.trigger_public_alert(expected_status=500, HTTP_IDEMPOTENCY_KEY="tap-1")
+        self.assertEqual(self.trigger_public_alert(HTTP_IDEMPOTENCY_KEY="tap-1").json()["queued_sends"], 3)
+
+    def test_public_alert_repeat_in_flight(self):
+        resolve_token(self.token)
+        self.assertIsNone(TriggerGuard("public", self.user.pk).claim())
+        response = self.trigger_public_alert("public-alert:repeat", expected_status=409)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertFalse(EmergencyAlert.objects.exists())
+
+    def test_public_alert_claim_expires_before_response(self):
+        guard = TriggerGuard("public", self.user.pk, "tap-1")
+        with mock.patch.object(cache, "add", wraps=cache.add) as add, mock.patch.object(cache, "set") as set_:
+            guard.claim()
+            # A request that never finishes only holds its key for ALERT_CLAIM_TTL...
+            self.assertEqual([call.kwargs["timeout"] for call in add.call_args_list], [
+                settings.ALERT_CLAIM_TTL, min(settings.ALERT_DEBOUNCE_SECONDS, settings.ALERT_CLAIM_TTL)
+            ])
+            # ...and a finished one is remembered for the key's full lifetime
+            guard.remember(200, {"alert_id": 1})
+            self.assertEqual([call.kwargs["timeout"] for call in set_.call_args_list], [
+                settings.ALERT_IDEMPOTENCY_TTL, settings.ALERT_DEBOUNCE_SECONDS
+            ])
+
+    def test_dispatch_past_deadline_is_unknown(self):
+        self.gateway.latency = 0.2
+        result, = dispatch_messages([("+351913016860", "help")], deadline=0.01)
+        # The send carries on in its thread and may still be delivered: neither sent nor failed
+        self.assertEqual(result.status, "unknown")
+        self.assertFalse(result.ok)
+
+    def test_late_send_sid_recorded(self):
+        self.trigger_public_alert()
+        self.gateway.latency = 0.2
+        with self.settings(ALERT_DISPATCH_DEADLINE=0.01):
+            self.assertEqual(process_batch(), 3)
+        self.assertEqual(set(AlertDeliveryJob.objects.values_list("status", flat=True)), {"unknown"})
+
+        # The sends finish after the deadline and report their sids
+        started = time.monotonic()
+        while len(late_send_buffer) < 3 and time.monotonic() - started < 1:
+            time.sleep(0.01)
+        late_send_buffer.flush()
+
+        sids = {to: sid for to, _, sid in self.gateway.sent}
+        for job in AlertDeliveryJob.objects.select_related("delivery"):
+            self.assertEqual(job.status, "sent")
+            self.assertEqual(job.provider_sid, sids[job.to_number])
+            self.assertEqual((job.delivery.status, job.delivery.provider_sid), ("sent", sids[job.to_number]))
+
+    def test_public_alert_continuous_tracking(self):
+        alert_id = self.trigger_public_alert().json()["alert_id"]
+        for i in range(5):
+            self.trigger_public_alert("public-alert:continuous", location=f"38.70{i},-9.1", continuous=True)
+
+        location_fix_buffer.flush()
+        self.assertEqual(LocationFix.objects.filter(alert_id=alert_id).count(), 5)
+
+    def test_track_upload(self):
+        alert_id = self.trigger_public_alert().json()["alert_id"]
+        start = int(time.time() * 1000)
+        rows = [[start, 38700000, -9100000, 12]] + [[1000, 5, -3, 10]] * 20
+        response = self.assertWithinBudget(
+            "public-alert-track", "post", f"/api/emergency/public/{self.token}/track/",
+            data={"fixes": rows}, format="json",
+        )
+        self.assertEqual(response.json()["accepted"], 21)
+
+        location_fix_buffer.flush()
+        self.assertEqual(LocationFix.objects.filter(alert_id=alert_id).count(), 21)
+
+    def test_track_upload_invalid(self):
+        path = f"/api/emergency/public/{self.token}/track/"
+        start = int(time.time() * 1000)
+        for body in (
+            [[start, 38700000, -9100000]],
+            {"fixes": [[1e20, 38700000, -9100000]]},
+            {"fixes": [[-start, 38700000, -9100000]]},
+            {"fixes": [[start, 10**400, -9100000]]},
+            {"fixes": [[start, 38700000, -9100000, -5]]},
+            {"fixes": [[start, 91000000, -9100000]]},
+            {"fixes": [[start, 38700000, -9100000], {"t": 1}]},
+        ):
+            self.assertWithinBudget("public-alert-track:invalid", "post", path, 400, data=body, format="json")
+
+    def test_public_alert_page(self):
+        response = self.assertWithinBudget("public-alert-page", "get", f"/api/emergency/public-page/{self.token}/")
+        # Lets the service worker cache this page as the offline shell
+        self.assertEqual(response["X-Alert-Shell"], "1")
+
+    def test_public_alert_page_cached(self):
+        path = f"/api/emergency/public-page/{self.token}/"
+        html = self.client.get(path).content
+
+        with mock.patch("emergency.page_cache.render_to_string", side_effect=AssertionError("page re-rendered")):
+            response = self.assertWithinBudget("public-alert-page:warm", "get", path)
+        self.assertEqual(response.content, html)
+        self.assertEqual(response["X-Alert-Shell"], "1")
+        # Every visitor still gets a CSRF cookie for the alert POST
+        self.assertIn("csrftoken", response.cookies)
+
+        # A name change rebuilds the snapshot and so renders the page afresh
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = "Alice"
+            self.user.save()
+        with mock.patch("emergency.page_cache.render_to_string", return_value="<html></html>") as rendered:
+            self.client.get(path)
+        rendered.assert_called_once()
+        self.assertEqual(rendered.call_args.args[1]["display_name"], "Alice")
+
+    def test_test_alert_page(self):
+        self.assertWithinBudget("test-alert", "get", f"/api/emergency/test/{self.token}/")
+
+    def test_dynamic_manifest(self):
+        path = f"/api/emergency/manifest/{self.token}.json"
+        response = self.assertWithinBudget("dynamic-manifest", "get", path)
+        self.assertEqual(response["Content-Type"], "application/manifest+json")
+        self.assertIn("public", response["Cache-Control"])
+
+        response = self.assertWithinBudget(
+            "dynamic-manifest:not-modified", "get", path, expected_status=304, HTTP_IF_NONE_MATCH=response["ETag"],
+        )
+        self.assertIn("max-age=", response["Cache-Control"])
+
+    def status_callback(self, params, auth_token="twilio_test", signature=None):
+        """Request kwargs for a status callback, signed the way Twilio signs it."""
+        if signature is None:
+            signature = RequestValidator(auth_token).compute_signature(
+                "http://testserver/api/emergency/sms/status/", params,
+            )
+        return {
+            "data": urlencode(params),
+            "content_type": "application/x-www-form-urlencoded",
+            "HTTP_X_TWILIO_SIGNATURE": signature,
+        }
+
+    @override_settings(ALERT_DELIVERY_MODE="inline")
+    def test_sms_status_callback(self):
+        self.trigger_public_alert("public-alert:inline")
+        for delivery in AlertDelivery.objects.all():
+            self.assertWithinBudget(
+                "sms-status-callback", "post", "/api/emergency/sms/status/", expected_status=204,
+                **self.status_callback({"MessageSid": delivery.provider_sid, "MessageStatus": "delivered"}),
+            )
+
+        delivery_status_buffer.flush()
+        self.assertEqual(set(AlertDelivery.objects.values_list("status", flat=True)), {"delivered"})
+
+    @override_settings(ALERT_DELIVERY_MODE="inline")
+    def test_sms_status_callback_rejects_bad_signatures(self):
+        self.trigger_public_alert("public-alert:inline")
+        delivery = AlertDelivery.objects.first()
+        params = {"MessageSid": delivery.provider_sid, "MessageStatus": "failed"}
+        signature = self.status_callback(params)["HTTP_X_TWILIO_SIGNATURE"]
+
+        # Unsigned, signed with another token, and a valid signature replayed over altered fields
+        for kwargs in (
+            self.status_callback(params, signature=""),
+            self.status_callback(params, auth_token="someone_else"),
+            self.status_callback({**params, "MessageStatus": "delivered"}, signature=signature),
+        ):
+            self.assertWithinBudget(
+                "sms-status-callback:forbidden", "post", "/api/emergency/sms/status/", expected_status=403, **kwargs,
+            )
+
+        # Validation on but no token to check against: refuse rather than trust anyone
+        with override_settings(TWILIO_AUTH_TOKEN=""), self.assertLogs("emergency.views.callback_views", "ERROR"):
+            self.assertWithinBudget(
+                "sms-status-callback:forbidden", "post", "/api/emergency/sms/status/", expected_status=403,
+                **self.status_callback(params),
+            )
+
+        # Callbacks for the fallback account are signed with its own token
+        with override_settings(SMS_GATEWAY_FALLBACK_OPTIONS={"auth_token": "twilio_fallback"}):
+            self.assertWithinBudget(
+                "sms-status-callback", "post", "/api/emergency/sms/status/", expected_status=204,
+                **self.status_callback(params, auth_token="twilio_fallback"),
+            )
+
+        delivery_status_buffer.flush()
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.status, "failed")
+
+    def fake_dispatch(self, status):
+        depths = []
+
+        def dispatch(messages, on_late=None):
+            depths.append(len(connection.atomic_blocks))
+            return [
+                DeliveryResult(to=to, status=status, sid=f"SM{i}" if status == "sent" else None)
+                for i, (to, _) in enumerate(messages)
+            ]
+        return mock.patch("emergency.outbox.dispatch_messages", side_effect=dispatch), depths
+
+    def test_delivery_worker_sends_outside_transaction(self):
+        self.trigger_public_alert()
+        patch, depths = self.fake_dispatch("sent")
+        with patch:
+            self.assertEqual(process_batch(), 3)
+        # The claim committed before the fan-out: no transaction (or row lock) is open around it
+        self.assertEqual(depths, [len(connection.atomic_blocks)])
+        self.assertEqual(set(AlertDelivery.objects.values_list("status", flat=True)), {"sent"})
+
+    def test_delivery_worker_reclaims_expired_lease(self):
+        self.trigger_public_alert()
+        AlertDeliveryJob.objects.update(status="sending", available_at=timezone.now() - timedelta(seconds=1))
+        patch, _ = self.fake_dispatch("sent")
+        with patch:
+            self.assertEqual(process_batch(), 3)
+        self.assertEqual(set(AlertDeliveryJob.objects.values_list("status", flat=True)), {"sent"})
+
+    def test_unknown_delivery_settled_by_sid_only(self):
+        self.trigger_public_alert()
+        patch, _ = self.fake_dispatch("unknown")
+        with patch:
+            process_batch()
+            # May still be delivered: never resent
+            self.assertEqual(process_batch(), 0)
+        jobs = list(AlertDeliveryJob.objects.order_by("id"))
+        self.assertEqual({job.status for job in jobs}, {"unknown"})
+
+        def callback(sid, to):
+            response = self.client.post(
+                "/api/emergency/sms/status/",
+                **self.status_callback({"MessageSid": sid, "MessageStatus": "delivered", "To": to}),
+            )
+            self.assertEqual(response.status_code, 204)
+
+        # Delivery reports can beat the late send's own result; a sid we never sent matches nothing
+        for i, job in enumerate(jobs):
+            callback(f"SMlate{i}", job.to_number)
+        callback("SMstray", jobs[0].to_number)
+        delivery_status_buffer.flush()
+        self.assertEqual(set(AlertDelivery.objects.values_list("provider_sid", flat=True)), {""})
+
+        for i, job in enumerate(jobs):
+            late_send_buffer.add_result(job.pk, DeliveryResult(to=job.to_number, status="sent", sid=f"SMlate{i}"))
+        late_send_buffer.flush()
+        for _ in range(delivery_status_buffer.MAX_UNMATCHED_FLUSHES):
+            delivery_status_buffer.flush()
+
+        self.assertEqual(
+            list(AlertDelivery.objects.order_by("id").values_list("status", "provider_sid")),
+            [("delivered", f"SMlate{i}") for i in range(3)],
+        )
+        self.assertEqual(set(AlertDeliveryJob.objects.values_list("status", flat=True)), {"sent"})
+        self.assertEqual(len(delivery_status_buffer), 0)
+
+    def test_contact_list(self):
+        self.authenticate(self.user)
+        response = self.assertWithinBudget("contact-list", "get", "/api/emergency/contacts/")
+        self.assertEqual(len(response.json()), 3)
+
+    def test_contact_create(self):
+        self.authenticate(self.user)
+        self.assertWithinBudget(
+            "contact-list:create", "post", "/api/emergency/contacts/", expected_status=201,
+            data={"name": "New", "phone_number": "+351 913 016 869"}, format="json",
+        )
+        contact = Contact.objects.get(user=self.user, name="New")
+        self.assertEqual((contact.phone_e164, contact.phone_region), ("+351913016869", "PT"))
+
+        # Duplicates are found on the canonical number, however they were typed
+        response = self.client.post(
+            "/api/emergency/contacts/", {"name": "Again", "phone_number": "+351-913-016-869"}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_contact_import(self):
+        self.authenticate(self.user)
+        self.assertEqual(resolve_token(self.token).contact_count, 3)
+
+        upload = SimpleUploadedFile("contacts.csv", (
+            "Name;Phone;Relationship\n"
+            "Mum;912 345 678;mother\n"  # local number, read as PT
+            "Dup;+351913016860;\n"  # already a contact
+            "Broken;12345;\n"
+            "Mum again;+351912345678;\n"  # repeated in the file
+        ).encode())
+        response = self.assertWithinBudget(
+            "contact-import", "post", "/api/emergency/contacts/import/", expected_status=201, data={"file": upload},
+        )
+        self.assertEqual(response.json(), {
+            "created": 1,
+            "duplicates": [2, 4],
+            "errors": [{"row": 3, "field": "phone_number", "message": "Not a valid phone number."}],
+        })
+        self.assertTrue(Contact.objects.filter(user=self.user, name="Mum", phone_number="+351912345678").exists())
+        # bulk_create skips the Contact signals; the import drops the token snapshot itself
+        self.assertEqual(resolve_token(self.token).contact_count, 4)
+
+        vcard = SimpleUploadedFile("family.vcf", (
+            "BEGIN:VCARD\r\nVERSION:3.0\r\nN:Silva;Ana;;;\r\n"
+            "TEL;TYPE=HOME:+351213000000\r\nTEL;TYPE=CELL:+351 96 123\r\n 4567\r\nEND:VCARD\r\n"
+        ).encode())
+        response = self.assertWithinBudget(
+            "contact-import", "post", "/api/emergency/contacts/import/", expected_status=201, data={"file": vcard},
+        )
+        self.assertEqual(response.json()["created"], 1)
+        self.assertTrue(Contact.objects.filter(user=self.user, name="Ana Silva", phone_number="+351961234567").exists())
+
+        # Past the plan's limit nothing is imported
+        limit = self.user.entitlement.contact_limit
+        rows = [{"name": f"Friend {i}", "phone_number": f"+3519300000{i:02d}"} for i in range(limit)]
+        response = self.client.post("/api/emergency/contacts/import/", rows, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("CONTACT_LIMIT_REACHED", response.json()[0])
+        self.assertEqual(Contact.objects.filter(user=self.user).count(), 5)
+
+        response = self.client.post("/api/emergency/contacts/import/", {"contacts": "nope"}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_contact_detail(self):
+        self.authenticate(self.user)
+        path = f"/api/emergency/contacts/{self.contacts[0].pk}/"
+        self.assertWithinBudget("contact-detail", "get", path)
+        self.assertWithinBudget("contact-detail:update", "patch", path, data={"name": "Renamed"}, format="json")
+        self.assertWithinBudget("contact-detail:delete", "delete", path, expected_status=204)
+
+    @unittest.expectedFailure  # emergency/alert_page.html is not in the tree
+    def test_alert_page(self):
+        self.assertWithinBudget("alert_page", "get", "/api/emergency/alert-page/")
+
+    def test_csrf(self):
+        self.assertWithinBudget("get_csrf", "get", "/api/emergency/csrf/")
+
+    def test_public_alert_status(self):
+        path = f"/api/emergency/public/{self.token}/test-connection/"
+        self.assertWithinBudget("public-alert-status", "get", path)
+        self.assertWithinBudget("public-alert-status:warm", "get", path)
+        self.check_status_revalidation(path)
+        self.assertFalse(EmergencyAlert.objects.exists())
+
+    def test_public_throttling(self):
+        self.check_throttling()
+
+    def test_test_trigger_throttling(self):
+        self.check_test_trigger_throttling()
+
+    def test_public_alert_malformed_body(self):
+        self.check_malformed_body()
+
+    def test_public_throttling_per_ip(self):
+        rates = {**settings.PUBLIC_THROTTLE_RATES, "status": (None, "3/min")}
+        with self.settings(PUBLIC_THROTTLE_RATES=rates), mock.patch("services.throttle.time.time", return_value=1000.0) as now:
+            # Rotating tokens doesn't get a scraper a fresh bucket
+            for _ in range(3):
+                self.client.get(f"/api/emergency/public/{uuid.uuid4()}/test-connection/")
+            response = self.client.get(f"/api/emergency/public/{self.token}/test-connection/")
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response["Retry-After"], "20")
+
+            # One token comes back every 20s; being refused spent none
+            now.return_value = 1020.0
+            self.assertEqual(self.client.get(f"/api/emergency/public/{self.token}/test-connection/").status_code, 200)
+            self.assertEqual(self.client.get(f"/api/emergency/public/{self.token}/test-connection/").status_code, 429)
+
+    def test_deploy_check_requires_shared_cache(self):
+        self.assertEqual([error.id for error in check_shared_cache(None)], ["emergency.E001"])
+        redis = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://cache"}}
+        with self.settings(CACHES=redis):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_metrics_require_token(self):
+        with self.settings(METRICS_AUTH_TOKEN=""):
+            with self.assertLogs("services.metrics", "ERROR"):
+                self.assertEqual(self.client.get("/metrics").status_code, 403)
+            with self.settings(DEBUG=True):
+                self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+        with self.settings(METRICS_AUTH_TOKEN="scrape"):
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer other").status_code, 403)
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer scrape").status_code, 200)
+
+    def test_deploy_check_requires_metrics_token(self):
+        with self.settings(METRICS_AUTH_TOKEN=""):
+            self.assertEqual([error.id for error in check_metrics_token(None)], ["emergency.E002"])
+        with self.settings(METRICS_AUTH_TOKEN="scrape"):
+            self.assertEqual(check_metrics_token(None), [])
+
+    def test_public_throttling_fails_open(self):
+        with mock.patch("services.throttle.cache.incr", side_effect=ConnectionError("cache down")):
+            self.assertWithinBudget("public-alert-status", "get", f"/api/emergency/public/{self.token}/test-connection/")
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncEmergencyQueryBudgetTests(AlertFixtures, testing.QueryBudgetTestCase):
+    """The async views served under SERVER_MODE=asgi, held to the same budgets as their sync twins."""
+    urlpatterns = async_urlpatterns
+    budgets = {
+        "public-alert": Budget(queries=9, seconds=0.5),
+        "public-alert:warm": Budget(queries=7, seconds=0.5),
+        "public-alert:repeat": Budget(queries=0, seconds=0.1),
+        "public-alert:inline": Budget(queries=13, seconds=0.5),
+        "public-alert:continuous": Budget(queries=0, seconds=0.1),
+        "public-alert-status": Budget(queries=2, seconds=0.3),
+        "public-alert-status:warm": Budget(queries=0, seconds=0.1),
+        "public-alert-status:not-modified": Budget(queries=0, seconds=0.1),
+        "public-alert-status:throttled": Budget(queries=0, seconds=0.1),
+        "public-alert:throttled": Budget(queries=0, seconds=0.1),
+        "public-alert:invalid": Budget(queries=0, seconds=0.1),
+    }
+
+    def test_public_alert(self):
+        response = self.trigger_public_alert()
+        self.assertEqual(response.json()["queued_sends"], 3)
+        self.assertEqual(AlertDelivery.objects.filter(alert_id=response.json()["alert_id"]).count(), 3)
+        with self.settings(ALERT_DEBOUNCE_SECONDS=0):
+            warm = self.trigger_public_alert("public-alert:warm")
+        self.assertNotEqual(warm.json()["alert_id"], response.json()["alert_id"])
+
+    def test_public_alert_repeats(self):
+        self.check_repeat_triggers()
+
+    @override_settings(ALERT_DELIVERY_MODE="inline")
+    def test_public_alert_inline(self):
+        response = self.trigger_public_alert("public-alert:inline")
+        self.assertEqual(response.json()["successful_sends"], 3)
+        self.assertEqual(len(self.gateway.sent), 3)
+        self.assertEqual(set(AlertDelivery.objects.values_list("status", flat=True)), {"sent"})
+
+    def test_public_alert_continuous_tracking(self):
+        alert_id = self.trigger_public_alert().json()["alert_id"]
+        for i in range(5):
+            self.trigger_public_alert("public-alert:continuous", location=f"38.70{i},-9.1", continuous=True)
+
+        location_fix_buffer.flush()
+        self.assertEqual(LocationFix.objects.filter(alert_id=alert_id).count(), 5)
+
+    def test_public_alert_status(self):
+        path = f"/api/emergency/public/{self.token}/test-connection/"
+        self.assertWithinBudget("public-alert-status", "get", path)
+        self.assertWithinBudget("public-alert-status:warm", "get", path)
+        self.check_status_revalidation(path)
+
+    def test_public_throttling(self):
+        self.check_throttling()
+
+    def test_test_trigger_throttling(self):
+        self.check_test_trigger_throttling()
+
+    def test_public_alert_malformed_body(self):
+        self.check_malformed_body()
+
+
+class ScriptedGateway(SMSGateway):
+    """Raises (or returns) the next item of `outcomes` on each send."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def send(self, to, body, deadline=None):
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else "SMok"
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@override_settings(SMS_RETRY_MAX_ATTEMPTS=3, SMS_RETRY_BASE_DELAY=0, SMS_BREAKER_FAILURE_THRESHOLD=2, SMS_BREAKER_RESET_TIMEOUT=30)
+class SMSResilienceTests(SimpleTestCase):
+    """Retry, circuit breaker and failover behaviour of services/sms_gateway.ResilientGateway."""
+
+    def transient(self):
+        return SMSGatewayError("503 from provider", retryable=True)
+
+    def test_breaker_opens_after_threshold(self):
+        breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30)
+        for _ in range(2):
+            breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+
+    def test_breaker_half_open_recovery(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+        with mock.patch("services.resilience.time.monotonic", return_value=100.0):
+            breaker.record_failure()
+        with mock.patch("services.resilience.time.monotonic", return_value=131.0):
+            self.assertEqual(breaker.state, "half-open")
+            # One trial call at a time
+            self.assertTrue(breaker.allow())
+            self.assertFalse(breaker.allow())
+            breaker.record_success()
+            self.assertEqual(breaker.state, "closed")
+
+    def test_breaker_failed_trial_reopens(self):
+        breaker = CircuitBreaker("test", failure_threshold=5, reset_timeout=30)
+        with mock.patch("services.resilience.time.monotonic", return_value=100.0):
+            for _ in range(5):
+                breaker.record_failure()
+        with mock.patch("services.resilience.time.monotonic", return_value=131.0):
+            self.assertTrue(breaker.allow())
+            breaker.record_failure()
+            self.assertEqual(breaker.state, "open")
+
+    def test_retries_transient_errors(self):
+        primary = ScriptedGateway(self.transient(), self.transient(), "SM1")
+        self.assertEqual(ResilientGateway(primary).send("+351910000001", "hi"), "SM1")
+        self.assertEqual(primary.calls, 3)
+
+    def test_does_not_retry_non_retryable_errors(self):
+        primary = ScriptedGateway(SMSGatewayError("21211 invalid 'To' number"))
+        gateway = ResilientGateway(primary)
+        with self.assertRaises(SMSGatewayError):
+            gateway.send("+351910000001", "hi")
+        self.assertEqual(primary.calls, 1)
+        # A bad request is the caller's fault, not the provider's: the breaker stays closed
+        self.assertEqual(gateway.routes[0][1].state, "closed")
+
+    def test_gives_up_at_deadline(self):
+        primary = ScriptedGateway(*[self.transient()] * 3)
+        with self.settings(SMS_RETRY_BASE_DELAY=1, SMS_RETRY_MAX_DELAY=1), \
+                mock.patch("services.resilience.random.uniform", return_value=1), \
+                mock.patch("services.resilience.time.sleep") as sleep:
+            with self.assertRaises(SMSGatewayError):
+                ResilientGateway(primary).send("+351910000001", "hi", deadline=time.monotonic() + 0.5)
+        self.assertEqual(primary.calls, 1)
+        sleep.assert_not_called()
+
+    def test_fails_over_to_fallback(self):
+        primary = ScriptedGateway(*[self.transient()] * 3)
+        fallback = ScriptedGateway("SMfallback")
+        gateway = ResilientGateway(primary, fallback)
+        self.assertEqual(gateway.send("+351910000001", "hi"), "SMfallback")
+        self.assertEqual(primary.calls, 3)
+
+        # Once the primary's breaker opens, sends skip it entirely
+        primary.outcomes = [self.transient()] * 3
+        gateway.send("+351910000001", "hi")
+        self.assertEqual(gateway.routes[0][1].state, "open")
+        calls = primary.calls
+        self.assertEqual(gateway.send("+351910000001", "hi"), "SMok")
+        self.assertEqual(primary.calls, calls)
+        self.assertEqual(fallback.calls, 3)
+
+    def test_fails_fast_when_every_breaker_is_open(self):
+        gateway = ResilientGateway(ScriptedGateway())
+        for _ in range(2):
+            gateway.routes[0][1].record_failure()
+        with self.assertRaises(CircuitOpenError):
+            gateway.send("+351910000001", "hi")
+
+    def test_async_fails_over_to_fallback(self):
+        primary = ScriptedGateway(*[self.transient()] * 3)
+        fallback = ScriptedGateway("SMfallback")
+        sid = async_to_sync(ResilientGateway(primary, fallback).asend)("+351910000001", "hi")
+        self.assertEqual(sid, "SMfallback")
+        self.assertEqual(primary.calls, 3)
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from emergency.models import EmergencyAlert
+
+NO_ACTIVE_ALERT = 0
+
+
+def _cache_key(token):
+    return f"emergency:active-alert:{token}"
+
+
+def parse_location(value):
+    """Parse a "lat,lon" string into floats; raises ValueError when malformed."""
+    lat, lon = (float(part) for part in str(value).split(",", 1))
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("Coordinates out of range")
+    return lat, lon
+
+
+def remember_active_alert(token, alert):
+    """Called when a location-sharing alert commits, so its fixes skip the DB lookup."""
+    cache.set(_cache_key(token), alert.id, timeout=settings.ALERT_TRACKING_WINDOW)
+
+
+def _active_alert_query(token):
+    since = timezone.now() - timedelta(seconds=settings.ALERT_TRACKING_WINDOW)
+    return (
+        EmergencyAlert.objects
+        .filter(user__profile__token=token, is_test=False, location__isnull=False, created_at__gte=since)
+        .order_by("-created_at")
+        .values_list("id", flat=True)
+    )
+
+
+def _cache_timeout(alert_id):
+    return 60 if alert_id == NO_ACTIVE_ALERT else settings.ALERT_TRACKING_WINDOW
+
+
+def get_active_alert_id(token):
+    """
+    Alert id that continuous fixes for `token` belong to, or None.
+    Only real alerts that kept a location (premium) within the tracking
+    window qualify. Misses are cached too, so idle tokens stay cheap.
+    """
+    alert_id = cache.get(_cache_key(token))
+    if alert_id is None:
+        alert_id = _active_alert_query(token).first() or NO_ACTIVE_ALERT
+        cache.set(_cache_key(token), alert_id, timeout=_cache_timeout(alert_id))
+    return alert_id or None
+
+
+async def aget_active_alert_id(token):
+    """Async get_active_alert_id."""
+    alert_id = await cache.aget(_cache_key(token))
+    if alert_id is None:
+        alert_id = await _active_alert_query(token).afirst() or NO_ACTIVE_ALERT
+        await cache.aset(_cache_key(token), alert_id, timeout=_cache_timeout(alert_id))
+    return alert_id or None
+
+
+def decode_track(rows, max_fixes=None):
+    """
+    Decode a compact track upload.
+
+    Each row is `[t, lat, lon]` or `[t, lat, lon, accuracy]`: `t` in epoch
+    milliseconds, coordinates in integer microdegrees, accuracy in metres.
+    The first row is absolute and every later row holds the difference from
+    the row before it (accuracy is never delta-encoded), so a slow walk
+    costs a few bytes per fix.
+
+    Returns a list of (recorded_at, latitude, longitude, accuracy); raises
+    ValueError on malformed input.
+    """
+    max_fixes = max_fixes or settings.TRACK_UPLOAD_MAX_FIXES
+    if not isinstance(rows, list) or not rows or len(rows) > max_fixes:
+        raise ValueError("Expected between 1 and %d fixes" % max_fixes)
+
+    latest = timezone.now() + timedelta(minutes=5)
+    latest_ms = latest.timestamp() * 1000
+    t = lat = lon = 0
+    fixes = []
+    for row in rows:
+        if not isinstance(row, list) or len(row) not in (3, 4):
+            raise ValueError("Malformed fix")
+        try:
+            dt, dlat, dlon = (int(value) for value in row[:3])
+            accuracy = float(row[3]) if len(row) == 4 and row[3] is not None else None
+        except OverflowError:
+            # int(float("inf"))
+            raise ValueError("Malformed fix")
+        t, lat, lon = t + dt, lat + dlat, lon + dlon
+        # Range checks run on the integers, before any float or datetime conversion can overflow
+        if not (-90_000_000 <= lat <= 90_000_000 and -180_000_000 <= lon <= 180_000_000):
+            raise ValueError("Coordinates out of range")
+        if t < 0:
+            raise ValueError("Fix timestamp out of range")
+        if t > latest_ms:
+            raise ValueError("Fix timestamp is in the future")
+        if accuracy is not None and not 0 <= accuracy < 1e7:
+            raise ValueError("Accuracy out of range")
+        try:
+            recorded_at = datetime.fromtimestamp(t / 1000, tz=dt_timezone.utc)
+        except (OverflowError, OSError):
+            raise ValueError("Fix timestamp out of range")
+        fixes.append((recorded_at, lat / 1e6, lon / 1e6, accuracy))
+    return fixes
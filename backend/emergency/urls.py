@@ -1,21 +1,38 @@
+from django.conf import settings
 from django.urls import path
-from emergency.views.alert_views import TriggerEmergencyAlert
-from emergency.views.contact_views import ContactListCreate, ContactDetail
-from emergency.views.public_views import TriggerPublicAlertView, public_alert_page, test_alert_page
+from emergency.views.alert_views import AlertExport, AlertHistory, TrackExport, TriggerEmergencyAlert
+from emergency.views.contact_views import ContactListCreate, ContactDetail, ContactImport
+from emergency.views.public_views import TriggerPublicAlertView, TrackUploadView, public_alert_page, test_alert_page
 from emergency.views.misc_views import get_csrf_token, alert_page, PublicAlertStatusCheck
+from emergency.views.callback_views import SMSStatusCallbackView
 from emergency.views import public_views
 from .views import dynamic_manifest
 
+if settings.ASYNC_ALERT_VIEWS:
+    # ASGI deployment: the alert and status endpoints don't tie up a thread while waiting on I/O
+    from emergency.views.async_views import (
+        AsyncPublicAlertStatusCheck as PublicAlertStatusCheck,
+        AsyncTriggerPublicAlertView as TriggerPublicAlertView,
+    )
+
 urlpatterns = [
     # Alert endpoints
     path('trigger/', TriggerEmergencyAlert.as_view(), name='trigger-alert'),
+    path('alerts/', AlertHistory.as_view(), name='alert-list'),
+    path('alerts/export.<str:fmt>', AlertExport.as_view(), name='alert-export'),
+    path('alerts/tracks/export.<str:fmt>', TrackExport.as_view(), name='track-export'),
     path('public/<uuid:token>/', TriggerPublicAlertView.as_view(), name='public-alert'),
+    path('public/<uuid:token>/track/', TrackUploadView.as_view(), name='public-alert-track'),
     path('public-page/<uuid:token>/', public_alert_page, name='public-alert-page'),
     path('test/<uuid:token>/', test_alert_page, name='test-alert'),
     path("manifest/<uuid:token>.json", dynamic_manifest, name="dynamic-manifest"),
 
+    # Twilio delivery status callbacks
+    path('sms/status/', SMSStatusCallbackView.as_view(), name='sms-status-callback'),
+
     # Contact endpoints
     path('contacts/', ContactListCreate.as_view(), name='contact-list'),
+    path('contacts/import/', ContactImport.as_view(), name='contact-import'),
     path('contacts/<int:pk>/', ContactDetail.as_view(), name='contact-detail'),
 
     # CSRF and pages
@@ -1,21 +1,19 @@
-from twilio.rest import Client
-import os
+from services.sms_gateway import get_gateway
 
-def send_emergency_message(contact, user, message):
-    account_sid = os.getenv("TWILIO_ACCOUNT_SID")
-    auth_token = os.getenv("TWILIO_AUTH_TOKEN")
-    from_number = os.getenv("TWILIO_PHONE_NUMBER")
+def default_alert_message(user):
+    return f"{user.username} está em emergência. Por favor contacte de imediato."
 
-    client = Client(account_sid, auth_token)
+def send_sms(to, body, deadline=None):
+    """
+    Send one SMS through the process-wide gateway and return its message SID.
+    Errors are raised so callers can record them per recipient.
+    """
+    return get_gateway().send(to, body, deadline=deadline)
 
-    final_message = message or f"{user.username} está em emergência. Por favor contacte de imediato."
+async def asend_sms(to, body, deadline=None):
+    """Async send_sms, for the ASGI views."""
+    return await get_gateway().asend(to, body, deadline=deadline)
 
-    try:
-        client.messages.create(
-            body=final_message,
-            from_=from_number,
-            to=contact.phone_number
-        )
-        print(f"✅ SMS sent to {contact.phone_number}")
-    except Exception as e:
-        print(f"❌ Failed to send SMS to {contact.phone_number}: {str(e)}")
+def send_emergency_message(contact, user, message):
+    final_message = message or default_alert_message(user)
+    return send_sms(contact.phone_e164, final_message)
@@ -1,4 +1,6 @@
 from .alert_views import *
 from .contact_views import *
 from .public_views import *
-from .misc_views import *
\ No newline at end of file
+from .misc_views import *
+from .callback_views import *
+from .async_views import *
@@ -1,11 +1,29 @@
+import hashlib
+from datetime import datetime, time
+from functools import lru_cache
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from rest_framework import status
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework import generics, status
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 
-from emergency.models import EmergencyAlert, Contact
-from emergency.utils import send_emergency_message
-from billing.utils import add_stripe_usage
+from emergency.idempotency import TriggerGuard
+from emergency.exports import ALERT_COLUMNS, FORMATS, TRACK_COLUMNS, alert_rows, streaming_response, track_rows
+from emergency.models import EmergencyAlert, Contact, LocationFix
+from emergency.outbox import enqueue_alert, deliver_jobs, summarize_jobs
+from emergency.pagination import KeysetPagination
+from emergency.serializers import EmergencyAlertSerializer
+from emergency.utils import default_alert_message
+from services.log import bind_alert
+from services.throttle import throttle
 import json
 
 class TriggerEmergencyAlert(APIView):
@@ -21,24 +39,114 @@ class TriggerEmergencyAlert(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
 
+        # A double tap or retry gets the first response back: nothing is sent or billed twice
+        guard = TriggerGuard("trigger", request.user.pk, request.headers.get("Idempotency-Key"))
+        replay = guard.claim()
+        if replay:
+            return Response(replay.data, status=replay.status, headers=replay.headers)
+
         message = request.data.get("message", "")
-        alert = EmergencyAlert.objects.create(user=request.user, message=message)
-        contacts = Contact.objects.filter(user=request.user)
+        try:
+            contacts = list(Contact.objects.filter(user=request.user).sendable())
+
+            inline = settings.ALERT_DELIVERY_MODE == "inline"
+            with transaction.atomic():
+                alert = EmergencyAlert.objects.create(user=request.user, message=message)
+                bind_alert(alert.id)
+                jobs = enqueue_alert(
+                    alert, contacts, message or default_alert_message(request.user), billable=True, claimed=inline
+                )
+            # Sent after the commit: no transaction or row lock is held over the network
+            if inline:
+                deliver_jobs(jobs)
+        except Exception:
+            guard.release()
+            raise
+
+        data = {
+            "status": "alert triggered",
+            "id": alert.id,
+            **summarize_jobs(jobs),
+        }
+        guard.remember(status.HTTP_200_OK, data)
+        return Response(data)
+
+
+
+def _parse_bool(name, value):
+    if value.lower() in ("1", "true"):
+        return True
+    if value.lower() in ("0", "false"):
+        return False
+    raise ValidationError({name: "Use true or false."})
+
 
-        message_count = 0
-        for contact in contacts:
-            send_emergency_message(contact, request.user, message)
-            message_count += 1
+def _parse_moment(name, value):
+    """ISO datetime, or a date meaning its midnight in the current time zone."""
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            moment = day and datetime.combine(day, time.min)
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise ValidationError({name: "Use an ISO 8601 date or datetime."})
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
 
-        add_stripe_usage(request.user, quantity=message_count)
 
-        return Response({"status": "alert triggered", "id": alert.id})
+def filter_alerts(queryset, params):
+    """Apply the is_test / since / until query parameters shared by the history and export endpoints."""
+    if "is_test" in params:
+        queryset = queryset.filter(is_test=_parse_bool("is_test", params["is_test"]))
+    if "since" in params:
+        queryset = queryset.filter(created_at__gte=_parse_moment("since", params["since"]))
+    if "until" in params:
+        queryset = queryset.filter(created_at__lt=_parse_moment("until", params["until"]))
+    return queryset
 
 
+class AlertHistory(generics.ListAPIView):
+    """
+    The user's alerts, newest first, keyset-paginated (see emergency.pagination).
+
+    Query parameters:
+      is_test=true|false   only test / only real alerts
+      since, until         created_at >= since and < until (ISO date or datetime)
+      fields=id,created_at sparse field set (any of EmergencyAlertSerializer's fields)
+      limit, cursor        page size (max 100) and the `next` cursor of the previous page
+    """
+    serializer_class = EmergencyAlertSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+
+    def get_fields(self):
+        raw = self.request.query_params.get("fields")
+        if not raw:
+            return None
+        fields = [name.strip() for name in raw.split(",") if name.strip()]
+        unknown = set(fields) - set(EmergencyAlertSerializer.Meta.fields)
+        if unknown:
+            raise ValidationError({"fields": f"Unknown fields: {', '.join(sorted(unknown))}"})
+        return fields
+
+    def get_queryset(self):
+        queryset = filter_alerts(EmergencyAlert.objects.filter(user=self.request.user), self.request.query_params)
+        fields = self.get_fields()
+        if fields is not None:
+            # created_at (with the pk) is the pagination cursor
+            queryset = queryset.only("created_at", *fields)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault("fields", self.get_fields())
+        return super().get_serializer(*args, **kwargs)
+
 
 from django.http import JsonResponse, HttpResponse
 
-def dynamic_manifest(request, token):
+@lru_cache(maxsize=1024)
+def _manifest_json(token):
     manifest = {
         "name": "ResQSignal Emergency Button",
         "short_name": "ResQSignal",
@@ -51,5 +159,67 @@ def dynamic_manifest(request, token):
             {"src": "/static/icons/icon-512.png", "sizes": "512x512", "type": "image/png"}
         ]
     }
-    return HttpResponse(json.dumps(manifest), content_type="application/manifest+json")
- 
\ No newline at end of file
+    return json.dumps(manifest)
+
+# Changes whenever the manifest template above does
+_MANIFEST_VERSION = hashlib.md5(_manifest_json("").encode()).hexdigest()[:12]
+
+
+def _manifest_etag(request, token):
+    # The manifest only depends on the token, so its version needs no lookup at all
+    return hashlib.md5(f"{_MANIFEST_VERSION}:{token}".encode()).hexdigest()[:16]
+
+
+@throttle("page")
+@cache_control(public=True, max_age=settings.MANIFEST_MAX_AGE)
+@condition(etag_func=_manifest_etag)
+def dynamic_manifest(request, token):
+    return HttpResponse(_manifest_json(str(token)), content_type="application/manifest+json")
+ 
+
+
+class _ExportView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def perform_content_negotiation(self, request, force=False):
+        # The body is CSV/NDJSON whatever the Accept header says; don't 406 on "Accept: text/csv"
+        return super().perform_content_negotiation(request, force=True)
+
+    def check_format(self, fmt):
+        if fmt not in FORMATS:
+            raise NotFound(f"Unknown export format. Use one of: {', '.join(FORMATS)}.")
+
+
+class AlertExport(_ExportView):
+    """
+    The user's whole alert history, oldest first, streamed as
+    alerts/export.ndjson or alerts/export.csv. Takes AlertHistory's
+    is_test / since / until filters.
+    """
+
+    def get(self, request, fmt):
+        self.check_format(fmt)
+        alerts = filter_alerts(EmergencyAlert.objects.filter(user=request.user), request.query_params)
+        return streaming_response(fmt, "alerts", ALERT_COLUMNS, alert_rows(alerts))
+
+
+class TrackExport(_ExportView):
+    """
+    Location fixes recorded for the user's alerts, streamed as
+    alerts/tracks/export.ndjson or .csv. ?alert=<id> limits it to one
+    alert; since / until filter on recorded_at.
+    """
+
+    def get(self, request, fmt):
+        self.check_format(fmt)
+        params = request.query_params
+        fixes = LocationFix.objects.filter(alert__user=request.user)
+        if "alert" in params:
+            if not params["alert"].isdigit():
+                raise ValidationError({"alert": "Must be an alert id."})
+            fixes = fixes.filter(alert_id=int(params["alert"]))
+        if "since" in params:
+            fixes = fixes.filter(recorded_at__gte=_parse_moment("since", params["since"]))
+        if "until" in params:
+            fixes = fixes.filter(recorded_at__lt=_parse_moment("until", params["until"]))
+        return streaming_response(fmt, "tracks", TRACK_COLUMNS, track_rows(fixes))
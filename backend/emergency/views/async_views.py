@@ -0,0 +1,188 @@
+"""
+Async versions of the public alert endpoints, routed instead of the DRF
+views when ASYNC_ALERT_VIEWS is on (SERVER_MODE=asgi). Requests and
+responses have the same shape. The ORM is used through its async API, only
+the transaction that writes the alert runs in a thread, and inline SMS
+fan-out runs on the event loop, so a worker holds many alerts at once.
+"""
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from emergency.buffers import location_fix_buffer
+from emergency.idempotency import TriggerGuard
+from emergency.models import Contact, EmergencyAlert
+from emergency.outbox import adeliver_jobs, enqueue_alert, summarize_jobs
+from emergency.tracking import aget_active_alert_id, parse_location, remember_active_alert
+from emergency.views.misc_views import cache_status_response, status_etag
+from emergency.views.public_views import build_alert_body, trigger_throttle_scope
+from services.log import bind_alert
+from services.throttle import athrottle_wait, throttled_response
+from users.resolver import aresolve_token
+
+logger = logging.getLogger(__name__)
+
+
+def _request_data(request):
+    """JSON or form body as a dict (what DRF's request.data gives the sync views); None if malformed."""
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST
+
+
+def _create_alert(token, user_id, message, location, is_test, contacts, body, billable):
+    with transaction.atomic():
+        alert = EmergencyAlert.objects.create(user_id=user_id, message=message, location=location, is_test=is_test)
+        jobs = []
+        if not is_test:
+            # Inline jobs are leased to this request so a worker doesn't send them too
+            jobs = enqueue_alert(
+                alert, contacts, body, billable=billable, claimed=settings.ALERT_DELIVERY_MODE == "inline"
+            )
+            if location:
+                transaction.on_commit(lambda: remember_active_alert(token, alert))
+    return alert, jobs
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncTriggerPublicAlertView(View):
+    http_method_names = ["post", "options"]
+
+    async def post(self, request, token):
+        data = _request_data(request)
+        if data is None:
+            return JsonResponse({"detail": "Malformed request body"}, status=400)
+
+        wait = await athrottle_wait(trigger_throttle_scope(data), request, token)
+        if wait:
+            return throttled_response(wait)
+
+        # Continuous GPS mode: no profile lookup, fixes are buffered and bulk-inserted
+        if data.get("continuous"):
+            return await self.record_location_fix(token, data.get("location"))
+
+        try:
+            snapshot = await aresolve_token(token)
+            if snapshot is None:
+                return JsonResponse({"detail": "Profile not found"}, status=404)
+            if not snapshot.has_premium_access():
+                return JsonResponse({"detail": "Subscription required"}, status=403)
+
+            plan = snapshot.plan
+            location = data.get("location")
+            is_test = data.get("is_test", False)
+            logger.info("🔍 User %s has plan: %s | Source: %s", snapshot.username, plan, snapshot.entitlement_source)
+            if location and plan != "premium":
+                logger.warning("❌ Discarding location for non-premium user %s (plan: %s)", snapshot.username, plan)
+                location = None
+
+            guard = TriggerGuard("public", snapshot.user_id, request.headers.get("Idempotency-Key"), is_test)
+            replay = await guard.aclaim()
+            if replay:
+                response = JsonResponse(replay.data, status=replay.status)
+                for name, value in replay.headers.items():
+                    response[name] = value
+                return response
+
+            try:
+                contacts = [contact async for contact in Contact.objects.filter(user_id=snapshot.user_id).sendable()]
+                logger.info("📇 Found %s contacts for user %s", len(contacts), snapshot.username)
+
+                is_first_real_alert = not await EmergencyAlert.objects.filter(
+                    user_id=snapshot.user_id, is_test=False
+                ).aexists()
+
+                alert, jobs = await sync_to_async(_create_alert)(
+                    token,
+                    snapshot.user_id,
+                    data.get("message", "🚨 Emergency alert!"),
+                    location,
+                    is_test,
+                    contacts,
+                    build_alert_body(snapshot.display_name, location),
+                    not is_first_real_alert,
+                )
+                bind_alert(alert.id)
+                # Inline sends start after the commit: no transaction is held open on the network.
+                if settings.ALERT_DELIVERY_MODE == "inline":
+                    await adeliver_jobs(jobs)
+            except Exception:
+                await guard.arelease()
+                raise
+
+            data = {
+                "status": "success",
+                "contacts_count": len(contacts),
+                **summarize_jobs(jobs),
+                "location_shared": bool(location),
+                "plan": plan,
+                "alert_id": alert.id,
+                "billing_skipped": is_first_real_alert,
+            }
+            await guard.aremember(200, data)
+            return JsonResponse(data)
+
+        except Exception as e:
+            logger.error("Emergency alert error: %s", e, exc_info=True)
+            return JsonResponse({"detail": "Internal server error"}, status=500)
+
+    async def record_location_fix(self, token, location):
+        try:
+            latitude, longitude = parse_location(location)
+        except (TypeError, ValueError):
+            return JsonResponse({"detail": "Invalid location"}, status=400)
+
+        alert_id = await aget_active_alert_id(token)
+        if alert_id is None:
+            return JsonResponse({"status": "location ignored", "type": "continuous"})
+
+        bind_alert(alert_id)
+        await location_fix_buffer.aadd_fix(alert_id, latitude, longitude)
+        logger.info("📍 Buffered GPS fix", extra={"sample_rate": settings.LOCATION_LOG_SAMPLE_RATE})
+        return JsonResponse({"status": "location update received", "type": "continuous"})
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncPublicAlertStatusCheck(View):
+    http_method_names = ["get", "options"]
+
+    async def get(self, request, token):
+        wait = await athrottle_wait("status", request, token)
+        if wait:
+            return throttled_response(wait)
+
+        try:
+            snapshot = await aresolve_token(token)
+        except Exception as e:
+            logger.error("Alert status check error: %s", e, exc_info=True)
+            return JsonResponse({"message": "Internal server error"}, status=500)
+
+        if snapshot is None:
+            return cache_status_response(JsonResponse({"message": "Profile not found."}, status=404))
+        if not snapshot.has_premium_access():
+            return cache_status_response(JsonResponse({"message": "Account inactive or no subscription."}, status=403))
+        if snapshot.contact_count == 0:
+            return cache_status_response(JsonResponse({"message": "No emergency contacts configured."}, status=403))
+
+        etag = status_etag(snapshot)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return cache_status_response(not_modified, etag)
+
+        return cache_status_response(JsonResponse({
+            "plan": snapshot.plan,
+            "contact_count": snapshot.contact_count,
+            "message": "Test successful. Ready to trigger alert.",
+        }), etag)
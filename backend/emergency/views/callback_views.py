@@ -0,0 +1,69 @@
+import logging
+from django.conf import settings
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.decorators import method_decorator
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.parsers import FormParser
+from rest_framework.permissions import AllowAny
+from rest_framework import status
+
+from emergency.buffers import delivery_status_buffer
+
+logger = logging.getLogger(__name__)
+
+# Twilio MessageStatus -> AlertDelivery.status (intermediate states are ignored)
+TWILIO_STATUS_MAP = {
+    "sent": "sent",
+    "delivered": "delivered",
+    "read": "delivered",
+    "undelivered": "undelivered",
+    "failed": "failed",
+}
+
+
+def _twilio_auth_tokens():
+    # Callbacks for messages sent through the fallback account are signed
+    # with that account's token.
+    tokens = [settings.TWILIO_AUTH_TOKEN, settings.SMS_GATEWAY_FALLBACK_OPTIONS.get("auth_token")]
+    return [token for token in tokens if token]
+
+
+def _has_valid_twilio_signature(request):
+    if not settings.SMS_STATUS_CALLBACK_VALIDATE:
+        return True
+
+    auth_tokens = _twilio_auth_tokens()
+    if not auth_tokens:
+        logger.error("❌ SMS status callback rejected: TWILIO_AUTH_TOKEN is not configured")
+        return False
+
+    from twilio.request_validator import RequestValidator
+
+    url = request.build_absolute_uri()
+    params = request.POST.dict()
+    signature = request.META.get("HTTP_X_TWILIO_SIGNATURE", "")
+    return any(RequestValidator(token).validate(url, params, signature) for token in auth_tokens)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class SMSStatusCallbackView(APIView):
+    """
+    Twilio status callback. Updates are buffered and written in batches by
+    emergency.buffers.delivery_status_buffer, so bursts never cost one
+    UPDATE per callback.
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+    parser_classes = [FormParser]
+
+    def post(self, request):
+        if not _has_valid_twilio_signature(request):
+            return Response(status=status.HTTP_403_FORBIDDEN)
+
+        sid = request.data.get("MessageSid")
+        delivery_status = TWILIO_STATUS_MAP.get(request.data.get("MessageStatus", ""))
+        if sid and delivery_status:
+            delivery_status_buffer.add_status(sid, delivery_status, request.data.get("ErrorCode"))
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
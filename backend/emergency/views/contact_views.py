@@ -1,8 +1,13 @@
-from rest_framework import generics, serializers, viewsets
+from rest_framework import generics, serializers, status, viewsets
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from emergency.contact_import import (
+    MAX_FILE_BYTES, ContactImportError, ContactLimitExceeded, decode, detect_format, import_contacts, parse_contacts,
+)
 from emergency.models import Contact
 from emergency.serializers import ContactSerializer
-from users.utils import get_user_plan
+from users.entitlements import get_entitlement
 
 class ContactListCreate(generics.ListCreateAPIView):
     serializer_class = ContactSerializer
@@ -13,19 +18,14 @@ class ContactListCreate(generics.ListCreateAPIView):
 
     def perform_create(self, serializer):
         user = self.request.user
-        profile = user.profile
+        entitlement = get_entitlement(user)
 
-        # ✅ Use unified access logic
-        if profile.has_premium_access():
-            max_allowed = 7  # You decide: full limit for trial users?
-        elif profile.get_effective_plan() == "basic":
-            max_allowed = 3
-        else:
-            max_allowed = 0
+        # ✅ Use unified access logic (limit is materialized with the plan)
+        max_allowed = entitlement.contact_limit if entitlement.has_access() else 0
 
         current = Contact.objects.filter(user=user).count()
         if current >= max_allowed:
-            plan_name = profile.get_effective_plan()
+            plan_name = entitlement.effective_plan()
             raise serializers.ValidationError(
                 f"CONTACT_LIMIT_REACHED::{max_allowed}::{plan_name}"
             )
@@ -33,6 +33,37 @@ class ContactListCreate(generics.ListCreateAPIView):
         serializer.save(user=user)
 
 
+class ContactImport(APIView):
+    """
+    Add many contacts at once: a multipart `file` (.csv, .vcf or .json) or a
+    JSON list of {"name", "phone_number", "relationship"}. Numbers without a
+    +country code are read in `region` (default CONTACT_IMPORT_DEFAULT_REGION).
+
+    Invalid rows and numbers already in the contacts are skipped and listed
+    in the response; going over the plan's contact limit imports nothing.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        upload = request.FILES.get("file")
+        options = request.data if isinstance(request.data, dict) else {}  # a bare JSON list has no options
+        try:
+            if upload is not None:
+                if upload.size > MAX_FILE_BYTES:
+                    raise ContactImportError(f"Files are limited to {MAX_FILE_BYTES // 1024} KB.")
+                fmt = options.get("format") or detect_format(upload.name, upload.content_type)
+                records = parse_contacts(decode(upload.read()), fmt)
+            else:
+                records = parse_contacts(request.data, "json")
+            result = import_contacts(request.user, records, region=options.get("region"))
+        except ContactImportError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except ContactLimitExceeded as e:
+            raise serializers.ValidationError(str(e))
+
+        return Response(result.as_dict(), status=status.HTTP_201_CREATED if result.created else status.HTTP_200_OK)
+
+
 class ContactDetail(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ContactSerializer
     permission_classes = [IsAuthenticated]
@@ -1,18 +1,21 @@
+import hashlib
 import uuid
+from django.conf import settings
 from django.http import JsonResponse
 from django.middleware.csrf import get_token
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_exempt
 from django.utils.decorators import method_decorator
 from django.shortcuts import render
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from rest_framework import status
 
-from users.models import Profile
-from emergency.models import Contact
-from users.utils import get_user_plan
+from services.throttle import PublicThrottle
+from users.resolver import resolve_token
 
 @ensure_csrf_cookie
 def alert_page(request):
@@ -22,45 +25,72 @@ def alert_page(request):
 def get_csrf_token(request):
     return JsonResponse({'csrfToken': get_token(request)})
 
+def status_etag(snapshot):
+    """
+    Version stamp of a ready status check. Its answer depends only on the
+    effective plan and the contact count, both read off the token snapshot,
+    which Profile, Subscription and Contact writes invalidate.
+    """
+    stamp = f"{snapshot.user_id}:{snapshot.get_effective_plan()}:{snapshot.contact_count}"
+    return quote_etag(hashlib.md5(stamp.encode()).hexdigest()[:16])
+
+
+def cache_status_response(response, etag=None):
+    """A ready status (with its ETag) may be cached for PUBLIC_STATUS_MAX_AGE; anything else is revalidated."""
+    if etag is None:
+        patch_cache_control(response, no_cache=True)
+    else:
+        response["ETag"] = etag
+        patch_cache_control(response, public=True, max_age=settings.PUBLIC_STATUS_MAX_AGE)
+    return response
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class PublicAlertStatusCheck(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [PublicThrottle]
+    throttle_scope = "status"
 
     def get(self, request, token):
         try:
             uuid.UUID(str(token))
-            profile = Profile.objects.get(token=token)
-            user = profile.user
+            snapshot = resolve_token(token)
+            if snapshot is None:
+                return cache_status_response(Response(
+                    {"message": "Profile not found."},
+                    status=status.HTTP_404_NOT_FOUND
+                ))
 
-            if not profile.has_premium_access():
-                return Response(
+            if not snapshot.has_premium_access():
+                return cache_status_response(Response(
                     {"message": "Account inactive or no subscription."},
                     status=status.HTTP_403_FORBIDDEN
-                )
+                ))
 
-            contact_count = Contact.objects.filter(user=user).count()
+            contact_count = snapshot.contact_count
             if contact_count == 0:
-                return Response(
+                return cache_status_response(Response(
                     {"message": "No emergency contacts configured."},
                     status=status.HTTP_403_FORBIDDEN
-                )
+                ))
 
-            return Response({
-                "plan": get_user_plan(user),
+            # Polls that already hold this version get a bodiless 304
+            etag = status_etag(snapshot)
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                return cache_status_response(not_modified, etag)
+
+            return cache_status_response(Response({
+                "plan": snapshot.plan,
                 "contact_count": contact_count,
                 "message": "Test successful. Ready to trigger alert."
-            })
+            }), etag)
 
         except ValueError:
             return Response(
                 {"message": "Invalid token format."},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        except Profile.DoesNotExist:
-            return Response(
-                {"message": "Profile not found."},
-                status=status.HTTP_404_NOT_FOUND
-            )
         except Exception as e:
             return Response(
                 {"message": str(e)},
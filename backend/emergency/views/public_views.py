@@ -1,140 +1,227 @@
 import uuid
 import logging
-from django.shortcuts import render, get_object_or_404
+from django.conf import settings
+from django.db import transaction
 from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
 from django.utils.decorators import method_decorator
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.http import JsonResponse, HttpResponseBadRequest, Http404
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from rest_framework import status
 
 from emergency.models import EmergencyAlert, Contact
-from emergency.utils import send_emergency_message
-from billing.utils import add_stripe_usage
-from users.models import Profile
-from users.utils import get_user_plan
-from billing.models import Subscription
-from services.twilio_sms import send_sms_alert
+from emergency.outbox import enqueue_alert, deliver_jobs, summarize_jobs
+from emergency.buffers import location_fix_buffer
+from emergency.tracking import parse_location, decode_track, get_active_alert_id, remember_active_alert
+from emergency.page_cache import render_page
+from emergency.idempotency import TriggerGuard
+from users.resolver import resolve_token
+from services.log import bind_alert
+from services.throttle import PublicThrottle, throttle
 
 logger = logging.getLogger(__name__)
 
+
+def build_alert_body(display_name, location):
+    """Branded, clickable SMS text sent to every contact."""
+    if location:
+        lat, lon = location.split(",", 1)
+        maps_link = f"https://maps.google.com/?q={lat},{lon}"
+        return (
+            f"🚨 ResQSignal ALERT from {display_name}!\n"
+            f"I may need immediate help.\n"
+            f"📍 Tap for exact location:\n{maps_link}"
+        )
+    return (
+        f"🚨 ResQSignal ALERT from {display_name}!\n"
+        f"I may need immediate help. Location not available."
+    )
+
+
+def trigger_throttle_scope(data):
+    """
+    PUBLIC_THROTTLE_RATES scope a trigger body spends from. GPS ticks and test
+    triggers have their own budgets, so they never use up real alerts.
+    """
+    if not isinstance(data, dict):
+        # Refused with a 400 by the view; throttled like the cheapest abuse
+        return "test"
+    if data.get("continuous"):
+        return "location"
+    if data.get("is_test"):
+        return "test"
+    return "alert"
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class TriggerPublicAlertView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [PublicThrottle]
+
+    @property
+    def throttle_scope(self):
+        return trigger_throttle_scope(self.request.data)
 
     def post(self, request, token):
+        if not isinstance(request.data, dict):
+            return Response({"detail": "Malformed request body"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Continuous GPS mode: no profile lookup, fixes are buffered and bulk-inserted
+        if request.data.get("continuous"):
+            return self.record_location_fix(token, request.data.get("location"))
+
         try:
             uuid.UUID(str(token))  # Validate UUID format
-            profile = Profile.objects.get(token=token)
-            user = profile.user
+            snapshot = resolve_token(token)
+            if snapshot is None:
+                return Response({"detail": "Profile not found"}, status=status.HTTP_404_NOT_FOUND)
 
             is_test = request.data.get('is_test', False)
             location = request.data.get("location")
 
-            # Continuous GPS mode
-            if request.data.get("continuous"):
-                logger.info(f"📍 Continuous GPS update from {user.username}: {location}")
-                return Response({"status": "location update received", "type": "continuous"})
-
             # Subscription check
-            if not profile.has_premium_access():
+            if not snapshot.has_premium_access():
                 return Response({"detail": "Subscription required"}, status=status.HTTP_403_FORBIDDEN)
 
             # Plan
-            plan = get_user_plan(user)
-            logger.info(f"🔍 User {user.username} has plan: {plan} | Subscribed: {profile.is_subscribed}")
+            plan = snapshot.plan
+            logger.info("🔍 User %s has plan: %s | Source: %s", snapshot.username, plan, snapshot.entitlement_source)
 
             if location and plan != "premium":
-                logger.warning(f"❌ Discarding location for non-premium user {user.username} (plan: {plan})")
+                logger.warning("❌ Discarding location for non-premium user %s (plan: %s)", snapshot.username, plan)
                 location = None
 
             message = request.data.get("message", "🚨 Emergency alert!")
-            alert = EmergencyAlert.objects.create(
-                user=user, message=message, location=location, is_test=is_test
-            )
 
-            contacts = Contact.objects.filter(user=user)
-            contacts_count = contacts.count()
-            successful_sends = 0
-
-            logger.info(f"📇 Found {contacts_count} contacts for user {user.username}")
-
-            # First real alert check
-            alert_count = EmergencyAlert.objects.filter(user=user, is_test=False).exclude(id=alert.id).count()
-            is_first_real_alert = alert_count == 0
-
-            if not is_test:
-                # Build branded, clickable message
-                if location:
-                    lat, lon = location.split(",", 1)
-                    maps_link = f"https://maps.google.com/?q={lat},{lon}"
-                    full_message = (
-                        f"🚨 ResQSignal ALERT from {user.get_full_name() or user.username}!\n"
-                        f"I may need immediate help.\n"
-                        f"📍 Tap for exact location:\n{maps_link}"
-                    )
-                else:
-                    full_message = (
-                        f"🚨 ResQSignal ALERT from {user.get_full_name() or user.username}!\n"
-                        f"I may need immediate help. Location not available."
-                    )
+            # Repeats (double fire, retry, offline replay) get the first response back, unsent and unbilled
+            guard = TriggerGuard("public", snapshot.user_id, request.headers.get("Idempotency-Key"), is_test)
+            replay = guard.claim()
+            if replay:
+                return Response(replay.data, status=replay.status, headers=replay.headers)
 
-                for contact in contacts:
-                    try:
-                        logger.info(f"📤 Sending alert to {contact.phone_number}")
-                        send_emergency_message(contact=contact, user=user, message=full_message)
-                        successful_sends += 1
-                    except Exception as e:
-                        logger.error(f"Failed to send alert to contact {contact.id}: {str(e)}")
-                        continue
+            try:
+                contacts = list(Contact.objects.filter(user_id=snapshot.user_id).sendable())
+                contacts_count = len(contacts)
 
-                # ✅ Trigger SMS
-                logger.info("📨 Calling send_sms_alert...")
-                send_sms_alert(user, full_message)
+                logger.info("📇 Found %s contacts for user %s", contacts_count, snapshot.username)
 
-                if successful_sends > 0 and not is_first_real_alert:
-                    add_stripe_usage(user, quantity=successful_sends)
+                # First real alert check
+                alert_count = EmergencyAlert.objects.filter(user_id=snapshot.user_id, is_test=False).count()
+                is_first_real_alert = alert_count == 0
 
-            return Response({
+                full_message = build_alert_body(snapshot.display_name, location)
+
+                # ✅ Alert + delivery jobs commit together; inline sends start after the commit,
+                # otherwise the worker does the sending
+                inline = settings.ALERT_DELIVERY_MODE == "inline"
+                jobs = []
+                with transaction.atomic():
+                    alert = EmergencyAlert.objects.create(
+                        user_id=snapshot.user_id, message=message, location=location, is_test=is_test
+                    )
+                    bind_alert(alert.id)
+                    if not is_test:
+                        jobs = enqueue_alert(
+                            alert, contacts, full_message, billable=not is_first_real_alert, claimed=inline
+                        )
+                        if location:
+                            transaction.on_commit(lambda: remember_active_alert(token, alert))
+                if inline:
+                    deliver_jobs(jobs)
+            except Exception:
+                guard.release()
+                raise
+
+            data = {
                 "status": "success",
                 "contacts_count": contacts_count,
-                "successful_sends": successful_sends,
-                "failed_sends": contacts_count - successful_sends,
+                **summarize_jobs(jobs),
                 "location_shared": bool(location),
                 "plan": plan,
                 "alert_id": alert.id,
-                "billing_skipped": is_first_real_alert
-            })
+                "billing_skipped": is_first_real_alert,
+            }
+            guard.remember(status.HTTP_200_OK, data)
+            return Response(data)
 
         except ValueError:
             return Response({"detail": "Invalid token format"}, status=status.HTTP_400_BAD_REQUEST)
-        except Profile.DoesNotExist:
-            return Response({"detail": "Profile not found"}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
-            logger.error(f"Emergency alert error: {str(e)}", exc_info=True)
+            logger.error("Emergency alert error: %s", e, exc_info=True)
             return Response({"detail": "Internal server error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    def record_location_fix(self, token, location):
+        try:
+            latitude, longitude = parse_location(location)
+        except (TypeError, ValueError):
+            return Response({"detail": "Invalid location"}, status=status.HTTP_400_BAD_REQUEST)
+
+        alert_id = get_active_alert_id(token)
+        if alert_id is None:
+            return Response({"status": "location ignored", "type": "continuous"})
+
+        bind_alert(alert_id)
+        location_fix_buffer.add_fix(alert_id, latitude, longitude)
+        logger.info("📍 Buffered GPS fix", extra={"sample_rate": settings.LOCATION_LOG_SAMPLE_RATE})
+        return Response({"status": "location update received", "type": "continuous"})
+
 
 
 
+@method_decorator(csrf_exempt, name='dispatch')
+class TrackUploadView(APIView):
+    """
+    Batched GPS upload for the public alert page: `{"fixes": [[t, lat, lon, acc], ...]}`,
+    delta-encoded as described in emergency.tracking.decode_track.
+    """
+    permission_classes = [AllowAny]
+    throttle_classes = [PublicThrottle]
+    throttle_scope = "location"
+
+    def post(self, request, token):
+        if not isinstance(request.data, dict):
+            return Response({"detail": "Invalid track: expected a JSON object"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            fixes = decode_track(request.data.get("fixes"))
+        except (TypeError, ValueError) as e:
+            return Response({"detail": f"Invalid track: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        alert_id = get_active_alert_id(token)
+        if alert_id is None:
+            return Response({"status": "track ignored", "accepted": 0})
+
+        for recorded_at, latitude, longitude, accuracy in fixes:
+            location_fix_buffer.add_fix(alert_id, latitude, longitude, accuracy, recorded_at)
+        bind_alert(alert_id)
+        logger.info("📍 Buffered %s GPS fixes", len(fixes), extra={"sample_rate": settings.LOCATION_LOG_SAMPLE_RATE})
+
+        return Response({"status": "track received", "accepted": len(fixes)})
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class PublicAlertStatusCheck(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [PublicThrottle]
+    throttle_scope = "status"
 
     def get(self, request, token):
         try:
             uuid.UUID(str(token))
-            profile = Profile.objects.get(token=token)
-            user = profile.user
+            snapshot = resolve_token(token)
+            if snapshot is None:
+                return Response(
+                    {"message": "Profile not found."},
+                    status=status.HTTP_404_NOT_FOUND
+                )
 
-            if not profile.has_premium_access():
+            if not snapshot.has_premium_access():
                 return Response(
                     {"message": "Account inactive or no subscription."},
                     status=status.HTTP_403_FORBIDDEN
                 )
 
-            contact_count = Contact.objects.filter(user=user).count()
+            contact_count = snapshot.contact_count
             if contact_count == 0:
                 return Response(
                     {"message": "No emergency contacts configured."},
@@ -142,7 +229,7 @@ class PublicAlertStatusCheck(APIView):
                 )
 
             return Response({
-                "plan": get_user_plan(user),
+                "plan": snapshot.plan,
                 "contact_count": contact_count,
                 "message": "Test successful. Ready to trigger alert."
             })
@@ -152,31 +239,36 @@ class PublicAlertStatusCheck(APIView):
                 {"message": "Invalid token format."},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        except Profile.DoesNotExist:
-            return Response(
-                {"message": "Profile not found."},
-                status=status.HTTP_404_NOT_FOUND
-            )
         except Exception as e:
-            logger.error(f"Alert status check error: {str(e)}", exc_info=True)
+            logger.error("Alert status check error: %s", e, exc_info=True)
             return Response(
                 {"message": "Internal server error"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
 
+@throttle("page")
 @ensure_csrf_cookie
 def public_alert_page(request, token):
-    profile = get_object_or_404(Profile, token=token)
-    if not profile.has_premium_access():
-        return render(request, 'emergency/subscription_required.html', {'token': token})
-    return render(request, 'emergency/public_alert.html', {'token': token, 'user': profile.user})
-
-
+    snapshot = resolve_token(token)
+    if snapshot is None:
+        raise Http404("Profile not found")
+    if not snapshot.has_premium_access():
+        return render_page('emergency/subscription_required.html', {'token': str(token)})
+    # X-Alert-Shell marks the alert button itself, the only page the service worker (static/sw.js)
+    # may cache as the offline shell
+    return render_page(
+        'emergency/public_alert.html',
+        {'token': str(token), 'display_name': snapshot.display_name},
+        headers={"X-Alert-Shell": "1"},
+    )
+
+
+@throttle("page")
 @ensure_csrf_cookie
 def test_alert_page(request, token):
     try:
         uuid.UUID(str(token))
     except ValueError:
         return HttpResponseBadRequest("Invalid token format")
-    return render(request, 'emergency/test_alert.html', {'token': token})
+    return render_page('emergency/test_alert.html', {'token': str(token)})
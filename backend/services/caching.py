@@ -0,0 +1,66 @@
+"""
+What the configured cache can be trusted with.
+
+Without REDIS_URL the default cache is Django's LocMemCache, so every
+gunicorn worker (and every management command) has its own copy. Entries
+that other processes must see, such as deletions on invalidation, token
+buckets and alert claims, only work with a shared backend.
+
+`LocalLRU` is the per-process layer the token resolver and the public page
+cache keep in front of it.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+PROCESS_LOCAL_BACKENDS = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+def is_process_local(alias="default"):
+    """True when `alias` is private to this process (or caches nothing)."""
+    return settings.CACHES[alias]["BACKEND"] in PROCESS_LOCAL_BACKENDS
+
+
+class LocalLRU:
+    """
+    Small thread-safe LRU with a per-entry TTL, private to this process.
+    Sits in front of the shared cache for hot, read-mostly entries; other
+    processes' writes reach it only once `ttl` runs out.
+    """
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
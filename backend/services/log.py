@@ -0,0 +1,123 @@
+"""
+Non-blocking structured logging.
+
+`QueueLogHandler` (wired up in settings.LOGGING) only puts records on an
+in-memory queue; a QueueListener thread formats them as JSON and writes
+them to stdout. Request threads therefore never wait on the log pipe, and
+a message's %-args are only interpolated on the listener thread. If the
+queue is full the record is dropped and counted rather than blocking.
+
+Records are tagged with the current request id (middleware.RequestIdMiddleware)
+and alert id (`bind_alert()`), carried in contextvars so they follow the
+request into the SMS dispatch pool. High-frequency messages can pass
+`extra={"sample_rate": N}` to keep one record in N.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+alert_id_var = contextvars.ContextVar("alert_id", default=None)
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "sample_rate"}
+
+
+def bind_alert(alert_id):
+    """Tag every following log record of this request / task with `alert_id`."""
+    alert_id_var.set(alert_id)
+
+
+class ContextFilter(logging.Filter):
+    """Copies the correlation ids onto the record on the caller's thread."""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        record.alert_id = getattr(record, "alert_id", None) or alert_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps one in `record.sample_rate` records per call site; unsampled records always pass."""
+
+    def __init__(self):
+        super().__init__()
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        rate = getattr(record, "sample_rate", None)
+        if not rate or rate <= 1:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        return count % rate == 0
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "alert_id": getattr(record, "alert_id", None),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class QueueLogHandler(QueueHandler):
+    """
+    Logging handler that never blocks: records go on a bounded queue and a
+    QueueListener writes them to `stream` with this handler's formatter.
+    """
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize=maxsize))
+        self.dropped = 0
+        self.target = logging.StreamHandler(stream or sys.stdout)
+        self.addFilter(ContextFilter())
+        self.addFilter(SamplingFilter())
+        self._start_listener()
+        # The listener thread doesn't survive a fork (gunicorn --preload); start a new one.
+        os.register_at_fork(after_in_child=self._start_listener)
+        atexit.register(self.close)
+
+    def _start_listener(self):
+        self.listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+        self.listener.start()
+
+    def setFormatter(self, fmt):
+        # Formatting happens on the listener thread, in the target handler.
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Unlike QueueHandler.prepare, don't format here: that is the slow part.
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        listener = getattr(self, "listener", None)
+        if listener is not None and listener._thread is not None:
+            listener.stop()
+        super().close()
@@ -0,0 +1,86 @@
+"""
+Prometheus metrics.
+
+Request metrics are recorded by middleware.MetricsMiddleware; calls to
+Twilio, Stripe and the email backend are timed with `time_external()`.
+
+Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+(set in docker/entrypoint.sh, before prometheus_client is imported) and
+`/metrics` merges all of them, so a scrape sees the whole server rather
+than whichever worker answered. Without that variable (runserver, tests)
+the process-local registry is served.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import REGISTRY, multiprocess
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests by resolved URL name",
+    ["route", "method", "status"],
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Request latency by resolved URL name",
+    ["route", "method"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "SQL queries issued per request",
+    ["route"],
+    buckets=QUERY_BUCKETS,
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_seconds",
+    "Time spent in SQL per request",
+    ["route"],
+    buckets=LATENCY_BUCKETS,
+)
+EXTERNAL_CALL_LATENCY = Histogram(
+    "external_call_duration_seconds",
+    "Calls to third-party services (SMS, Stripe, email)",
+    ["service", "operation", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+@contextmanager
+def time_external(service, operation):
+    """Time one third-party call; exceptions are recorded as outcome="error" and re-raised."""
+    outcome = "error"
+    started = time.perf_counter()
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        EXTERNAL_CALL_LATENCY.labels(service, operation, outcome).observe(time.perf_counter() - started)
+
+
+def metrics_view(request):
+    token = settings.METRICS_AUTH_TOKEN
+    if not token:
+        # Open only in development; elsewhere a missing token must not publish the metrics
+        if not settings.DEBUG:
+            logger.error("❌ /metrics refused: METRICS_AUTH_TOKEN is not configured")
+            return HttpResponseForbidden()
+    elif request.META.get("HTTP_AUTHORIZATION") != f"Bearer {token}":
+        return HttpResponseForbidden()
+
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
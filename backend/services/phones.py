@@ -0,0 +1,42 @@
+"""
+Phone number parsing, done once per distinct input.
+
+Contacts store their canonical E.164 number and region (Contact.phone_e164,
+Contact.phone_region), so sending never parses. What parsing is left
+(validating input, imports, legacy callers) goes through `parse_phone`,
+which memoizes results in a bounded LRU: re-importing an address book or
+re-validating a known number costs a dict lookup.
+"""
+from functools import lru_cache
+
+import phonenumbers
+
+PARSE_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_phone(raw, region=None):
+    """
+    (E.164 string, region code) for a valid number, else None.
+
+    Numbers without a +country code are read in `region`; with region None
+    they are rejected.
+    """
+    if not raw:
+        return None
+    try:
+        parsed = phonenumbers.parse(raw, region)
+    except phonenumbers.NumberParseException:
+        return None
+    if not phonenumbers.is_valid_number(parsed):
+        return None
+    return (
+        phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164),
+        phonenumbers.region_code_for_number(parsed) or "",
+    )
+
+
+def to_e164(raw, region=None):
+    """Just the E.164 string (or None) of parse_phone."""
+    parsed = parse_phone(raw, region)
+    return parsed and parsed[0]
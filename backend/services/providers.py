@@ -0,0 +1,59 @@
+"""
+Lazily built third-party clients.
+
+Importing the `stripe` SDK alone takes over half a second, and the SMS
+gateway opens a connection pool. Neither is needed to boot a worker or to
+serve most requests, so modules ask this registry for a provider
+(`get("stripe")`, `get("sms")`) at call time. The factory runs on the first
+`get()` in each process and again after a fork, so gunicorn workers never
+share sockets with the master.
+
+Call `override(name, instance)` to swap a provider in tests and benchmarks,
+and `override(name, None)` to go back to the factory.
+"""
+import os
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# name -> dotted path of a zero-argument factory
+PROVIDERS = {
+    "stripe": "services.providers.build_stripe",
+    "sms": "services.sms_gateway.build_gateway",
+}
+
+_instances = {}  # name -> (pid, instance)
+_lock = threading.Lock()
+
+
+def build_stripe():
+    import stripe
+
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    return stripe
+
+
+def get(name):
+    pid = os.getpid()
+    entry = _instances.get(name)
+    if entry is None or entry[0] != pid:
+        with _lock:
+            entry = _instances.get(name)
+            if entry is None or entry[0] != pid:
+                entry = (pid, import_string(PROVIDERS[name])())
+                _instances[name] = entry
+    return entry[1]
+
+
+def override(name, instance):
+    with _lock:
+        if instance is None:
+            _instances.pop(name, None)
+        else:
+            _instances[name] = (os.getpid(), instance)
+
+
+def get_stripe():
+    """The `stripe` module, imported and configured with STRIPE_SECRET_KEY on first use."""
+    return get("stripe")
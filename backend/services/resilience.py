@@ -0,0 +1,104 @@
+import asyncio
+import random
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Thread-safe breaker shared by every send in the process.
+
+    Opens after `failure_threshold` consecutive failures and fails fast for
+    `reset_timeout` seconds; then lets a single trial call through
+    (half-open) and closes again on its success.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+def backoff_delays(base, cap):
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**n))."""
+    attempt = 0
+    while True:
+        yield random.uniform(0, min(cap, base * 2 ** attempt))
+        attempt += 1
+
+
+def call_with_retry(fn, is_retryable, max_attempts, base_delay, max_delay, deadline=None):
+    """
+    Call `fn()` until it succeeds, raises a non-retryable error, runs out of
+    attempts, or the next backoff would cross `deadline` (a time.monotonic()
+    value). `fn` is always called at least once; the last error is re-raised.
+    """
+    delays = backoff_delays(base_delay, max_delay)
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return fn()
+        except Exception as exc:
+            if attempt == max_attempts or not is_retryable(exc):
+                raise
+            delay = next(delays)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise
+            time.sleep(delay)
+
+
+async def acall_with_retry(fn, is_retryable, max_attempts, base_delay, max_delay, deadline=None):
+    """call_with_retry for coroutine functions: awaits `fn()` and sleeps without blocking the loop."""
+    delays = backoff_delays(base_delay, max_delay)
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return await fn()
+        except Exception as exc:
+            if attempt == max_attempts or not is_retryable(exc):
+                raise
+            delay = next(delays)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise
+            await asyncio.sleep(delay)
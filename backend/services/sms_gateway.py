@@ -0,0 +1,271 @@
+"""
+SMS gateway abstraction.
+
+`get_gateway()` returns one long-lived gateway per process, built from
+`settings.SMS_GATEWAY_BACKEND`. Every send on the alert path goes through it,
+so the Twilio client and its keep-alive connection pool are reused across
+alerts instead of being rebuilt per message. The backend is wrapped in a
+ResilientGateway that retries transient errors and trips a circuit breaker
+(failing over to `SMS_GATEWAY_FALLBACK_BACKEND` when configured).
+
+Every gateway also has `asend()` for the async views (ASGI); it shares the
+breakers and retry policy with `send()`.
+"""
+import asyncio
+import random
+import threading
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from services import providers
+from services.metrics import time_external
+from services.resilience import CircuitBreaker, CircuitOpenError, acall_with_retry, call_with_retry
+
+# Rate limiting and server-side errors are worth another try; 4xx are not.
+RETRYABLE_HTTP_STATUSES = {429, 500, 502, 503, 504}
+
+
+class SMSGatewayError(Exception):
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class SMSGateway:
+    def send(self, to, body, deadline=None):
+        """
+        Send one message and return the provider message id.
+        `deadline` is a time.monotonic() value the caller will stop waiting at.
+        """
+        raise NotImplementedError
+
+    async def asend(self, to, body, deadline=None):
+        """Async `send()`. Backends without a native async client send from a worker thread."""
+        return await sync_to_async(self.send, thread_sensitive=False)(to, body, deadline=deadline)
+
+
+class TwilioGateway(SMSGateway):
+    def __init__(self, account_sid=None, auth_token=None, from_number=None, timeout=None, pool_size=None):
+        from requests.adapters import HTTPAdapter
+        from twilio.http.http_client import TwilioHttpClient
+        from twilio.rest import Client
+
+        self.account_sid = account_sid or settings.TWILIO_ACCOUNT_SID
+        self.auth_token = auth_token or settings.TWILIO_AUTH_TOKEN
+        self.from_number = from_number or settings.TWILIO_PHONE_NUMBER
+        self.timeout = timeout or settings.SMS_GATEWAY_TIMEOUT
+
+        # One pooled requests.Session: TLS handshakes are paid once per
+        # connection and the pool is sized for the dispatcher's threads.
+        http_client = TwilioHttpClient(pool_connections=True, timeout=self.timeout)
+        pool_size = pool_size or settings.ALERT_DISPATCH_MAX_WORKERS
+        http_client.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+        self.client = Client(self.account_sid, self.auth_token, http_client=http_client)
+        self._async_client = None
+
+    def _status_callback_kwargs(self):
+        if settings.SMS_STATUS_CALLBACK_URL:
+            return {"status_callback": settings.SMS_STATUS_CALLBACK_URL}
+        return {}
+
+    def send(self, to, body, deadline=None):
+        from requests.exceptions import ConnectionError, Timeout
+        from twilio.base.exceptions import TwilioRestException
+
+        try:
+            msg = self.client.messages.create(body=body, from_=self.from_number, to=to, **self._status_callback_kwargs())
+        except TwilioRestException as e:
+            raise SMSGatewayError(str(e.msg), retryable=e.status in RETRYABLE_HTTP_STATUSES) from e
+        except (ConnectionError, Timeout) as e:
+            raise SMSGatewayError(str(e), retryable=True) from e
+        return msg.sid
+
+    def _get_async_client(self):
+        # Built on first use, inside the server's event loop: the aiohttp
+        # session behind it keeps its connections open for later alerts.
+        if self._async_client is None:
+            from twilio.http.async_http_client import AsyncTwilioHttpClient
+            from twilio.rest import Client
+
+            http_client = AsyncTwilioHttpClient(pool_connections=True, timeout=self.timeout)
+            self._async_client = Client(self.account_sid, self.auth_token, http_client=http_client)
+        return self._async_client
+
+    async def asend(self, to, body, deadline=None):
+        from aiohttp import ClientError
+        from twilio.base.exceptions import TwilioRestException
+
+        client = self._get_async_client()
+        try:
+            msg = await client.messages.create_async(
+                body=body, from_=self.from_number, to=to, **self._status_callback_kwargs()
+            )
+        except TwilioRestException as e:
+            raise SMSGatewayError(str(e.msg), retryable=e.status in RETRYABLE_HTTP_STATUSES) from e
+        except (ClientError, asyncio.TimeoutError) as e:
+            raise SMSGatewayError(str(e) or type(e).__name__, retryable=True) from e
+        return msg.sid
+
+
+class FakeGateway(SMSGateway):
+    """
+    In-process gateway for tests and benchmarks. Sleeps `latency` seconds
+    (+/- `jitter`) per send and fails with probability `failure_rate`.
+    Sent messages are kept in `self.sent` as (to, body, sid) tuples.
+    """
+
+    def __init__(self, latency=None, jitter=0.0, failure_rate=None, seed=None):
+        self.latency = settings.FAKE_SMS_LATENCY if latency is None else latency
+        self.failure_rate = settings.FAKE_SMS_FAILURE_RATE if failure_rate is None else failure_rate
+        self.jitter = jitter
+        self.sent = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _roll(self):
+        with self._lock:
+            delay = self.latency + self._random.uniform(-self.jitter, self.jitter)
+            fail = self._random.random() < self.failure_rate
+        return delay, fail
+
+    def _deliver(self, to, body, fail):
+        if fail:
+            raise SMSGatewayError(f"Simulated gateway failure sending to {to}", retryable=True)
+
+        sid = f"SMfake{uuid.uuid4().hex[:26]}"
+        with self._lock:
+            self.sent.append((to, body, sid))
+        return sid
+
+    def send(self, to, body, deadline=None):
+        delay, fail = self._roll()
+        if delay > 0:
+            time.sleep(delay)
+        return self._deliver(to, body, fail)
+
+    async def asend(self, to, body, deadline=None):
+        delay, fail = self._roll()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return self._deliver(to, body, fail)
+
+
+def _is_retryable(exc):
+    return isinstance(exc, SMSGatewayError) and exc.retryable
+
+
+class ResilientGateway(SMSGateway):
+    """
+    Retries retryable errors with jittered exponential backoff inside the
+    caller's deadline, and guards each backend with a circuit breaker. When
+    the primary's breaker is open (or its retries are exhausted) the send
+    goes to the fallback; with no healthy backend it fails fast with
+    CircuitOpenError instead of waiting out timeouts.
+    """
+
+    def __init__(self, primary, fallback=None):
+        self.routes = [(primary, self._breaker("primary"))]
+        if fallback is not None:
+            self.routes.append((fallback, self._breaker("fallback")))
+
+    @staticmethod
+    def _breaker(name):
+        return CircuitBreaker(
+            f"sms-{name}",
+            failure_threshold=settings.SMS_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=settings.SMS_BREAKER_RESET_TIMEOUT,
+        )
+
+    @staticmethod
+    def _timed_send(gateway, to, body, deadline):
+        with time_external("sms", type(gateway).__name__):
+            return gateway.send(to, body, deadline=deadline)
+
+    @staticmethod
+    async def _timed_asend(gateway, to, body, deadline):
+        with time_external("sms", type(gateway).__name__):
+            return await gateway.asend(to, body, deadline=deadline)
+
+    @staticmethod
+    def _retry_options(deadline):
+        return {
+            "max_attempts": settings.SMS_RETRY_MAX_ATTEMPTS,
+            "base_delay": settings.SMS_RETRY_BASE_DELAY,
+            "max_delay": settings.SMS_RETRY_MAX_DELAY,
+            "deadline": deadline,
+        }
+
+    @staticmethod
+    def _record_error(breaker, error):
+        if isinstance(error, SMSGatewayError) and not error.retryable:
+            # The gateway answered; the request itself was bad (e.g. invalid number).
+            breaker.record_success()
+            raise error
+        breaker.record_failure()
+
+    @staticmethod
+    def _give_up(error):
+        if error is not None:
+            raise error
+        raise CircuitOpenError("SMS gateway circuit open; failing fast")
+
+    def send(self, to, body, deadline=None):
+        error = None
+        for gateway, breaker in self.routes:
+            if not breaker.allow():
+                continue
+            try:
+                sid = call_with_retry(
+                    lambda: self._timed_send(gateway, to, body, deadline),
+                    _is_retryable,
+                    **self._retry_options(deadline),
+                )
+            except Exception as e:
+                self._record_error(breaker, e)
+                error = e
+                continue
+            breaker.record_success()
+            return sid
+        self._give_up(error)
+
+    async def asend(self, to, body, deadline=None):
+        error = None
+        for gateway, breaker in self.routes:
+            if not breaker.allow():
+                continue
+            try:
+                sid = await acall_with_retry(
+                    lambda: self._timed_asend(gateway, to, body, deadline),
+                    _is_retryable,
+                    **self._retry_options(deadline),
+                )
+            except Exception as e:
+                self._record_error(breaker, e)
+                error = e
+                continue
+            breaker.record_success()
+            return sid
+        self._give_up(error)
+
+
+def build_gateway():
+    primary = import_string(settings.SMS_GATEWAY_BACKEND)()
+    fallback = None
+    if settings.SMS_GATEWAY_FALLBACK_BACKEND:
+        fallback = import_string(settings.SMS_GATEWAY_FALLBACK_BACKEND)(**settings.SMS_GATEWAY_FALLBACK_OPTIONS)
+    return ResilientGateway(primary, fallback)
+
+
+def get_gateway():
+    """Process-wide gateway (services.providers "sms"); rebuilt after fork so workers never share sockets."""
+    return providers.get("sms")
+
+
+def set_gateway(gateway):
+    """Install `gateway` for this process (tests, benchmarks). Pass None to reset."""
+    providers.override("sms", gateway)
@@ -0,0 +1,143 @@
+"""
+Shared harness for the per-endpoint budget suites (emergency/users/billing tests.py).
+
+Every route an app exposes gets a declared Budget: the most SQL queries and
+wall-clock seconds one request may cost. Requests run against in-process
+fakes (SMS FakeGateway, stubbed Stripe calls, locmem email instead of
+SendGrid), so the numbers only measure our own code.
+
+Wall-clock budgets can be scaled for slow CI machines with
+TIME_BUDGET_SCALE=2 (etc.); QUERY_BUDGET_REPORT=1 prints what every
+measured request actually cost, for tightening budgets.
+"""
+import os
+import time
+from collections import namedtuple
+from types import SimpleNamespace
+from unittest import mock
+
+import stripe
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from services.sms_gateway import FakeGateway, set_gateway
+
+TIME_BUDGET_SCALE = float(os.getenv("TIME_BUDGET_SCALE", "1"))
+QUERY_BUDGET_REPORT = os.getenv("QUERY_BUDGET_REPORT") == "1"
+
+Budget = namedtuple("Budget", ["queries", "seconds"])
+
+
+def fake_stripe_object(**fields):
+    obj = SimpleNamespace(**fields)
+    obj.get = lambda key, default=None: getattr(obj, key, default)
+    return obj
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage",
+    SECURE_SSL_REDIRECT=False,
+    ALLOWED_HOSTS=["testserver"],
+    SMS_STATUS_CALLBACK_VALIDATE=True,
+    TWILIO_AUTH_TOKEN="twilio_test",
+    SMS_GATEWAY_FALLBACK_OPTIONS={},
+    ALERT_DELIVERY_MODE="outbox",
+    STRIPE_WEBHOOK_MODE="queue",
+    STRIPE_WEBHOOK_SECRET="whsec_test",
+)
+class QueryBudgetTestCase(TestCase):
+    """
+    Subclasses set `urlpatterns` (the app's urls.urlpatterns) and `budgets`
+    ({route name: Budget}); `test_every_route_has_a_budget` keeps the two in
+    step, so a new route can't ship without one. Budget keys may carry a
+    ":variant" suffix for routes measured in more than one state.
+
+    Import the module (`from services import testing`) rather than the class,
+    so the test runner doesn't collect this base class on its own.
+    """
+    urlpatterns = []
+    budgets = {}
+
+    def setUp(self):
+        super().setUp()
+        from emergency import page_cache
+        from users.resolver import _local
+
+        cache.clear()
+        _local.clear()
+        page_cache._local.clear()
+        self.gateway = FakeGateway(latency=0, failure_rate=0)
+        set_gateway(self.gateway)
+        self.addCleanup(set_gateway, None)
+        self.stripe_calls = self.fake_stripe()
+        self.client = APIClient()
+
+    def tearDown(self):
+        from emergency.buffers import delivery_status_buffer, late_send_buffer, location_fix_buffer
+
+        # Buffered writes must not leak into the next test's transaction
+        delivery_status_buffer.flush()
+        late_send_buffer.flush()
+        location_fix_buffer.flush()
+        super().tearDown()
+
+    def fake_stripe(self):
+        calls = {
+            "Customer.create": fake_stripe_object(id="cus_test"),
+            "checkout.Session.create": fake_stripe_object(id="cs_test", url="https://checkout.stripe.test/cs_test"),
+            "billing_portal.Session.create": fake_stripe_object(url="https://billing.stripe.test/portal"),
+            "Subscription.retrieve": {"id": "sub_test", "customer": "cus_test", "status": "active", "items": {"data": []}},
+            "UsageRecord.create": {"id": "mbur_test"},
+        }
+        mocks = {}
+        for path, result in calls.items():
+            *owner, attr = path.split(".")
+            target = stripe
+            for name in owner:
+                target = getattr(target, name)
+            patcher = mock.patch.object(target, attr, return_value=result)
+            mocks[path] = patcher.start()
+            self.addCleanup(patcher.stop)
+        return mocks
+
+    def authenticate(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+
+    def assertWithinBudget(self, budget_name, method, path, expected_status=200, **kwargs):
+        """Issue one request and fail if it exceeds `budgets[budget_name]` or returns another status."""
+        budget = self.budgets[budget_name]
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                started = time.perf_counter()
+                response = getattr(self.client, method)(path, **kwargs)
+                elapsed = time.perf_counter() - started
+
+        if QUERY_BUDGET_REPORT:
+            print(f"{budget_name}: {len(queries)}/{budget.queries} queries, {elapsed:.3f}/{budget.seconds:.3f}s")
+        self.assertEqual(
+            response.status_code, expected_status,
+            f"{budget_name}: unexpected status {response.status_code}: {getattr(response, 'content', b'')[:500]!r}",
+        )
+        self.assertLessEqual(
+            len(queries), budget.queries,
+            f"{budget_name}: {len(queries)} queries over a budget of {budget.queries}:\n"
+            + "\n".join(f"  {q['sql']}" for q in queries.captured_queries),
+        )
+        self.assertLessEqual(
+            elapsed, budget.seconds * TIME_BUDGET_SCALE,
+            f"{budget_name}: took {elapsed:.3f}s, budget is {budget.seconds * TIME_BUDGET_SCALE:.3f}s",
+        )
+        return response
+
+    def test_every_route_has_a_budget(self):
+        routes = {pattern.name for pattern in self.urlpatterns}
+        budgeted = {name.split(":", 1)[0] for name in self.budgets}
+        self.assertEqual(routes - budgeted, set(), "Routes without a query budget")
+        self.assertEqual(budgeted - routes, set(), "Budgets for routes that no longer exist")
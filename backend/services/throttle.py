@@ -0,0 +1,132 @@
+"""
+Token buckets for the public (AllowAny) emergency endpoints.
+
+A public request spends one token from each of two buckets for its scope.
+One is keyed by the URL token and one by the client IP, which comes from
+DRF's get_ident, so NUM_PROXIES applies. A rate of "N/period" in
+PUBLIC_THROTTLE_RATES means a bucket of N tokens that refills at N per
+period: bursts of N, and N per period sustained. Each scope has its own
+budget, so a phone streaming GPS fixes can't use up the alert triggers,
+and a scraper polling status checks can't lock out the button.
+
+A bucket is one integer in the shared cache, and it only changes through
+atomic incr/decr, so every worker sees the same decision and none of them
+runs a query. The integer counts the tokens spent since the Unix epoch,
+measured against the tokens accrued since then (rate * now). The bucket
+is full when the two are equal. Spending increments the integer; refill
+is just time passing. Savings above a full bucket are trimmed as they're
+found. Concurrent requests can trim twice, which only makes a bucket
+stricter, never looser.
+
+If the cache can't be reached, requests are let through. An emergency
+must not fail because the rate limiter is down.
+"""
+import logging
+import math
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+_PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# Only used for its get_ident(): DRF's client IP rules (X-Forwarded-For, NUM_PROXIES)
+_ident = BaseThrottle()
+
+
+def parse_rate(rate):
+    """'N/period' (DRF's rate format) -> (bucket size N, tokens refilled per second)."""
+    count, period = rate.split("/")
+    burst = int(count)
+    return burst, burst / _PERIODS[period[0]]
+
+
+def _take(key, burst, per_second, now):
+    """Spend one token from the bucket at `key`: 0 if there was one, else seconds until there is."""
+    accrued = int(per_second * now)
+    try:
+        spent = cache.incr(key)
+    except ValueError:
+        # New (or long idle) bucket: starts full. Kept long enough to outlast any debt in it.
+        cache.add(key, accrued, timeout=math.ceil(2 * burst / per_second) + 1)
+        spent = cache.incr(key)
+
+    if spent <= accrued:
+        # Idle long enough to have saved more than a full bucket: trim back to full
+        cache.incr(key, accrued + 1 - spent)
+        return 0
+    if spent <= accrued + burst:
+        return 0
+
+    # Refused requests spend nothing, and keep a busy bucket from expiring (and refilling) early
+    cache.decr(key)
+    cache.touch(key, math.ceil(2 * burst / per_second) + 1)
+    return (spent - burst) / per_second - now
+
+
+def throttle_wait(scope, request, token=None):
+    """Seconds to wait before `scope` takes another request from this token and IP; 0 to go ahead."""
+    token_rate, ip_rate = settings.PUBLIC_THROTTLE_RATES[scope]
+    buckets = [(f"throttle:{scope}:token:{token}", token_rate), (f"throttle:{scope}:ip:{_ident.get_ident(request)}", ip_rate)]
+    if token is None:
+        buckets = buckets[1:]
+    now = time.time()
+
+    spent = []
+    try:
+        for key, rate in buckets:
+            if rate is None:
+                continue
+            wait = _take(key, *parse_rate(rate), now)
+            if wait:
+                # The request isn't served, so buckets that had let it through get their token back
+                for earlier in spent:
+                    cache.decr(earlier)
+                logger.warning("🚦 Throttled %s request (%s), retry in %.1fs", scope, key.split(":")[2], wait)
+                return wait
+            spent.append(key)
+    except Exception as e:
+        logger.warning("⚠️ Throttle cache unavailable, letting %s request through: %s", scope, e)
+    return 0
+
+
+async def athrottle_wait(scope, request, token=None):
+    return await sync_to_async(throttle_wait)(scope, request, token)
+
+
+def throttled_response(wait):
+    """429 in the same shape DRF gives a throttled request."""
+    seconds = math.ceil(wait)
+    response = JsonResponse({"detail": f"Request was throttled. Expected available in {seconds} seconds."}, status=429)
+    response["Retry-After"] = str(seconds)
+    return response
+
+
+class PublicThrottle(BaseThrottle):
+    """DRF throttle for the public APIViews; the view names its scope in `throttle_scope`."""
+
+    def allow_request(self, request, view):
+        self._wait = throttle_wait(view.throttle_scope, request, view.kwargs.get("token"))
+        return not self._wait
+
+    def wait(self):
+        return self._wait
+
+
+def throttle(scope):
+    """Throttle a plain (sync) Django view that takes an optional `token` URL kwarg."""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            wait = throttle_wait(scope, request, kwargs.get("token"))
+            if wait:
+                return throttled_response(wait)
+            return view(request, *args, **kwargs)
+        return wrapped
+    return decorator
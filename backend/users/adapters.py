@@ -3,6 +3,8 @@ from allauth.account.utils import user_email
 from django.contrib.sites.shortcuts import get_current_site
 from django.urls import reverse
 
+from services.metrics import time_external
+
 
 class CustomAccountAdapter(DefaultAccountAdapter):
     def get_current_site(self, request):
@@ -20,4 +22,8 @@ class CustomAccountAdapter(DefaultAccountAdapter):
                 "current_site": self.get_current_site(request),  # this works now
                 "key": emailconfirmation.key,
             },
-        )
\ No newline at end of file
+        )
+
+    def send_mail(self, template_prefix, email, context):
+        with time_external("email", template_prefix.rsplit("/", 1)[-1]):
+            super().send_mail(template_prefix, email, context)
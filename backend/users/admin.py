@@ -7,7 +7,7 @@ from django import forms
 from django.contrib import messages
 from django.utils.translation import ngettext
 
-from emergency.models import Contact, EmergencyAlert
+from emergency.models import Contact, EmergencyAlert, AlertDelivery
 from .models import Profile
 from billing.models import Subscription
 from users.utils import get_user_plan
@@ -69,7 +69,8 @@ class ProfileAdmin(admin.ModelAdmin):
         "user", "display_plan", "is_subscribed", "is_free_user",
         "alerts_sent", "contacts_notified"
     )
-    list_filter = ("is_subscribed", "is_free_user")
+    list_filter = ("is_subscribed", "is_free_user", "user__entitlement__plan")
+    list_select_related = ("user", "user__entitlement")
     search_fields = ("user__username", "user__email")
     readonly_fields = ["token", "trial_start"]
     actions = ["delete_profiles_and_users"]
@@ -82,9 +83,9 @@ class ProfileAdmin(admin.ModelAdmin):
 
     def display_plan(self, obj):
         try:
-            return get_user_plan(obj.user)
+            return get_user_plan(obj.user)  # served from user__entitlement
         except Exception as e:
-            logger.error(f"Error in display_plan for user {obj.user}: {e}")
+            logger.error("Error in display_plan for user %s: %s", obj.user, e)
             return "—"
     display_plan.short_description = "Plan"
 
@@ -93,9 +94,9 @@ class ProfileAdmin(admin.ModelAdmin):
     alerts_sent.short_description = "Alerts Sent"
 
     def contacts_notified(self, obj):
-        contact_count = Contact.objects.filter(user=obj.user).count()
-        alert_count = EmergencyAlert.objects.filter(user=obj.user, is_test=False).count()
-        return contact_count * alert_count
+        return AlertDelivery.objects.filter(
+            alert__user=obj.user, alert__is_test=False, status__in=["sent", "delivered"]
+        ).count()
     contacts_notified.short_description = "Contacts Notified"
 
     def delete_model(self, request, obj):
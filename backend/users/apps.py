@@ -4,6 +4,5 @@ class UsersConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "users"
 
-
-def ready(self):
-    import users.signals
+    def ready(self):
+        import users.signals
@@ -0,0 +1,100 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.timezone import is_naive, make_aware
+
+TRIAL_DAYS = 3
+PLAN_RANK = {"none": 0, "basic": 1, "premium": 2}
+
+
+def contact_limit_for(plan):
+    return {
+        "premium": settings.MAX_EMERGENCY_CONTACTS,
+        "basic": settings.BASIC_PLAN_CONTACT_LIMIT,
+    }.get(plan, 0)
+
+
+def trial_end(trial_start):
+    if not trial_start:
+        return None
+    if is_naive(trial_start):
+        trial_start = make_aware(trial_start)
+    return trial_start + timedelta(days=TRIAL_DAYS)
+
+
+def compute_entitlement(is_free_user, is_subscribed, profile_plan, trial_start, subscription_plan, now=None):
+    """
+    The single access rule. Every grant the user holds is a candidate; the
+    best plan wins, and between equal plans a non-expiring grant beats the
+    trial. Returns the field values for Entitlement.
+    """
+    now = now or timezone.now()
+    candidates = [("none", "none", None)]
+
+    if subscription_plan in ("basic", "premium"):
+        candidates.append((subscription_plan, "subscription", None))
+    if is_free_user:
+        candidates.append(("premium", "free", None))
+    if is_subscribed:
+        candidates.append((profile_plan if profile_plan in ("basic", "premium") else "premium", "manual", None))
+    expires = trial_end(trial_start)
+    if expires and now < expires:
+        candidates.append(("premium", "trial", expires))
+
+    plan, source, expires_at = max(candidates, key=lambda c: (PLAN_RANK[c[0]], c[2] is None))
+    return {
+        "plan": plan,
+        "source": source,
+        "expires_at": expires_at,
+        "contact_limit": contact_limit_for(plan),
+    }
+
+
+def refresh_entitlement(user, profile=None):
+    """Recompute and store `user`'s entitlement; only writes when something changed."""
+    from billing.models import Subscription
+    from users.models import Entitlement, Profile
+
+    if profile is None:
+        profile = Profile.objects.get(user=user)
+    subscription_plan = (
+        Subscription.objects.filter(user_id=user.pk, status="active")
+        .values_list("plan", flat=True)
+        .first()
+    )
+    values = compute_entitlement(
+        profile.is_free_user,
+        profile.is_subscribed,
+        profile.plan,
+        profile.trial_start,
+        subscription_plan,
+    )
+
+    entitlement = Entitlement.objects.filter(user_id=user.pk).first()
+    if entitlement is None:
+        entitlement = Entitlement.objects.create(user_id=user.pk, **values)
+    elif any(getattr(entitlement, field) != value for field, value in values.items()):
+        for field, value in values.items():
+            setattr(entitlement, field, value)
+        entitlement.save()
+    return entitlement
+
+
+def get_entitlement(user):
+    """
+    Read `user`'s entitlement (one indexed row, or none if select_related /
+    already cached on the user). Missing or lapsed rows are recomputed, so a
+    trial that ended falls back to whatever the user still holds.
+    """
+    from users.models import Entitlement
+
+    try:
+        entitlement = user.entitlement
+    except Entitlement.DoesNotExist:
+        entitlement = None
+
+    if entitlement is None or entitlement.is_expired():
+        entitlement = refresh_entitlement(user)
+        user.entitlement = entitlement
+    return entitlement
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.10 on 2026-10-18 15:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_entitlements(apps, schema_editor):
+    from users.entitlements import compute_entitlement
+
+    Profile = apps.get_model('users', 'Profile')
+    Subscription = apps.get_model('billing', 'Subscription')
+    Entitlement = apps.get_model('users', 'Entitlement')
+
+    active_plans = dict(
+        Subscription.objects.filter(status='active', user__isnull=False).values_list('user_id', 'plan')
+    )
+    rows = [
+        Entitlement(
+            user_id=profile.user_id,
+            **compute_entitlement(
+                profile.is_free_user,
+                profile.is_subscribed,
+                profile.plan,
+                profile.trial_start,
+                active_plans.get(profile.user_id),
+            )
+        )
+        for profile in Profile.objects.all().iterator()
+    ]
+    Entitlement.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_force_create_trial_start_column'),
+        ('billing', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Entitlement',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='entitlement', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('plan', models.CharField(choices=[('none', 'No Plan'), ('basic', 'Basic Plan'), ('premium', 'Premium Plan')], default='none', max_length=10)),
+                ('source', models.CharField(choices=[('none', 'None'), ('subscription', 'Stripe subscription'), ('trial', 'Trial'), ('free', 'Free override'), ('manual', 'Manual plan')], default='none', max_length=12)),
+                ('expires_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('contact_limit', models.PositiveSmallIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_entitlements, migrations.RunPython.noop),
+    ]
@@ -76,23 +76,15 @@ class Profile(models.Model):
     has_used_trial = models.BooleanField(default=False)  # 🔐 avoid re-use
     payment_method_added = models.BooleanField(default=False)  # ✅ Stripe card check
 
+    # Access decisions read the materialized Entitlement (users/entitlements.py)
+
     def get_effective_plan(self):
-        if self.is_free_user or self.is_subscribed:
-            return "premium"
-        return self.plan or "none"
+        from users.entitlements import get_entitlement
+        return get_entitlement(self.user).effective_plan()
 
     def has_premium_access(self):
-        if self.get_effective_plan() == "premium":
-            return True
-
-        if self.trial_start:
-            trial_start = self.trial_start
-            if is_naive(trial_start):
-                trial_start = make_aware(trial_start)
-            if timezone.now() < trial_start + timedelta(days=3):
-                return True
-
-        return False
+        from users.entitlements import get_entitlement
+        return get_entitlement(self.user).has_access()
 
     def is_trial_active(self):
         if not self.trial_start:
@@ -114,6 +106,45 @@ class Profile(models.Model):
 
 
 
+class Entitlement(models.Model):
+    """
+    Materialized access state for one user, recomputed whenever its inputs
+    (Profile, Subscription) change. Readers need one indexed row and a
+    timestamp comparison instead of re-deriving the plan.
+    """
+    SOURCE_CHOICES = [
+        ("none", "None"),
+        ("subscription", "Stripe subscription"),
+        ("trial", "Trial"),
+        ("free", "Free override"),
+        ("manual", "Manual plan"),
+    ]
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='entitlement'
+    )
+    plan = models.CharField(max_length=10, choices=Profile.PLAN_CHOICES, default="none")
+    source = models.CharField(max_length=12, choices=SOURCE_CHOICES, default="none")
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    contact_limit = models.PositiveSmallIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def is_expired(self, now=None):
+        return self.expires_at is not None and (now or timezone.now()) >= self.expires_at
+
+    def effective_plan(self, now=None):
+        return "none" if self.is_expired(now) else self.plan
+
+    def has_access(self, now=None):
+        return self.effective_plan(now) != "none"
+
+    def __str__(self):
+        return f"{self.user_id}: {self.plan} ({self.source})"
+
+
 @receiver(post_save, sender=User)
 def create_or_update_user_profile(sender, instance, created, **kwargs):
     profile, _ = Profile.objects.get_or_create(user=instance)
@@ -0,0 +1,136 @@
+"""
+Public token -> entitlement snapshot.
+
+The public emergency endpoints only know the URL token. Instead of loading
+Profile, User, Entitlement and a contact count on every hit, they call
+`resolve_token()`, which serves an immutable TokenSnapshot from a small
+per-process LRU, then from the shared Django cache, and only then from the DB.
+
+Writes to Profile, User, Subscription and Contact call `invalidate_user()`
+(see users/signals.py). That drops the shared entry and this process's LRU
+entry. Other processes notice within PUBLIC_TOKEN_LOCAL_TTL seconds. A
+snapshot whose entitlement has lapsed (trial over) is rebuilt on read.
+
+Without a shared cache (no REDIS_URL) the "shared" entry is just another
+per-process copy that invalidation can't reach in other workers, so it is
+kept for PUBLIC_TOKEN_LOCAL_TTL as well.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from services.caching import LocalLRU, is_process_local
+
+
+@dataclass(frozen=True)
+class TokenSnapshot:
+    token: str
+    user_id: int
+    username: str
+    display_name: str
+    entitlement_plan: str
+    entitlement_source: str
+    expires_at: Optional[datetime]
+    contact_limit: int
+    contact_count: int
+
+    def is_expired(self, now=None):
+        # Same rule as users.models.Entitlement.is_expired
+        return self.expires_at is not None and (now or timezone.now()) >= self.expires_at
+
+    def get_effective_plan(self, now=None):
+        return "none" if self.is_expired(now) else self.entitlement_plan
+
+    def has_premium_access(self, now=None):
+        return self.get_effective_plan(now) != "none"
+
+    @property
+    def plan(self):
+        return self.get_effective_plan()
+
+
+_local = LocalLRU(settings.PUBLIC_TOKEN_LRU_SIZE, settings.PUBLIC_TOKEN_LOCAL_TTL)
+
+# Cached in place of a snapshot for unknown tokens, so scans stay cheap.
+_MISSING = "missing"
+
+
+def _cache_key(token):
+    return f"users:token-snapshot:v2:{token}"
+
+
+def _shared_ttl():
+    if is_process_local():
+        return settings.PUBLIC_TOKEN_LOCAL_TTL
+    return settings.PUBLIC_TOKEN_CACHE_TTL
+
+
+def build_snapshot(token):
+    from emergency.models import Contact
+    from users.entitlements import get_entitlement
+    from users.models import Profile
+
+    try:
+        profile = Profile.objects.select_related("user", "user__entitlement").get(token=token)
+    except Profile.DoesNotExist:
+        return None
+
+    user = profile.user
+    entitlement = get_entitlement(user)
+
+    return TokenSnapshot(
+        token=str(token),
+        user_id=user.pk,
+        username=user.username,
+        display_name=user.get_full_name() or user.username,
+        entitlement_plan=entitlement.plan,
+        entitlement_source=entitlement.source,
+        expires_at=entitlement.expires_at,
+        contact_limit=entitlement.contact_limit,
+        contact_count=Contact.objects.filter(user_id=user.pk).count(),
+    )
+
+
+def resolve_token(token):
+    """Return the TokenSnapshot for `token`, or None if no profile has it."""
+    key = _cache_key(token)
+
+    snapshot = _local.get(key)
+    if snapshot is None:
+        snapshot = cache.get(key)
+        if snapshot is None or (snapshot != _MISSING and snapshot.is_expired()):
+            snapshot = build_snapshot(token) or _MISSING
+            cache.set(key, snapshot, timeout=_shared_ttl())
+        _local.set(key, snapshot)
+
+    return None if snapshot == _MISSING else snapshot
+
+
+async def aresolve_token(token):
+    """
+    Async resolve_token. A hit in this process's LRU returns without
+    leaving the event loop; anything else resolves in a worker thread.
+    """
+    snapshot = _local.get(_cache_key(token))
+    if snapshot is None:
+        return await sync_to_async(resolve_token)(token)
+    return None if snapshot == _MISSING else snapshot
+
+
+def invalidate_token(token):
+    key = _cache_key(token)
+    _local.delete(key)
+    cache.delete(key)
+
+
+def invalidate_user(user_id):
+    from users.models import Profile
+
+    token = Profile.objects.filter(user_id=user_id).values_list("token", flat=True).first()
+    if token is not None:
+        invalidate_token(token)
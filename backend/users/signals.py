@@ -1,13 +1,47 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from django.contrib.auth import get_user_model
+from .entitlements import refresh_entitlement
 from .models import Profile
+from .resolver import invalidate_token, invalidate_user
 
-User = get_user_model()
+# Profile creation lives in users/models.py (create_or_update_user_profile).
 
-@receiver(post_save, sender=User)
-def create_or_update_user_profile(sender, instance, created, **kwargs):
-    if created:
-        Profile.objects.create(user=instance)
-    else:
-        instance.profile.save()
+# Keep Entitlement rows (users/entitlements.py) in step with their inputs.
+# These run inside the writer's transaction, so plan and source never disagree.
+
+@receiver(post_save, sender=Profile)
+def refresh_profile_entitlement(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_entitlement(instance.user, profile=instance)
+
+
+@receiver(post_save, sender="billing.Subscription")
+@receiver(post_delete, sender="billing.Subscription")
+def refresh_subscription_entitlement(sender, instance, raw=False, **kwargs):
+    if raw or instance.user_id is None:
+        return
+    profile = Profile.objects.select_related("user").filter(user_id=instance.user_id).first()
+    if profile is not None:
+        refresh_entitlement(profile.user, profile=profile)
+
+
+# Keep public token snapshots (users/resolver.py) in step with their sources.
+# Invalidation runs after commit so a concurrent request can't re-cache old rows.
+# User edits are covered too: every User save re-saves its Profile.
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_profile_snapshot(sender, instance, **kwargs):
+    token = instance.token
+    transaction.on_commit(lambda: invalidate_token(token))
+
+
+@receiver(post_save, sender="billing.Subscription")
+@receiver(post_delete, sender="billing.Subscription")
+@receiver(post_save, sender="emergency.Contact")
+@receiver(post_delete, sender="emergency.Contact")
+def invalidate_related_snapshot(sender, instance, **kwargs):
+    user_id = instance.user_id
+    if user_id is not None:
+        transaction.on_commit(lambda: invalidate_user(user_id))
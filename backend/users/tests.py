@@ -0,0 +1,125 @@
+from unittest import mock
+
+from allauth.account.models import EmailAddress
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.core import mail
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from services import testing
+from services.testing import Budget
+from users import urls
+from users.models import Entitlement, User
+from users.resolver import invalidate_token, resolve_token
+
+
+class UsersQueryBudgetTests(testing.QueryBudgetTestCase):
+    urlpatterns = urls.urlpatterns
+    budgets = {
+        "health-check": Budget(queries=0, seconds=0.1),
+        "current_user": Budget(queries=3, seconds=0.3),
+        "user-registration": Budget(queries=23, seconds=1.0),
+        "jwt-login": Budget(queries=3, seconds=0.5),
+        "jwt-refresh": Budget(queries=6, seconds=0.3),
+        "jwt-verify": Budget(queries=1, seconds=0.1),
+        "reset-password": Budget(queries=1, seconds=0.5),
+        "password_reset_confirm": Budget(queries=9, seconds=0.5),
+        "delete-account": Budget(queries=18, seconds=0.5),
+        "request-trial": Budget(queries=6, seconds=0.3),
+        "resend-verification": Budget(queries=3, seconds=0.5),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="bob", email="bob@example.com", password="secret-pw-123")
+        EmailAddress.objects.create(user=cls.user, email=cls.user.email, verified=True, primary=True)
+
+    def test_token_snapshot_ttl(self):
+        token = self.user.profile.token
+        with mock.patch("users.resolver.cache.set") as cache_set:
+            resolve_token(token)
+        # Per-process cache: other workers can't see invalidations, so keep it as short as the LRU
+        self.assertEqual(cache_set.call_args.kwargs["timeout"], settings.PUBLIC_TOKEN_LOCAL_TTL)
+
+        invalidate_token(token)
+        with mock.patch("users.resolver.is_process_local", return_value=False), \
+                mock.patch("users.resolver.cache.set") as cache_set:
+            resolve_token(token)
+        self.assertEqual(cache_set.call_args.kwargs["timeout"], settings.PUBLIC_TOKEN_CACHE_TTL)
+
+    def test_health_check(self):
+        self.assertWithinBudget("health-check", "get", "/api/users/health/")
+
+    def test_current_user(self):
+        self.authenticate(self.user)
+        response = self.assertWithinBudget("current_user", "get", "/api/users/me/")
+        self.assertEqual(response.json()["token"], str(self.user.profile.token))
+
+    def test_registration(self):
+        self.assertWithinBudget(
+            "user-registration", "post", "/api/users/registration/", expected_status=201,
+            data={
+                "username": "carol",
+                "email": "carol@example.com",
+                "password1": "a-Strong-pass-42",
+                "password2": "a-Strong-pass-42",
+            },
+            format="json",
+        )
+        self.assertTrue(Entitlement.objects.filter(user__username="carol").exists())
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_jwt_login(self):
+        response = self.assertWithinBudget(
+            "jwt-login", "post", "/api/users/auth/login/",
+            data={"username": "bob", "password": "secret-pw-123"}, format="json",
+        )
+        self.assertIn("access", response.json())
+
+    def test_jwt_refresh(self):
+        refresh = RefreshToken.for_user(self.user)
+        self.assertWithinBudget("jwt-refresh", "post", "/api/users/auth/refresh/", data={"refresh": str(refresh)}, format="json")
+
+    def test_jwt_verify(self):
+        access = RefreshToken.for_user(self.user).access_token
+        self.assertWithinBudget("jwt-verify", "post", "/api/users/auth/verify/", data={"token": str(access)}, format="json")
+
+    def test_reset_password(self):
+        self.assertWithinBudget("reset-password", "post", "/api/users/reset-password/", data={"email": "bob@example.com"}, format="json")
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_reset_password_confirm(self):
+        self.assertWithinBudget(
+            "password_reset_confirm", "post", "/api/users/reset-password-confirm/",
+            data={
+                "uid": urlsafe_base64_encode(force_bytes(self.user.pk)),
+                "token": default_token_generator.make_token(self.user),
+                "new_password1": "another-pw-456",
+                "new_password2": "another-pw-456",
+            },
+            format="json",
+        )
+
+    def test_delete_account(self):
+        self.authenticate(self.user)
+        self.assertWithinBudget("delete-account", "delete", "/api/users/delete-account/", expected_status=204)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+
+    def test_request_trial(self):
+        profile = self.user.profile
+        profile.payment_method_added = True
+        profile.save()
+
+        self.authenticate(self.user)
+        self.assertWithinBudget("request-trial", "post", "/api/users/trial/request/")
+        self.assertEqual(Entitlement.objects.get(user=self.user).source, "trial")
+
+    def test_resend_verification(self):
+        unverified = User.objects.create_user(username="dave", email="dave@example.com", password="pw")
+        EmailAddress.objects.create(user=unverified, email=unverified.email, verified=False, primary=True)
+        self.assertWithinBudget(
+            "resend-verification", "post", "/api/users/resend-verification/",
+            data={"email": "dave@example.com"}, format="json",
+        )
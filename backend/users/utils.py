@@ -1,28 +1,10 @@
-from datetime import timedelta
-from django.utils import timezone
-from billing.models import Subscription
+from users.entitlements import get_entitlement
 
 
 def get_user_plan(user):
-    profile = user.profile
-
-    # Priority 1: Real Stripe subscription
-    subscription = Subscription.objects.filter(user=user, status="active").first()
-    if subscription and subscription.plan in ["basic", "premium"]:
-        return subscription.plan
-
-    # Priority 2: Trial (fixed 3-day period)
-    if profile.trial_start:
-        trial_end = profile.trial_start + timedelta(days=3)
-        if timezone.now() < trial_end:
-            return "premium"
-
-    # Priority 3: Free override
-    if profile.is_free_user:
-        return "premium"
-
-    # Priority 4: Old manual plan fallback
-    if profile.is_subscribed and profile.plan in ["basic", "premium"]:
-        return profile.plan
-
-    return "none"
+    """
+    Current plan for `user`. Priorities (Stripe subscription, trial, free
+    override, manual plan) are applied once at write time; see
+    users.entitlements.compute_entitlement.
+    """
+    return get_entitlement(user).effective_plan()
@@ -1,4 +1,6 @@
 # Django core imports
+import logging
+
 from django.http import JsonResponse
 from django.views.decorators.http import require_GET
 from django.utils.decorators import method_decorator
@@ -33,6 +35,7 @@ from users.serializers import CustomTokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 
 # 🌡️ Health check
@@ -69,24 +72,24 @@ def current_user(request):
 def request_trial(request):
     profile = request.user.profile
 
-    print("🧪 Trial debug:")
-    print("has_used_trial:", profile.has_used_trial)
-    print("payment_method_added:", profile.payment_method_added)
-    print("trial_start:", profile.trial_start)
+    logger.debug(
+        "🧪 Trial request for user %s: has_used_trial=%s payment_method_added=%s trial_start=%s",
+        request.user.pk, profile.has_used_trial, profile.payment_method_added, profile.trial_start,
+    )
 
     # Já usou trial?
     if profile.has_used_trial:
-        print("🛑 Blocked: already used trial")
+        logger.info("🛑 Trial blocked for user %s: already used", request.user.pk)
         return Response({"error": "Já usaste o período experimental."}, status=400)
 
     # Não adicionou cartão?
     if not profile.payment_method_added:
-        print("🛑 Blocked: payment method not added")
+        logger.info("🛑 Trial blocked for user %s: no payment method", request.user.pk)
         return Response({"error": "Método de pagamento necessário."}, status=400)
 
     # Ativar o trial
     profile.start_trial()
-    print("✅ Trial started")
+    logger.info("✅ Trial started for user %s", request.user.pk)
     return Response({"success": "Período experimental ativado com sucesso!"})
 
 
@@ -193,18 +196,16 @@ class CustomResendEmailVerificationView(APIView):
 
     def post(self, request):
         email = request.data.get("email")
-        print("📩 Resend email requested:", email)
 
         if not email:
             return Response({"detail": "Email is required."}, status=status.HTTP_400_BAD_REQUEST)
 
         email_address = EmailAddress.objects.filter(email__iexact=email).first()
-        print("📩 EmailAddress found:", email_address)
 
         if email_address and not email_address.verified:
             send_email_confirmation(request, email_address.user, signup=False)
-            print("✅ Verification email sent.")
+            logger.info("📩 Verification email resent to user %s", email_address.user_id)
             return Response({"detail": "Verification email sent."}, status=status.HTTP_200_OK)
 
-        print("⚠️ Email not found or already verified.")
+        logger.info("⚠️ Verification resend skipped: address unknown or already verified")
         return Response({"detail": "Email not found or already verified."}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
@@ -11,6 +11,7 @@ import dj_database_url
 from dotenv import load_dotenv
 from datetime import timedelta
 from django.utils.translation import gettext_lazy as _
+from corsheaders.defaults import default_headers
 
 # Load environment variables
 load_dotenv()
@@ -56,6 +57,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "middleware.MetricsMiddleware.MetricsMiddleware",  # first, so it times everything below
+    "middleware.RequestIdMiddleware.RequestIdMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -70,6 +73,12 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = "config.urls"
 WSGI_APPLICATION = "config.wsgi.application"
+ASGI_APPLICATION = "config.asgi.application"
+
+# "wsgi" (gunicorn sync workers) or "asgi" (gunicorn + uvicorn workers), see gunicorn.conf.py.
+# Under ASGI the public alert endpoints are served by their async views.
+SERVER_MODE = os.getenv("SERVER_MODE", "wsgi")
+ASYNC_ALERT_VIEWS = os.getenv("ASYNC_ALERT_VIEWS", "1" if SERVER_MODE == "asgi" else "0") == "1"
 
 # ======================
 # DATABASE SETTINGS
@@ -82,7 +91,8 @@ if not database_url:
 DATABASES = {
     'default': dj_database_url.parse(
         database_url,
-        conn_max_age=600,
+        # Persistent connections don't work under ASGI (sync ORM calls run in per-request threads)
+        conn_max_age=0 if SERVER_MODE == "asgi" else 600,
         ssl_require=True
     )
 }
@@ -215,7 +225,8 @@ else:
     CORS_ALLOWED_ORIGINS = PROD_ORIGINS
     CSRF_TRUSTED_ORIGINS = PROD_ORIGINS
 
-CORS_EXPOSE_HEADERS = ["Content-Type", "X-CSRFToken"]
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key")
+CORS_EXPOSE_HEADERS = ["Content-Type", "X-CSRFToken", "ETag", "Idempotent-Replayed", "Retry-After"]
 CORS_ALLOW_CREDENTIALS = True
 
 # ======================
@@ -270,6 +281,27 @@ ACCOUNT_LOGIN_ON_EMAIL_CONFIRMATION = True
 ACCOUNT_LOGIN_ON_SIGNUP = False
 ACCOUNT_LOGOUT_ON_PASSWORD_CHANGE = True
 
+# ======================
+# CACHE
+# ======================
+
+# Shared across gunicorn workers when REDIS_URL is set; per-process otherwise, which
+# only suits development (see services/caching.py and `manage.py check --deploy`).
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+
+# ======================
+# METRICS
+# ======================
+
+# /metrics requires "Authorization: Bearer <token>"; without a token it is only served with DEBUG on.
+METRICS_AUTH_TOKEN = os.getenv("METRICS_AUTH_TOKEN", "")
+
 # ======================
 # DEBUG TOOLBAR (Development only)
 # ======================
@@ -292,12 +324,29 @@ if DEBUG:
 # LOGGING CONFIGURATION
 # ======================
 
+# Records are queued and written by a background thread (services/log.py).
+# LOG_FORMAT=json for log shippers, "plain" for reading in a terminal.
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Continuous GPS updates arrive every few seconds per alert; log one in N
+LOCATION_LOG_SAMPLE_RATE = int(os.getenv("LOCATION_LOG_SAMPLE_RATE", "20"))
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
+    "formatters": {
+        "json": {
+            "()": "services.log.JSONFormatter",
+        },
+        "plain": {
+            "format": "%(asctime)s %(levelname)s %(name)s [%(request_id)s %(alert_id)s] %(message)s",
+        },
+    },
     "handlers": {
         "console": {
-            "class": "logging.StreamHandler",
+            "()": "services.log.QueueLogHandler",
+            "maxsize": LOG_QUEUE_SIZE,
+            "formatter": LOG_FORMAT,
         },
     },
     "root": {
@@ -318,6 +367,100 @@ LOGGING = {
 # ======================
 
 MAX_EMERGENCY_CONTACTS = 7
+BASIC_PLAN_CONTACT_LIMIT = 3
+
+# Public token -> entitlement snapshot cache (see users/resolver.py)
+PUBLIC_TOKEN_CACHE_TTL = int(os.getenv("PUBLIC_TOKEN_CACHE_TTL", "600"))
+PUBLIC_TOKEN_LOCAL_TTL = float(os.getenv("PUBLIC_TOKEN_LOCAL_TTL", "5"))
+PUBLIC_TOKEN_LRU_SIZE = int(os.getenv("PUBLIC_TOKEN_LRU_SIZE", "2048"))
+# Browser / CDN lifetimes (seconds) of the public status check and PWA manifest; both also revalidate by ETag
+PUBLIC_STATUS_MAX_AGE = int(os.getenv("PUBLIC_STATUS_MAX_AGE", "30"))
+MANIFEST_MAX_AGE = int(os.getenv("MANIFEST_MAX_AGE", "86400"))
+# Repeat alert triggers (see emergency/idempotency.py): a user's repeat within ALERT_DEBOUNCE_SECONDS,
+# or a retry reusing an Idempotency-Key within ALERT_IDEMPOTENCY_TTL, gets the first response back
+ALERT_DEBOUNCE_SECONDS = int(os.getenv("ALERT_DEBOUNCE_SECONDS", "30"))
+ALERT_IDEMPOTENCY_TTL = int(os.getenv("ALERT_IDEMPOTENCY_TTL", "86400"))
+# Lifetime of the "in flight" marker before the response is stored: about a request's worst case
+# (gunicorn's 30s timeout plus the SMS fan-out), so a worker killed mid-alert doesn't block retries for a day
+ALERT_CLAIM_TTL = int(os.getenv("ALERT_CLAIM_TTL", "60"))
+# Token buckets for the public endpoints (see services/throttle.py): (per URL token, per client IP).
+# "N/period" allows bursts of N refilled at N per period; None turns that bucket off.
+PUBLIC_THROTTLE_RATES = {
+    # Real alerts (each one sends paid SMS). Never limited per IP: people in danger can share
+    # a NAT, a shelter's Wi-Fi or a carrier gateway with whoever used up that bucket.
+    "alert": (os.getenv("THROTTLE_ALERT_TOKEN", "10/hour"), None),
+    # Test triggers from the test page (no SMS)
+    "test": (os.getenv("THROTTLE_TEST_TOKEN", "10/hour"), os.getenv("THROTTLE_TEST_IP", "30/hour")),
+    # Continuous GPS ticks and batched track uploads
+    "location": (os.getenv("THROTTLE_LOCATION_TOKEN", "120/min"), os.getenv("THROTTLE_LOCATION_IP", "600/min")),
+    "status": (os.getenv("THROTTLE_STATUS_TOKEN", "30/min"), os.getenv("THROTTLE_STATUS_IP", "120/min")),
+    # Alert/test pages and the PWA manifest
+    "page": (os.getenv("THROTTLE_PAGE_TOKEN", "60/min"), os.getenv("THROTTLE_PAGE_IP", "300/min")),
+}
+# Rendered public alert/test pages (see emergency/page_cache.py)
+PUBLIC_PAGE_CACHE_TTL = int(os.getenv("PUBLIC_PAGE_CACHE_TTL", "3600"))
+PUBLIC_PAGE_LRU_SIZE = int(os.getenv("PUBLIC_PAGE_LRU_SIZE", "1024"))
+
+# Concurrent SMS fan-out (see emergency/dispatch.py)
+ALERT_DISPATCH_MAX_WORKERS = int(os.getenv("ALERT_DISPATCH_MAX_WORKERS", "8"))
+ALERT_DISPATCH_DEADLINE = float(os.getenv("ALERT_DISPATCH_DEADLINE", "10"))
+
+# Twilio credentials, shared by TwilioGateway and the status callback signature check
+TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID", "")
+TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN", "")
+TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER", "")
+
+# SMS gateway (see services/sms_gateway.py)
+# Use "services.sms_gateway.FakeGateway" to benchmark or test without the network.
+SMS_GATEWAY_BACKEND = os.getenv("SMS_GATEWAY_BACKEND", "services.sms_gateway.TwilioGateway")
+SMS_GATEWAY_TIMEOUT = float(os.getenv("SMS_GATEWAY_TIMEOUT", "5"))
+SMS_RETRY_MAX_ATTEMPTS = int(os.getenv("SMS_RETRY_MAX_ATTEMPTS", "3"))
+SMS_RETRY_BASE_DELAY = float(os.getenv("SMS_RETRY_BASE_DELAY", "0.25"))
+SMS_RETRY_MAX_DELAY = float(os.getenv("SMS_RETRY_MAX_DELAY", "2"))
+SMS_BREAKER_FAILURE_THRESHOLD = int(os.getenv("SMS_BREAKER_FAILURE_THRESHOLD", "5"))
+SMS_BREAKER_RESET_TIMEOUT = float(os.getenv("SMS_BREAKER_RESET_TIMEOUT", "30"))
+# Optional secondary gateway used while the primary's breaker is open
+SMS_GATEWAY_FALLBACK_BACKEND = os.getenv("SMS_GATEWAY_FALLBACK_BACKEND", "")
+SMS_GATEWAY_FALLBACK_OPTIONS = {
+    key: value for key, value in {
+        "account_sid": os.getenv("TWILIO_FALLBACK_ACCOUNT_SID"),
+        "auth_token": os.getenv("TWILIO_FALLBACK_AUTH_TOKEN"),
+        "from_number": os.getenv("TWILIO_FALLBACK_PHONE_NUMBER"),
+    }.items() if value
+}
+FAKE_SMS_LATENCY = float(os.getenv("FAKE_SMS_LATENCY", "0.2"))
+FAKE_SMS_FAILURE_RATE = float(os.getenv("FAKE_SMS_FAILURE_RATE", "0"))
+
+# Twilio delivery status callbacks (e.g. https://api.resqsignal.com/api/emergency/sms/status/)
+SMS_STATUS_CALLBACK_URL = os.getenv("SMS_STATUS_CALLBACK_URL", "")
+SMS_STATUS_CALLBACK_VALIDATE = os.getenv("SMS_STATUS_CALLBACK_VALIDATE", "1") == "1"
+SMS_STATUS_FLUSH_SIZE = int(os.getenv("SMS_STATUS_FLUSH_SIZE", "200"))
+SMS_STATUS_FLUSH_INTERVAL = float(os.getenv("SMS_STATUS_FLUSH_INTERVAL", "2"))
+
+# Continuous GPS tracking (see emergency/tracking.py)
+ALERT_TRACKING_WINDOW = int(os.getenv("ALERT_TRACKING_WINDOW", "7200"))  # seconds an alert accepts fixes
+LOCATION_FLUSH_SIZE = int(os.getenv("LOCATION_FLUSH_SIZE", "100"))
+LOCATION_FLUSH_INTERVAL = float(os.getenv("LOCATION_FLUSH_INTERVAL", "5"))
+TRACK_UPLOAD_MAX_FIXES = int(os.getenv("TRACK_UPLOAD_MAX_FIXES", "500"))
+
+# Alert / track exports (see emergency/exports.py)
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "2000"))  # rows fetched per server-side cursor round trip
+
+# Bulk contact import (see emergency/contact_import.py)
+CONTACT_IMPORT_MAX_ROWS = int(os.getenv("CONTACT_IMPORT_MAX_ROWS", "1000"))
+CONTACT_IMPORT_DEFAULT_REGION = os.getenv("CONTACT_IMPORT_DEFAULT_REGION", "PT")  # for numbers without +country
+
+# Alert delivery outbox (see emergency/outbox.py)
+# "inline": the trigger sends (after its commit) before responding; no worker process needed.
+# "outbox": the trigger returns on commit and `manage.py run_delivery_worker` sends. Only switch
+# to it where that worker runs (see README, "Deployment"): without it alerts are never sent.
+ALERT_DELIVERY_MODE = os.getenv("ALERT_DELIVERY_MODE", "inline")
+ALERT_DELIVERY_BATCH_SIZE = int(os.getenv("ALERT_DELIVERY_BATCH_SIZE", "50"))
+ALERT_DELIVERY_MAX_ATTEMPTS = int(os.getenv("ALERT_DELIVERY_MAX_ATTEMPTS", "5"))
+ALERT_DELIVERY_RETRY_DELAY = float(os.getenv("ALERT_DELIVERY_RETRY_DELAY", "5"))
+ALERT_DELIVERY_POLL_INTERVAL = float(os.getenv("ALERT_DELIVERY_POLL_INTERVAL", "0.5"))
+# Seconds a claimed job is leased to its sender; a job still "sending" after that is claimed again
+ALERT_DELIVERY_LEASE = float(os.getenv("ALERT_DELIVERY_LEASE", "60"))
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
@@ -371,3 +514,16 @@ STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 STRIPE_BASIC_PRICE_ID = os.getenv("STRIPE_BASIC_PRICE_ID")
 STRIPE_PREMIUM_PRICE_ID = os.getenv("STRIPE_PREMIUM_PRICE_ID")
 
+# Webhooks are stored, then "inline" handles them before replying; "queue" only acknowledges
+# and leaves handling to `manage.py process_stripe_events`, which must then be running.
+STRIPE_WEBHOOK_MODE = os.getenv("STRIPE_WEBHOOK_MODE", "inline")
+STRIPE_EVENT_BATCH_SIZE = int(os.getenv("STRIPE_EVENT_BATCH_SIZE", "50"))
+STRIPE_EVENT_MAX_ATTEMPTS = int(os.getenv("STRIPE_EVENT_MAX_ATTEMPTS", "5"))
+STRIPE_EVENT_POLL_INTERVAL = float(os.getenv("STRIPE_EVENT_POLL_INTERVAL", "2"))
+
+# "inline" reports SMS usage to Stripe right after each delivery commits; "batch" leaves it to
+# `manage.py flush_stripe_usage`, which rolls many alerts into one call per interval.
+STRIPE_USAGE_MODE = os.getenv("STRIPE_USAGE_MODE", "inline")
+# Seconds between aggregated usage reports (manage.py flush_stripe_usage)
+STRIPE_USAGE_FLUSH_INTERVAL = float(os.getenv("STRIPE_USAGE_FLUSH_INTERVAL", "300"))
+
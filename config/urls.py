@@ -16,6 +16,7 @@ from rest_framework_simplejwt.views import (
 )
 from django.conf import settings
 from emergency.views.alert_views import dynamic_manifest
+from services.metrics import metrics_view
 
 
 urlpatterns = [
@@ -45,6 +46,9 @@ urlpatterns = [
     path("api/emergency/public/<uuid:token>/", TriggerPublicAlertView.as_view(), name="public-alert-api"),
     re_path(r'^sw\.js$', static_serve, {'path': 'sw.js', 'document_root': settings.STATIC_ROOT}),
     path("manifest/<uuid:token>.json", dynamic_manifest, name="dynamic-manifest"),
+
+    # Prometheus scrape endpoint (see services/metrics.py)
+    path("metrics", metrics_view, name="metrics"),
 ]
 
 # Optional deduplication
@@ -1,6 +1,9 @@
 #!/bin/bash
 set -e
 
+echo "🔎 Checking deployment settings..."
+python manage.py check --deploy --fail-level ERROR || (echo "❌ Deployment check failed" && exit 1)
+
 echo "📦 Applying database migrations..."
 python manage.py migrate --noinput || (echo "❌ Migration failed" && exit 1)
 
@@ -10,5 +13,11 @@ python manage.py collectstatic --noinput
 echo "⏳ Waiting a few seconds before starting server..."
 sleep 3
 
-echo "🚀 Starting Django app..."
-exec gunicorn config.wsgi:application --bind 0.0.0.0:8000
+echo "📈 Preparing metrics directory..."
+# Each gunicorn worker writes its samples here; /metrics merges them (services/metrics.py).
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+echo "🚀 Starting Django app (${SERVER_MODE:-wsgi})..."
+# gunicorn.conf.py picks config.wsgi or config.asgi from SERVER_MODE
+exec gunicorn
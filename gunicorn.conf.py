@@ -0,0 +1,21 @@
+# Loaded automatically by gunicorn from the working directory.
+import os
+
+bind = "0.0.0.0:8000"
+
+# SERVER_MODE=asgi serves config.asgi with uvicorn workers: the async alert
+# views (emergency/views/async_views.py) keep many alerts in flight per worker.
+if os.getenv("SERVER_MODE", "wsgi") == "asgi":
+    wsgi_app = "config.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "config.wsgi:application"
+
+
+def child_exit(server, worker):
+    # Drop a dead worker's live samples from the merged /metrics view
+    # (services/metrics.py); its counters and histograms are kept.
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,92 @@
+import contextvars
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+from services.metrics import REQUESTS, REQUEST_DB_QUERIES, REQUEST_DB_TIME, REQUEST_LATENCY
+
+KNOWN_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+
+class _QueryTimer:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+# The timer of the request being handled. A contextvar follows the request
+# into sync_to_async threads, so queries issued by async views count too.
+_current_timer = contextvars.ContextVar("request_query_timer", default=None)
+
+
+def _time_query(execute, sql, params, many, context):
+    timer = _current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.count += 1
+        timer.seconds += time.perf_counter() - started
+
+
+def _install(connection, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+connection_created.connect(_install)
+
+
+class MetricsMiddleware:
+    """
+    Records count, latency, SQL query count and SQL time for every request,
+    labelled by the resolved URL name (never the raw path, so tokens and ids
+    don't explode the label set). Keep it first in MIDDLEWARE.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Connections opened before this module was imported missed the signal.
+        _install(connection)
+        timer = _QueryTimer()
+        token = _current_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_timer.reset(token)
+        self.record(request, response, time.perf_counter() - started, timer)
+        return response
+
+    async def __acall__(self, request):
+        timer = _QueryTimer()
+        token = _current_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_timer.reset(token)
+        self.record(request, response, time.perf_counter() - started, timer)
+        return response
+
+    @staticmethod
+    def record(request, response, elapsed, queries):
+        match = getattr(request, "resolver_match", None)
+        route = (match.view_name if match else None) or "unmatched"
+        method = request.method if request.method in KNOWN_METHODS else "other"
+        REQUESTS.labels(route, method, str(response.status_code)).inc()
+        REQUEST_LATENCY.labels(route, method).observe(elapsed)
+        REQUEST_DB_QUERIES.labels(route).observe(queries.count)
+        REQUEST_DB_TIME.labels(route).observe(queries.seconds)
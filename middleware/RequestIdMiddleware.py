@@ -0,0 +1,46 @@
+import re
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from services.log import alert_id_var, request_id_var
+
+# Accept an upstream id (load balancer / client) only if it is short and boring
+_VALID_ID = re.compile(r"^[A-Za-z0-9._-]{8,64}$")
+
+
+class RequestIdMiddleware:
+    """
+    Gives every request an id (the incoming X-Request-ID, or a fresh one),
+    echoes it in the response and binds it to the log context so every
+    record emitted while handling the request carries it.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self.bind(request)
+        response = self.get_response(request)
+        response["X-Request-ID"] = request.request_id
+        return response
+
+    async def __acall__(self, request):
+        self.bind(request)
+        response = await self.get_response(request)
+        response["X-Request-ID"] = request.request_id
+        return response
+
+    @staticmethod
+    def bind(request):
+        incoming = request.META.get("HTTP_X_REQUEST_ID", "")
+        request.request_id = incoming if _VALID_ID.match(incoming) else uuid.uuid4().hex
+        # Not reset on the way out: django.request logs 4xx/5xx after the middleware chain returns.
+        request_id_var.set(request.request_id)
+        alert_id_var.set(None)
@@ -1,3 +1,215 @@
 // static/sw.js
+//
+// Offline-first shell for the installed emergency button (/public/<token>/):
+// - The alert page tells us which URLs make up its shell (page, manifest, icons)
+//   and we precache them. Later launches are served cache-first, so the button
+//   is live with no network, and refreshed in the background for the next launch.
+// - Alert POSTs that fail for lack of network are stored in IndexedDB and
+//   replayed by Background Sync (or on the page's next `online` event where
+//   Background Sync isn't available) once connectivity returns. One the server
+//   throttles (429) or is still sending (409) stays queued until its Retry-After.
+
+// Bump when this worker or the shell's caching rules change; old caches are dropped on activate.
+const VERSION = 'v3';
+const SHELL_CACHE = `resq-shell-${VERSION}`;
+const SYNC_TAG = 'resq-alert-queue';
+const DB_NAME = 'resq-sw';
+const STORE = 'alerts';
+
+// Alert page and alert API: /public/<token>/ and /api/emergency/public/<token>/
+const UUID = '[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}';
+const SHELL_PAGE = new RegExp(`^/public/${UUID}/$`, 'i');
+const ALERT_API = new RegExp(`^/api/emergency/public/${UUID}/$`, 'i');
+const SHELL_ASSET = /^\/(manifest|static)\//;
+
 self.addEventListener('install', () => self.skipWaiting());
-self.addEventListener('activate', (e) => e.waitUntil(self.clients.claim()));
+
+self.addEventListener('activate', (event) => {
+  event.waitUntil((async () => {
+    const names = await caches.keys();
+    await Promise.all(
+      names.filter((name) => name.startsWith('resq-shell-') && name !== SHELL_CACHE).map((name) => caches.delete(name))
+    );
+    await self.clients.claim();
+  })());
+});
+
+// ---------- Shell precache ----------
+
+// Only the real alert page carries X-Alert-Shell; a subscription or 404 page must never be cached as the shell
+function isShell(response) {
+  return response.ok && response.headers.has('X-Alert-Shell');
+}
+
+async function refresh(cache, url) {
+  const response = await fetch(url, { credentials: 'include', cache: 'no-cache' });
+  if (SHELL_PAGE.test(new URL(url, self.location.origin).pathname)) {
+    if (isShell(response)) {
+      await cache.put(url, response.clone());
+    } else if (response.status < 500) {
+      // Plan lapsed or token gone: stop serving the old button
+      await cache.delete(url);
+    }
+  } else if (response.ok) {
+    await cache.put(url, response.clone());
+  }
+  return response;
+}
+
+async function precache(urls) {
+  const cache = await caches.open(SHELL_CACHE);
+  await Promise.all(urls.map((url) => refresh(cache, url).catch((err) => console.warn('SW precache failed:', url, err))));
+}
+
+async function shellFirst(event) {
+  const cache = await caches.open(SHELL_CACHE);
+  const cached = await cache.match(event.request, { ignoreSearch: true });
+  const network = refresh(cache, event.request.url);
+  if (cached) {
+    event.waitUntil(network.catch(() => {}));
+    return cached;
+  }
+  return network;
+}
+
+// ---------- Alert queue (IndexedDB) ----------
+
+function openDb() {
+  return new Promise((resolve, reject) => {
+    const request = indexedDB.open(DB_NAME, 1);
+    request.onupgradeneeded = () => request.result.createObjectStore(STORE, { keyPath: 'id', autoIncrement: true });
+    request.onsuccess = () => resolve(request.result);
+    request.onerror = () => reject(request.error);
+  });
+}
+
+async function withStore(mode, fn) {
+  const db = await openDb();
+  return new Promise((resolve, reject) => {
+    const tx = db.transaction(STORE, mode);
+    const result = fn(tx.objectStore(STORE));
+    tx.oncomplete = () => resolve(result.result);
+    tx.onerror = () => reject(tx.error);
+  });
+}
+
+async function queueAlert(request) {
+  const headers = {};
+  request.headers.forEach((value, name) => { headers[name] = value; });
+  // Every replay of this alert carries the same key, so the server can tell a retry from a new alert
+  headers['idempotency-key'] = headers['idempotency-key'] || self.crypto.randomUUID();
+  const body = await request.text();
+  await withStore('readwrite', (store) => store.add({ url: request.url, headers, body, queuedAt: Date.now() }));
+  if (self.registration.sync) {
+    await self.registration.sync.register(SYNC_TAG);
+  }
+}
+
+async function notifyClients(message) {
+  const clients = await self.clients.matchAll({ includeUncontrolled: true, type: 'window' });
+  clients.forEach((client) => client.postMessage(message));
+}
+
+let replaying = null;
+
+// Milliseconds the server asked us to wait (Retry-After in seconds or as a date); 1s if it didn't say
+function retryAfterMs(response) {
+  const value = response.headers.get('Retry-After');
+  const seconds = Number(value);
+  if (value && Number.isFinite(seconds)) return seconds * 1000;
+  const date = Date.parse(value);
+  return Number.isNaN(date) ? 1000 : Math.max(0, date - Date.now());
+}
+
+async function replayAlerts() {
+  const queued = await withStore('readonly', (store) => store.getAll());
+  let retryAt = Infinity;
+  for (const item of queued) {
+    if (item.retryAt > Date.now()) {
+      retryAt = Math.min(retryAt, item.retryAt);
+      continue;
+    }
+    // A network error throws here and leaves the rest queued for the next sync
+    const response = await fetch(item.url, {
+      method: 'POST',
+      headers: item.headers,
+      body: item.body,
+      credentials: 'include',
+    });
+    if (response.status >= 500) {
+      throw new Error(`Alert replay failed (${response.status})`);
+    }
+    if (response.status === 429 || response.status === 409) {
+      // Throttled, or this same alert is still being sent: keep it until the server says to retry
+      item.retryAt = Date.now() + retryAfterMs(response);
+      await withStore('readwrite', (store) => store.put(item));
+      retryAt = Math.min(retryAt, item.retryAt);
+      continue;
+    }
+    // Delivered, or rejected for good (other 4xx): either way it leaves the queue
+    await withStore('readwrite', (store) => store.delete(item.id));
+    const data = await response.json().catch(() => ({}));
+    await notifyClients({ type: 'alert-replayed', ok: response.ok, queuedAt: item.queuedAt, data });
+    console.log(`📤 Replayed queued alert from ${new Date(item.queuedAt).toISOString()} (${response.status})`);
+  }
+  if (retryAt !== Infinity) {
+    // Open pages schedule the next replay; failing the sync makes the browser retry it too
+    await notifyClients({ type: 'alert-deferred', retryAt });
+    throw new Error(`Queued alert deferred until ${new Date(retryAt).toISOString()}`);
+  }
+}
+
+function replayOnce() {
+  // sync and `online` can fire together; never send the same queued alert twice in parallel
+  if (!replaying) {
+    replaying = replayAlerts().finally(() => { replaying = null; });
+  }
+  return replaying;
+}
+
+async function sendOrQueue(event) {
+  const copy = event.request.clone();
+  try {
+    return await fetch(event.request);
+  } catch (err) {
+    await queueAlert(copy);
+    console.warn('📴 Offline, alert queued for background sync');
+    return new Response(JSON.stringify({ status: 'alert queued', queued: true }), {
+      status: 202,
+      headers: { 'Content-Type': 'application/json' },
+    });
+  }
+}
+
+// ---------- Events ----------
+
+self.addEventListener('fetch', (event) => {
+  const url = new URL(event.request.url);
+  if (url.origin !== self.location.origin) return;
+
+  if (event.request.method === 'POST' && ALERT_API.test(url.pathname)) {
+    event.respondWith(sendOrQueue(event));
+  } else if (event.request.method === 'GET' && SHELL_PAGE.test(url.pathname)) {
+    event.respondWith(shellFirst(event));
+  } else if (event.request.method === 'GET' && SHELL_ASSET.test(url.pathname)) {
+    // Manifest and icons the page asked us to precache
+    event.respondWith(caches.open(SHELL_CACHE)
+      .then((cache) => cache.match(event.request))
+      .then((cached) => cached || fetch(event.request)));
+  }
+});
+
+self.addEventListener('sync', (event) => {
+  if (event.tag === SYNC_TAG) {
+    event.waitUntil(replayOnce());
+  }
+});
+
+self.addEventListener('message', (event) => {
+  const message = event.data || {};
+  if (message.type === 'precache' && Array.isArray(message.urls)) {
+    event.waitUntil(precache(message.urls));
+  } else if (message.type === 'replay') {
+    event.waitUntil(replayOnce().catch((err) => console.warn('Alert replay postponed:', err)));
+  }
+});